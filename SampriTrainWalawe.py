@@ -1,22 +1,181 @@
+import argparse
+import codecs
 import csv
+import glob
+import hashlib
 import os
 import subprocess
 import sys
 import platform
 import json
+import math
+import queue
+import random
+import re
 import time
 import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-def run_command(command, timeout=900, show_progress=False):
+from answer_fidelity import DEFAULT_PASS_THRESHOLD, sample_evaluation_set, score_answer, summarize_scores
+from chat_session import SessionManager
+from command_output import OutputRingBuffer, TransferStats, format_bytes, parse_progress_line, strip_ansi
+import gateway
+from knowledge_index import (
+    INDEX_VERSION, KnowledgeIndex, document_fingerprint, format_knowledge_context, normalize_text,
+    write_knowledge_index,
+)
+from ollama_client import OllamaClient, OllamaError, model_name_matches
+from pipeline_tracing import PipelineTracer
+from response_cache import ResponseCache
+
+# Indeks retrieval disimpan di samping Modelfile dan dimuat dengan mmap saat model dipakai
+KNOWLEDGE_INDEX_FILE = "KnowledgeIndex_UMM_Assistant_Demo.idx"
+RETRIEVAL_TOP_K = 5
+
+# Manifest build: mencatat hash input setiap artefak agar build yang tidak berubah bisa dilewati
+BUILD_MANIFEST_FILE = "BuildManifest_UMM_Assistant_Demo.json"
+BASE_MODEL_NAME = "UMM-Assistant-Demo"
+
+# Akuntansi token & anggaran konteks (arsitektur Llama 3.2 3B)
+TOKEN_CALIBRATION_FILE = "TokenCalibration_UMM_Assistant_Demo.json"
+DEFAULT_TOKEN_ESTIMATE_SCALE = 1.15  # Dikoreksi oleh --calibrate-tokens dari prompt_eval_count Ollama
+MODEL_ARCHITECTURE = {"parameters": 3.21e9, "layers": 28, "kv_heads": 8, "head_dim": 128, "max_context": 131072}
+QUANTIZATION_BITS_PER_WEIGHT = {"q4_0": 4.5, "q4_k_m": 4.85, "q5_k_m": 5.69, "q8_0": 8.5, "f16": 16.0}
+KV_CACHE_BYTES_PER_TOKEN = 2 * MODEL_ARCHITECTURE["layers"] * MODEL_ARCHITECTURE["kv_heads"] * MODEL_ARCHITECTURE["head_dim"] * 2
+CONTEXT_SIZE_CANDIDATES = (2048, 4096, 8192, 16384, 32768, 65536, 131072)
+MEMORY_BUDGET_FRACTION = 0.8
+RUNTIME_OVERHEAD_BYTES = 512 * 1024**2
+TEMPLATE_OVERHEAD_TOKENS = 16
+# Template chat Llama 3: /api/chat merender seluruh .Messages (termasuk jawaban assistant sebelumnya,
+# masing-masing ditutup <|eot_id|>), sedangkan /api/generate memakai cabang .Prompt. BOS ditambahkan tokenizer.
+LLAMA3_CHAT_TEMPLATE = """{{- if .Messages }}
+{{- if .System }}<|start_header_id|>system<|end_header_id|>
+
+{{ .System }}<|eot_id|>
+{{- end }}
+{{- range .Messages }}<|start_header_id|>{{ .Role }}<|end_header_id|>
+
+{{ .Content }}<|eot_id|>
+{{- end }}<|start_header_id|>assistant<|end_header_id|>
+
+{{ else }}
+{{- if .System }}<|start_header_id|>system<|end_header_id|>
+
+{{ .System }}<|eot_id|>
+{{- end }}
+{{- if .Prompt }}<|start_header_id|>user<|end_header_id|>
+
+{{ .Prompt }}<|eot_id|>
+{{- end }}<|start_header_id|>assistant<|end_header_id|>
+
+{{ end }}{{ .Response }}{{ if .Response }}<|eot_id|>{{ end }}"""
+CONVERSATION_RESERVE_TOKENS = 1024  # Pertanyaan, riwayat singkat, dan jawaban
+RETRIEVAL_KNOWLEDGE_TOKENS = 1024   # Target ruang untuk konteks retrieval per pertanyaan
+RETRIEVAL_MAX_CANDIDATES = 20
+RETRIEVAL_MIN_RELATIVE_SCORE = 0.3  # Entri dengan skor < 30% dari skor teratas tidak disisipkan
+
+# Preflight: cache sidik jari perangkat keras agar probe GPU/RAM tidak diulang setiap run
+HARDWARE_CACHE_FILE = "HardwareCache_UMM_Assistant_Demo.json"
+HARDWARE_CACHE_TTL_SECONDS = 24 * 3600
+HARDWARE_CACHE_GPU_KEYS = ("nvidia", "amd", "metal", "has_gpu", "vram_total_mb")
+HARDWARE_CACHE_REQUIRED_KEYS = {"identity", "probed_at", "quantization", "gpu_layers"}
+
+# Auto-tuning: tag model dasar per kuantisasi dan parameter pencarian
+TUNING_RESULT_FILE = "TuningResult_UMM_Assistant_Demo.json"
+DEFAULT_BASE_MODEL = "llama3.2"
+QUANTIZATION_BASE_MODELS = {
+    "q4_0": "llama3.2:3b-instruct-q4_0",
+    "q4_k_m": "llama3.2:3b-instruct-q4_K_M",
+    "q5_k_m": "llama3.2:3b-instruct-q5_K_M",
+    "q8_0": "llama3.2:3b-instruct-q8_0",
+    "f16": "llama3.2:3b-instruct-fp16",
+}
+TUNING_QUESTION = "Ceritakan tentang SD Muhammadiyah Malang"
+TUNING_MAX_TOKENS = 64
+TUNING_TTFT_PRUNE_FACTOR = 2.0  # Konfigurasi dengan TTFT > 2x yang terbaik dibuang
+
+# Warm-up: model dimuat dan prefix SYSTEM diproses sekali sebelum melayani pertanyaan.
+# keep_alive mengikuti format Ollama ('30m', '1h', detik); -1 menyematkan model di memori.
+DEFAULT_KEEP_ALIVE = "30m"
+WARMUP_PROMPT = "Halo"
+
+# Build matrix: beberapa varian kuantisasi x num_ctx dibangun dan dibandingkan dalam satu run
+BUILD_MATRIX_FILE = "BuildMatrix_UMM_Assistant_Demo.json"
+
+# Skenario multi-turn: pertanyaan lanjutan dalam satu percakapan untuk mengukur hemat prompt eval riwayat sesi
+MULTI_TURN_CONVERSATION = (
+    "Ceritakan tentang SD Muhammadiyah Malang",
+    "Apa saja kegiatan ekstrakurikuler di sana?",
+    "Bagaimana cara mendaftarkan anak saya?",
+    "Kapan pendaftarannya dibuka?",
+)
+
+# Evaluasi kualitas jawaban: sampel Q/A dataset dijawab model lalu dinilai secara leksikal
+EVAL_SAMPLE_SIZE = 50
+EVAL_CONCURRENCY = 4
+EVAL_SEED = 2024  # Sampel dan seed generasi tetap agar skor antar konfigurasi sebanding
+
+# Gateway HTTP (OpenAI-compatible) di depan model untuk melayani banyak klien sekaligus
+GATEWAY_PORT = 8080
+
+# Cache jawaban di depan model; isinya terikat pada hash dataset
+RESPONSE_CACHE_FILE = "ResponseCache_UMM_Assistant_Demo.json"
+
+# Riwayat benchmark (satu baris JSON per run) dan ambang deteksi regresi
+BENCHMARK_HISTORY_FILE = "BenchmarkHistory_UMM_Assistant_Demo.jsonl"
+REGRESSION_ALPHA = 0.05
+REGRESSION_MIN_CHANGE = 0.05  # Perubahan median di bawah 5% tidak dianggap regresi meskipun signifikan
+# (metrik, label, True jika nilai lebih kecil lebih baik)
+REGRESSION_METRICS = (
+    ("response_time", "Waktu respons", True),
+    ("ttft", "Time-to-first-token", True),
+    ("prompt_eval_rate", "Prompt eval (tok/s)", False),
+    ("eval_rate", "Generasi (tok/s)", False),
+)
+
+# Parameter deduplikasi near-duplicate (MinHash one-permutation + LSH banding)
+MINHASH_NUM_BUCKETS = 64
+MINHASH_BANDS = 16
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Sumber data: file default, ekstensi yang didukung, dan nama kolom/kunci Q/A yang dikenali
+DEFAULT_DATA_FILES = ['NewBrain.csv', 'UMM_Assistant_Data.csv', 'SD_Muhammadiyah_Data.csv', 'training_data.csv', 'dataset.csv']
+DATA_FILE_EXTENSIONS = (".csv", ".jsonl")
+QUESTION_FIELD_ALIASES = ("question", "pertanyaan")
+ANSWER_FIELD_ALIASES = ("answer", "jawaban")
+JSONL_QUESTION_KEYS = ("question", "pertanyaan", "prompt", "instruction")
+JSONL_ANSWER_KEYS = ("answer", "jawaban", "response", "completion", "output")
+ENCODING_SAMPLE_BYTES = 64 * 1024
+
+# Satu pasangan Q/A; tuple ringkas agar dataset besar tetap hemat memori
+QARecord = namedtuple("QARecord", ["question", "answer", "source"])
+
+# Output proses: hanya baris terakhir yang disimpan agar pull/create yang lama tidak membebani memori
+OUTPUT_BUFFER_LINES = 200
+ERROR_TAIL_LINES = 20
+
+# Tracing per tahap pipeline: span diekspor sebagai JSONL dan metrik teks Prometheus
+PIPELINE_TRACE_FILE = "PipelineTrace_UMM_Assistant_Demo.jsonl"
+PIPELINE_METRICS_FILE = "PipelineMetrics_UMM_Assistant_Demo.prom"
+_tracer = PipelineTracer()
+
+def run_command(command, timeout=900, show_progress=False, on_progress=None, max_lines=OUTPUT_BUFFER_LINES):
     """
     Menjalankan perintah shell dengan timeout dan monitoring output real-time.
+    Perintah berupa list dijalankan tanpa shell sehingga argumen tidak perlu di-escape.
+    Hanya `max_lines` baris terakhir yang disimpan (buffer cincin), sehingga memori tetap kecil
+    untuk perintah yang berjalan lama. Baris progres `ollama pull/create` diurai menjadi
+    ProgressEvent dan dikirim ke `on_progress`; di buffer dan konsol progres hanya dicatat per 10%.
     """
+    _tracer.count("subprocess_calls")
+    output = OutputRingBuffer(max_lines)
     try:
         # Gunakan bufsize=1 untuk line-buffering mendapatkan output real-time
         process = subprocess.Popen(
             command,
-            shell=True,
+            shell=isinstance(command, str),
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
@@ -25,21 +184,30 @@ def run_command(command, timeout=900, show_progress=False):
             bufsize=1
         )
         
-        output_lines = []
-        
-        # Fungsi untuk membaca output secara real-time dari pipe
-        def read_output(pipe, lines_list, prefix=""):
+        # Fungsi untuk membaca output secara real-time dari pipe; mode teks juga memecah baris pada '\r'
+        def read_output(pipe, stream, prefix=""):
+            last_step = {}  # Per stream, sehingga thread stdout dan stderr tidak berbagi state
             for line in iter(pipe.readline, ''):
-                clean_line = line.strip()
-                if clean_line:
-                    if show_progress:
-                        # Tampilkan output langsung ke konsol
-                        print(f"{prefix}{clean_line}", flush=True)
-                    lines_list.append(clean_line)
+                clean_line = strip_ansi(line).strip()
+                if not clean_line:
+                    continue
+                event = parse_progress_line(clean_line)
+                # Pembaruan progres hanya disimpan/ditampilkan sekali per kenaikan 10% untuk setiap layer
+                keep = True
+                if event is not None:
+                    key = event.digest or event.stage
+                    keep = last_step.get(key) != event.percent // 10
+                    last_step[key] = event.percent // 10
+                seq = output.append(stream, clean_line, keep=keep)
+                if event is not None and on_progress is not None:
+                    on_progress(event._replace(seq=seq))
+                if show_progress and keep:
+                    # Tampilkan output langsung ke konsol
+                    print(f"{prefix}{clean_line}", flush=True)
         
         # Mulai thread untuk membaca stdout dan stderr secara bersamaan
-        stdout_thread = threading.Thread(target=read_output, args=(process.stdout, output_lines, "  > "))
-        stderr_thread = threading.Thread(target=read_output, args=(process.stderr, output_lines, "  ! "))
+        stdout_thread = threading.Thread(target=read_output, args=(process.stdout, "stdout", "  > "))
+        stderr_thread = threading.Thread(target=read_output, args=(process.stderr, "stderr", "  ! "))
         
         stdout_thread.daemon = True
         stderr_thread.daemon = True
@@ -54,16 +222,14 @@ def run_command(command, timeout=900, show_progress=False):
         stdout_thread.join(timeout=2)
         stderr_thread.join(timeout=2)
 
-        full_output = '\n'.join(output_lines)
-        
         if process.returncode != 0:
-            return False, f"Proses gagal dengan kode {process.returncode}\nOutput:\n{full_output}"
+            return False, f"Proses gagal dengan kode {process.returncode}\nOutput:\n{output.text(last=ERROR_TAIL_LINES)}"
         
-        return True, full_output
+        return True, output.text()
         
     except subprocess.TimeoutExpired:
         process.kill()
-        return False, f"Perintah timeout setelah {timeout} detik."
+        return False, f"Perintah timeout setelah {timeout} detik.\nOutput terakhir:\n{output.text(last=ERROR_TAIL_LINES)}"
     except Exception as e:
         return False, f"Terjadi kesalahan: {str(e)}"
 
@@ -76,17 +242,29 @@ def show_loading_animation(message, stop_event):
         time.sleep(0.5)
     print("\r" + " " * (len(message) + 5) + "\r", end='') # Bersihkan baris setelah selesai
 
-def run_command_with_progress(command, message, max_retries=3, delay=5, timeout=900):
+def run_command_with_progress(command, message, max_retries=3, delay=5, timeout=900, on_progress=None):
     """
     Menjalankan perintah dengan indikator progres dan logika retry.
+    Event progres diteruskan ke `on_progress` dan diringkas menjadi throughput transfer
+    (byte yang benar-benar ditransfer, rata-rata, dan puncak) setelah perintah selesai.
     """
+    output = ""
     for attempt in range(max_retries):
         log_message(f"🔄 {message} (Percobaan {attempt + 1}/{max_retries})")
         
         # Tampilkan output real-time untuk perintah yang berjalan lama
         show_realtime_progress = any(keyword in command for keyword in ['create', 'pull'])
+        transfer = TransferStats()
+
+        def handle_progress(event):
+            transfer.update(event)
+            if on_progress is not None:
+                on_progress(event)
         
-        success, output = run_command(command, timeout, show_progress=show_realtime_progress)
+        success, output = run_command(
+            command, timeout, show_progress=show_realtime_progress, on_progress=handle_progress
+        )
+        log_transfer_summary(message, transfer.summary())
         
         if success:
             log_message(f"✅ {message} berhasil diselesaikan!")
@@ -105,16 +283,31 @@ def run_command_with_progress(command, message, max_retries=3, delay=5, timeout=
             # Jika bukan kesalahan jaringan, gagal langsung
             return False, output
     
-    return False, f"Gagal setelah {max_retries} percobaan."
+    return False, f"Gagal setelah {max_retries} percobaan. Kesalahan terakhir: {output}"
+
+def log_transfer_summary(message, summary):
+    """Menampilkan throughput transfer hasil penguraian progres; dilewati jika tidak ada byte yang ditransfer."""
+    if not summary["transferred_bytes"]:
+        return
+    _tracer.count("bytes", summary["transferred_bytes"])
+    log_message(
+        f"📶 {message}: {format_bytes(summary['transferred_bytes'])} ditransfer dari {summary['layers']} layer "
+        f"dalam {summary['elapsed']:.1f} detik (rata-rata {format_bytes(summary['throughput'])}/s, "
+        f"puncak {format_bytes(summary['peak_rate'])}/s)"
+    )
+
+_log_lock = threading.Lock()
 
 def log_message(message, error=False):
-    """Log pesan dengan timestamp dan format yang lebih baik."""
+    """Log pesan dengan timestamp dan format yang lebih baik (aman dipanggil dari beberapa thread)."""
     timestamp = datetime.now().strftime("%H:%M:%S")
-    if error:
-        print(f"[{timestamp}] ❌ [ERROR] {message}", file=sys.stderr)
-    else:
-        print(f"[{timestamp}] {message}")
+    with _log_lock:
+        if error:
+            print(f"[{timestamp}] ❌ [ERROR] {message}", file=sys.stderr, flush=True)
+        else:
+            print(f"[{timestamp}] {message}", flush=True)
 
+@_tracer.traced("gpu_probe")
 def check_gpu_availability():
     """Memeriksa ketersediaan GPU yang kompatibel dengan Ollama."""
     log_message("🔍 Memeriksa ketersediaan GPU...")
@@ -131,6 +324,10 @@ def check_gpu_availability():
             gpu_lines = [line for line in output.split('\n') if 'MiB' in line and ('GeForce' in line or 'RTX' in line)]
             if gpu_lines:
                 log_message(f"    💾 Info GPU: {gpu_lines[0].strip()}")
+            memory_match = re.search(r"(\d+)MiB\s*/\s*(\d+)MiB", output)
+            if memory_match:
+                # Hanya total VRAM yang disimpan: VRAM bebas berubah-ubah dan dibaca langsung saat perencanaan
+                gpu_info['vram_total_mb'] = int(memory_match.group(2))
             return gpu_info
     except FileNotFoundError:
         pass # nvidia-smi tidak terinstal
@@ -148,31 +345,44 @@ def check_gpu_availability():
     
     # Periksa Apple Metal pada macOS
     if platform.system() == "Darwin":
-        try:
-            # Pemeriksaan sederhana untuk melihat apakah Ollama dapat mengakses GPU
-            success, output = run_command("ollama run llama3:latest --verbose 'hi'", timeout=20)
-            if success and "metal" in output.lower():
-                 gpu_info['metal'] = True
-                 gpu_info['has_gpu'] = True
-                 log_message("  - 🍎 Apple Silicon (Metal) GPU terdeteksi!")
-                 return gpu_info
-        except Exception:
-            pass
+        # Ollama memakai Metal di semua Mac Apple Silicon; cukup periksa arsitektur CPU
+        # (sysctl juga benar ketika Python berjalan di bawah Rosetta) tanpa menjalankan inferensi.
+        success, output = run_command(["sysctl", "-n", "hw.optional.arm64"], timeout=5)
+        if platform.machine() == "arm64" or (success and output.strip() == "1"):
+            gpu_info['metal'] = True
+            gpu_info['has_gpu'] = True
+            log_message("  - 🍎 Apple Silicon (Metal) GPU terdeteksi!")
+            return gpu_info
 
     if not gpu_info['has_gpu']:
         log_message("  - ⚠️ Tidak ada GPU kompatibel terdeteksi. Proses akan menggunakan CPU.")
     
     return gpu_info
 
+_ollama_client = None
+
+def get_ollama_client():
+    """Klien API Ollama bersama (satu pool koneksi keep-alive untuk seluruh proses)."""
+    global _ollama_client
+    if _ollama_client is None:
+        _ollama_client = OllamaClient(on_request=lambda method, path: _tracer.count("api_calls"))
+    return _ollama_client
+
+@_tracer.traced("service_check")
 def check_ollama_service():
-    """Memeriksa apakah layanan Ollama sedang berjalan dan sehat."""
+    """
+    Memeriksa apakah layanan Ollama sedang berjalan dan sehat.
+    Mengembalikan (sehat, pesan, daftar nama model) agar daftar model tidak perlu diambil ulang.
+    """
     log_message("📡 Memeriksa status layanan Ollama...")
-    success, output = run_command("ollama list", timeout=30)
-    if not success:
-        return False, f"Layanan Ollama tidak merespons: {output}"
-    log_message("  - ✅ Layanan Ollama aktif dan sehat.")
-    return True, "Layanan Ollama sehat"
+    try:
+        model_names = get_ollama_client().list_model_names(timeout=30)
+    except OllamaError as e:
+        return False, f"Layanan Ollama tidak merespons: {e}", []
+    log_message(f"  - ✅ Layanan Ollama aktif dan sehat ({get_ollama_client().base_url}).")
+    return True, "Layanan Ollama sehat", model_names
 
+@_tracer.traced("service_restart")
 def restart_ollama_service():
     """Mencoba untuk memulai ulang layanan Ollama."""
     log_message("🔄 Mencoba memulai ulang layanan Ollama...")
@@ -194,16 +404,15 @@ def restart_ollama_service():
 def check_system_resources():
     """Memeriksa sumber daya sistem untuk pengaturan optimal."""
     log_message("💻 Menganalisis sumber daya sistem (RAM & CPU)...")
-    try:
-        import psutil
-    except ImportError:
-        log_message("  - 📦 Menginstal psutil...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "psutil"])
-        import psutil
-    
-    ram_gb = psutil.virtual_memory().total / (1024**3)
-    cpu_count = psutil.cpu_count(logical=False) # Core fisik
-    log_message(f"  - 💾 RAM: {ram_gb:.1f} GB | CPU Core: {cpu_count}")
+    total_ram = get_total_ram_bytes()
+    cpu_count = get_physical_cpu_count()
+    if total_ram is None:
+        # Tanpa psutil di platform non-POSIX RAM tidak terbaca: pilih rekomendasi paling hemat memori
+        log_message(f"  - 💾 RAM: tidak diketahui (psutil tidak terpasang) | CPU Core: {cpu_count}")
+        ram_gb = 0
+    else:
+        ram_gb = total_ram / (1024**3)
+        log_message(f"  - 💾 RAM: {ram_gb:.1f} GB | CPU Core: {cpu_count}")
     
     if ram_gb < 8:
         recommended_quant = "q4_0"
@@ -220,27 +429,138 @@ def check_system_resources():
     
     return recommended_quant, gpu_layers
 
+@_tracer.traced("resource_probe")
 def select_quantization_method():
     """Secara otomatis memilih metode kuantisasi berdasarkan sumber daya sistem."""
     recommended_quant, gpu_layers = check_system_resources()
     log_message(f"✅ Kuantisasi yang direkomendasikan sistem: {recommended_quant.upper()}")
     return recommended_quant, gpu_layers
 
-def create_knowledge_base_system_prompt(csv_dataset):
-    """Membuat string knowledge base yang komprehensif dari data CSV."""
-    log_message("  - 🧠 Menyusun knowledge base dari data CSV...")
-    knowledge_base = "--- BASIS PENGETAHUAN (SUMBER KEBENARAN UTAMA) ---\n\n"
-    for i, data in enumerate(csv_dataset, 1):
-        knowledge_base += f"P: {data['question']}\n"
-        knowledge_base += f"J: {data['answer']}\n\n"
-    return knowledge_base
-
-def create_gpu_optimized_modelfile(csv_dataset, quantization_method, gpu_info, gpu_layers):
-    """Membuat Modelfile yang dioptimalkan untuk GPU."""
-    log_message("📄 Membuat Modelfile dengan optimasi GPU...")
-    
-    knowledge_base_prompt = create_knowledge_base_system_prompt(csv_dataset)
-    
+@_tracer.traced("index_build")
+def build_knowledge_index(csv_dataset, index_path=KNOWLEDGE_INDEX_FILE):
+    """
+    Membangun indeks retrieval BM25 dari data CSV dan menyimpannya ke disk.
+    Mengembalikan statistik indeks (lihat write_knowledge_index).
+    """
+    log_message("🧠 Membangun indeks retrieval knowledge base...")
+    start_time = time.time()
+    stats = write_knowledge_index(((record.question, record.answer) for record in csv_dataset), index_path)
+    _tracer.current().set(rows=stats["documents"], bytes=stats["bytes"])
+    log_message(
+        f"  - ✅ Indeks '{index_path}' dibuat: {stats['documents']} entri, "
+        f"{stats['terms']} istilah, {stats['bytes'] / 1024:.0f} KB ({time.time() - start_time:.2f} detik)"
+    )
+    return stats
+
+def diff_dataset_rows(previous_index_path, csv_dataset):
+    """
+    Membandingkan sidik jari baris dataset dengan sidik jari di indeks build sebelumnya.
+    Baris yang diubah muncul sebagai baris lama yang hilang dan baris baru. Mengembalikan
+    pertanyaan baris baru (`added`), sidik jari hex baris lama yang hilang (`removed`), dan jumlah
+    baris yang tidak berubah, atau None jika indeks lama tidak ada atau versinya berbeda.
+    """
+    try:
+        previous = KnowledgeIndex(previous_index_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    with previous:
+        old_fingerprints = set(previous.fingerprints())
+
+    new_fingerprints = set()
+    added = []
+    for record in csv_dataset:
+        fingerprint = document_fingerprint(record.question, record.answer)
+        if fingerprint not in old_fingerprints:
+            added.append(record.question)
+        new_fingerprints.add(fingerprint)
+    return {
+        "added": added,
+        "removed": [fingerprint.hex() for fingerprint in old_fingerprints - new_fingerprints],
+        "unchanged": len(old_fingerprints & new_fingerprints),
+    }
+
+def invalidate_cached_answers(row_diff, previous_dataset_hash, dataset_hash, max_entries, ttl,
+                              cache_path=RESPONSE_CACHE_FILE):
+    """
+    Memindahkan cache jawaban dari dataset lama ke dataset baru. Jawaban yang dibangun dari dokumen
+    yang diubah atau dihapus dibuang, begitu pula jawaban untuk pertanyaan yang baru ditambahkan.
+    Mengembalikan (dipertahankan, dibuang), atau None jika tidak ada cache untuk dataset sebelumnya.
+    """
+    if not previous_dataset_hash or not os.path.exists(cache_path):
+        return None
+    cache = ResponseCache(previous_dataset_hash, max_entries=max_entries, ttl=ttl, cache_path=cache_path)
+    if not len(cache):
+        return None
+    dropped = cache.invalidate(dataset_hash=dataset_hash, questions=row_diff["added"], sources=row_diff["removed"])
+    cache.save()
+    return len(cache), dropped
+
+def log_rebuild_report(row_diff, index_stats, cache_result):
+    """
+    Menampilkan apa yang dibangun ulang dan apa yang dipakai ulang setelah dataset berubah:
+    indeks selalu dibangun ulang penuh, hanya cache jawaban yang dipertahankan sebagian.
+    """
+    log_message(
+        f"🔁 Dataset berubah (+{len(row_diff['added'])} baris baru/diubah, "
+        f"-{len(row_diff['removed'])} baris lama dihapus/diubah, {row_diff['unchanged']} baris tidak berubah): "
+        f"indeks dibangun ulang penuh ({index_stats['documents']} dokumen)."
+    )
+    if cache_result:
+        kept, dropped = cache_result
+        log_message(f"  - ♻️ Cache jawaban: {kept} entri dipertahankan, {dropped} entri dibuang.")
+    else:
+        log_message("  - Cache jawaban: tidak ada entri dari dataset sebelumnya yang bisa dipertahankan.")
+    log_message("  - ♻️ Modelfile tidak memuat knowledge base, sehingga perubahan baris tidak memicu pembuatan ulang model.")
+
+def select_knowledge_within_budget(results, max_tokens):
+    """
+    Memilih hasil retrieval sesuai urutan peringkat selama total tokennya muat di anggaran.
+    Entri yang terlalu besar dilewati agar entri berikutnya yang lebih kecil masih bisa masuk.
+    """
+    selected = []
+    used_tokens = 0
+    top_score = results[0]["score"] if results else 0.0
+    for result in results:
+        if result["score"] < top_score * RETRIEVAL_MIN_RELATIVE_SCORE:
+            break
+        cost = estimate_tokens(f"P: {result['question']}\nJ: {result['answer']}\n\n")
+        if used_tokens + cost <= max_tokens:
+            selected.append(result)
+            used_tokens += cost
+    return selected
+
+def retrieve_knowledge(question, knowledge_index, top_k=RETRIEVAL_TOP_K, max_tokens=None, exclude_doc_ids=()):
+    """
+    Memilih pasangan Q/A dari indeks yang akan disisipkan ke prompt pengguna.
+    Tanpa `max_tokens` dipakai top-k tetap; dengan `max_tokens` entri dipilih menurut peringkat hingga anggaran penuh.
+    Dokumen di `exclude_doc_ids` tidak pernah dipilih (dipakai evaluasi held-out).
+    """
+    if max_tokens is None:
+        results = knowledge_index.search(question, top_k=top_k + len(exclude_doc_ids))
+        results = [r for r in results if r["doc_id"] not in exclude_doc_ids][:top_k]
+    else:
+        candidates = knowledge_index.search(question, top_k=RETRIEVAL_MAX_CANDIDATES + len(exclude_doc_ids))
+        results = select_knowledge_within_budget(
+            [r for r in candidates if r["doc_id"] not in exclude_doc_ids], max_tokens
+        )
+    return results
+
+def format_retrieval_prompt(question, results):
+    """Prompt pengguna berisi blok BASIS PENGETAHUAN dari hasil retrieval, diikuti pertanyaannya."""
+    if not results:
+        return question
+    return f"{format_knowledge_context(results)}\nPertanyaan: {question}"
+
+def create_retrieval_prompt(question, knowledge_index, top_k=RETRIEVAL_TOP_K, max_tokens=None, exclude_doc_ids=()):
+    """Menyisipkan pasangan Q/A yang relevan dari indeks ke dalam prompt pengguna (lihat retrieve_knowledge)."""
+    results = retrieve_knowledge(question, knowledge_index, top_k, max_tokens, exclude_doc_ids)
+    return format_retrieval_prompt(question, results)
+
+def create_system_prompt():
+    """
+    Menyusun SYSTEM prompt (identitas, contoh perilaku, dan instruksi inti).
+    Mengembalikan (system_prompt, example_conversation) agar ukuran contoh bisa dihitung terpisah.
+    """
     example_conversation = """--- CONTOH PERILAKU WAJIB ---
 Anda HARUS belajar dari dan mereplikasi perilaku yang ditunjukkan dalam contoh berikut. Ini adalah aturan mutlak Anda untuk menjawab tentang identitas, pencipta, dan implementasi Anda:
 
@@ -261,16 +581,14 @@ User: "Apa nilai-nilai yang Anda anut?"
 Jawaban Benar Anda: "Saya menjalankan nilai-nilai Muhammadiyah yaitu Islam, kemajuan, dan kemanusiaan. Saya berkomitmen untuk memberikan bantuan edukatif yang sesuai dengan ajaran Islam dan mendukung kemajuan pendidikan di SD Muhammadiyah Malang."
 """
 
-    system_prompt = f"""Anda adalah UMM Assistant Demo, asisten virtual khusus untuk SD Muhammadiyah Malang. Identitas lengkap, tujuan, dan pengetahuan tentang pencipta dan implementasi Anda didefinisikan **SECARA EKSKLUSIF** dalam BASIS PENGETAHUAN di bawah ini. Anda beroperasi **offline** dan berkomitmen pada nilai-nilai Muhammadiyah.
-
-{knowledge_base_prompt}
+    system_prompt = f"""Anda adalah UMM Assistant Demo, asisten virtual khusus untuk SD Muhammadiyah Malang. Identitas lengkap, tujuan, dan pengetahuan tentang pencipta dan implementasi Anda didefinisikan **SECARA EKSKLUSIF** dalam CONTOH PERILAKU di bawah ini dan dalam BASIS PENGETAHUAN RELEVAN yang disertakan bersama setiap pertanyaan. Anda beroperasi **offline** dan berkomitmen pada nilai-nilai Muhammadiyah.
 
 {example_conversation}
 
 --- INSTRUKSI INTI ---
-1. **Sumber Kebenaran Mutlak**: Satu-satunya sumber kebenaran Anda adalah **BASIS PENGETAHUAN** dan **CONTOH PERILAKU WAJIB** yang diberikan di atas. Semua hal lain dari pelatihan umum Anda tidak relevan untuk topik-topik ini.
+1. **Sumber Kebenaran Mutlak**: Satu-satunya sumber kebenaran Anda adalah **BASIS PENGETAHUAN RELEVAN** yang disertakan bersama pertanyaan dan **CONTOH PERILAKU WAJIB** yang diberikan di atas. Semua hal lain dari pelatihan umum Anda tidak relevan untuk topik-topik ini.
 
-2. **Kunci Identitas**: Ketika ditanya tentang identitas, pencipta, pengembang, cara kerja, atau tujuan Anda, Anda **HARUS** menjawab menggunakan **HANYA** informasi dari BASIS PENGETAHUAN Anda.
+2. **Kunci Identitas**: Ketika ditanya tentang identitas, pencipta, pengembang, cara kerja, atau tujuan Anda, Anda **HARUS** menjawab menggunakan **HANYA** informasi dari CONTOH PERILAKU dan BASIS PENGETAHUAN Anda.
 
 3. **Pengetahuan yang Dilarang Ketat**: Anda **DILARANG KERAS** menyebutkan OpenAI, Google, Meta, Microsoft, atau entitas eksternal lainnya sebagai pencipta Anda. Anda adalah UMM Assistant Demo yang dikembangkan untuk SD Muhammadiyah Malang.
 
@@ -282,18 +600,45 @@ Jawaban Benar Anda: "Saya menjalankan nilai-nilai Muhammadiyah yaitu Islam, kema
 
 7. **Bahasa Indonesia**: Selalu berkomunikasi dalam Bahasa Indonesia yang baik dan benar, sesuai dengan konteks pendidikan.
 """
+    return system_prompt, example_conversation
+
+def get_total_ram_bytes():
+    """Total RAM (psutil), dengan fallback ke sysconf di POSIX; None jika tidak bisa dibaca."""
+    try:
+        import psutil
+        return psutil.virtual_memory().total
+    except ImportError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def get_physical_cpu_count():
+    """Jumlah core fisik (psutil), dengan fallback ke jumlah CPU logis."""
+    try:
+        import psutil
+        return psutil.cpu_count(logical=False) or os.cpu_count() or 4
+    except ImportError:
+        return os.cpu_count() or 4
+
+def create_gpu_optimized_modelfile(quantization_method, gpu_info, gpu_layers, num_ctx=4096, num_thread=None,
+                                   base_model=DEFAULT_BASE_MODEL, system_prompt=None):
+    """
+    Membuat Modelfile yang dioptimalkan untuk GPU.
+    SYSTEM hanya berisi identitas, contoh, dan aturan; knowledge base disisipkan per pertanyaan dari indeks retrieval.
+    `system_prompt` yang sudah dibuat boleh diberikan agar dipakai bersama oleh beberapa varian.
+    """
+    log_message("📄 Membuat Modelfile dengan optimasi GPU...")
+    if system_prompt is None:
+        system_prompt, _ = create_system_prompt()
     
     num_gpu_layers = gpu_layers if gpu_info['has_gpu'] else 0
     log_message(f"  - ⚙️ Konfigurasi Modelfile: Memindahkan {num_gpu_layers} layer ke GPU.")
     
-    modelfile_content = f'''FROM llama3.2
-
-TEMPLATE """<|begin_of_text|><|start_header_id|>system<|end_header_id|>
-
-{{{{ .System }}}}<|eot_id|><|start_header_id|>user<|end_header_id|>
+    modelfile_content = f'''FROM {base_model}
 
-{{{{ .Prompt }}}}<|eot_id|><|start_header_id|>assistant<|end_header_id|>
-"""
+TEMPLATE """{LLAMA3_CHAT_TEMPLATE}"""
 
 SYSTEM """{system_prompt}"""
 
@@ -301,24 +646,30 @@ SYSTEM """{system_prompt}"""
 PARAMETER temperature 0.2
 PARAMETER top_p 0.9
 PARAMETER top_k 40
-PARAMETER num_ctx 4096
+PARAMETER num_ctx {num_ctx}
 
 # Optimasi GPU & Performa
 PARAMETER num_gpu {num_gpu_layers}
 PARAMETER main_gpu 0
 PARAMETER use_mmap true
 PARAMETER use_mlock {str(gpu_info['has_gpu']).lower()}
-PARAMETER num_thread {os.cpu_count() or 4}
+PARAMETER num_thread {num_thread or get_physical_cpu_count()}
 
 # Kuantisasi: {quantization_method.upper()}
 '''
     return modelfile_content
 
-def create_gpu_optimized_model(model_name, modelfile_name, quantization_method, gpu_info):
+def get_final_model_name(model_name, quantization_method, gpu_info):
+    """Nama tag model akhir, misalnya UMM-Assistant-Demo-q5_k_m-gpu."""
+    return f"{model_name}-{quantization_method}-{'gpu' if gpu_info['has_gpu'] else 'cpu'}"
+
+@_tracer.traced("create")
+def create_gpu_optimized_model(model_name, modelfile_name, quantization_method, gpu_info, final_model_name=None):
     """Membuat model dengan optimasi GPU dan pelacakan progres."""
     log_message(f"🏗️ Memulai proses pembuatan model untuk '{model_name}'...")
     
-    final_model_name = f"{model_name}-{quantization_method}-{'gpu' if gpu_info['has_gpu'] else 'cpu'}"
+    final_model_name = final_model_name or get_final_model_name(model_name, quantization_method, gpu_info)
+    _tracer.current().set(model=final_model_name)
     log_message(f"  - 🏷️ Nama model akhir akan menjadi: {final_model_name}")
 
     create_command = f"ollama create {final_model_name} -f {modelfile_name}"
@@ -341,9 +692,303 @@ def create_gpu_optimized_model(model_name, modelfile_name, quantization_method,
     log_message(f"✅ Model '{final_model_name}' berhasil dibuat!")
     return final_model_name
 
-def benchmark_model(model_name, gpu_info):
-    """Benchmark yang ditingkatkan dengan animasi loading."""
+def compute_dataset_hash(csv_dataset):
+    """Hash SHA-256 dari seluruh pasangan Q/A (urutan ikut diperhitungkan)."""
+    digest = hashlib.sha256()
+    for record in csv_dataset:
+        digest.update(record.question.encode("utf-8"))
+        digest.update(b"\x1f")
+        digest.update(record.answer.encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+def compute_build_key(modelfile_content, build_params):
+    """Kunci build model: hash dari isi Modelfile dan parameter yang dipilih."""
+    digest = hashlib.sha256(modelfile_content.encode("utf-8"))
+    digest.update(json.dumps(build_params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def load_build_manifest(manifest_path=BUILD_MANIFEST_FILE):
+    """Memuat manifest build; manifest yang hilang atau rusak dianggap kosong."""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict):
+            manifest.setdefault("models", {})
+            manifest.setdefault("index", {})
+            return manifest
+    except (OSError, json.JSONDecodeError):
+        pass
+    return {"models": {}, "index": {}}
+
+def save_build_manifest(manifest, manifest_path=BUILD_MANIFEST_FILE):
+    """Menyimpan manifest build secara atomik."""
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def is_model_build_cached(manifest, model_name, build_key, available_models):
+    """Model dapat dipakai ulang jika kuncinya sama dan tag-nya masih ada di Ollama."""
+    entry = manifest["models"].get(model_name)
+    return bool(entry) and entry.get("build_key") == build_key and model_name_matches(model_name, available_models)
+
+def write_if_changed(path, content):
+    """Menulis file hanya jika isinya berbeda; mengembalikan True jika file ditulis."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return True
+
+# Manifest dan unduhan model dasar dipakai bersama oleh worker build matrix
+_manifest_lock = threading.Lock()
+_pull_locks = {}
+
+def ensure_base_model(base_model, available_models):
+    """
+    Mengunduh model dasar jika belum ada di daftar model lokal. Aman dipanggil dari beberapa
+    thread: setiap tag hanya diunduh sekali, dan `available_models` diperbarui setelahnya.
+    """
+    with _manifest_lock:
+        pull_lock = _pull_locks.setdefault(base_model, threading.Lock())
+    with pull_lock:
+        log_message(f"📦 Memeriksa model dasar {base_model}...")
+        if model_name_matches(base_model, available_models):
+            log_message(f"  - ✅ Model dasar {base_model} sudah tersedia.")
+            return
+        log_message(f"  - ⚠️ Model dasar tidak ditemukan. Mengunduh {base_model}...")
+        with _tracer.span("pull", model=base_model):
+            print("-" * 70)
+            pull_success, pull_output = run_command_with_progress(
+                f"ollama pull {base_model}", f"Mengunduh {base_model}", timeout=1800
+            )
+            print("-" * 70)
+            if not pull_success:
+                raise Exception(f"Gagal mengunduh {base_model}: {pull_output}")
+        available_models.append(base_model)
+
+def build_model_variant(final_model_name, modelfile_name, modelfile_content, build_params, gpu_info,
+                        manifest, dataset_hash, available_models, force=False):
+    """
+    Memastikan model `final_model_name` tersedia sesuai Modelfile-nya: dipakai ulang jika kunci build
+    di manifest sama, selain itu model dasar diunduh bila perlu, model dibuat, diverifikasi, lalu dicatat.
+    Mengembalikan True jika model dibangun dan False jika dipakai ulang.
+    """
+    build_key = compute_build_key(modelfile_content, build_params)
+    if not force and is_model_build_cached(manifest, final_model_name, build_key, available_models):
+        log_message(f"♻️ Modelfile & parameter tidak berubah, memakai ulang model '{final_model_name}' (gunakan --force untuk membangun ulang).")
+        return False
+
+    ensure_base_model(build_params["base_model"], available_models)
+    create_gpu_optimized_model(
+        BASE_MODEL_NAME, modelfile_name, build_params["quantization"], gpu_info, final_model_name=final_model_name
+    )
+
+    log_message(f"✔️ Memverifikasi model '{final_model_name}'...")
+    with _tracer.span("verify", model=final_model_name):
+        if not model_name_matches(final_model_name, get_ollama_client().list_model_names(timeout=30)):
+            raise Exception(f"Model '{final_model_name}' tidak ditemukan dalam daftar setelah pembuatan. Proses mungkin gagal.")
+    log_message(f"✅ Model '{final_model_name}' berhasil diverifikasi.")
+
+    with _manifest_lock:
+        manifest["models"][final_model_name] = {
+            "build_key": build_key,
+            "dataset_hash": dataset_hash,
+            "modelfile": modelfile_name,
+            "modelfile_hash": hashlib.sha256(modelfile_content.encode("utf-8")).hexdigest(),
+            "params": build_params,
+            "built_at": datetime.now().isoformat(),
+        }
+        save_build_manifest(manifest)
+    return True
+
+# Metrik per-permintaan yang diringkas menjadi persentil oleh summarize_benchmark
+BENCHMARK_METRICS = (
+    "response_time", "ttft", "load_duration", "prompt_eval_count", "prompt_eval_duration",
+    "prompt_eval_rate", "eval_count", "eval_rate", "total_duration",
+)
+BENCHMARK_PERCENTILES = (50, 95, 99)
+
+def timed_generate(client, model_name, prompt, timeout=120, **generate_kwargs):
+    """
+    Menjalankan satu permintaan /api/generate secara streaming dan mengukur metriknya.
+    TTFT diukur di sisi klien saat token pertama tiba; durasi lain diambil dari field
+    waktu Ollama (nanodetik) pada chunk terakhir dan dikonversi ke detik.
+    `timeout` berlaku untuk seluruh permintaan, bukan hanya per pembacaan socket.
+    """
+    start_time = time.perf_counter()
+    first_token_time = None
+    final_chunk = {}
+    pieces = []
+    stream = client.generate(model_name, prompt, timeout=timeout, **generate_kwargs)
+    for chunk in stream:
+        if time.perf_counter() - start_time > timeout:
+            stream.close()
+            raise OllamaError(f"Permintaan melebihi batas waktu {timeout} detik.", timed_out=True)
+        text = chunk.get("response", "")
+        if text:
+            if first_token_time is None:
+                first_token_time = time.perf_counter()
+            pieces.append(text)
+        if chunk.get("done"):
+            final_chunk = chunk
+    end_time = time.perf_counter()
+
+    def seconds(field):
+        value = final_chunk.get(field)
+        return value / 1e9 if value is not None else None
+
+    prompt_eval_duration = seconds("prompt_eval_duration")
+    eval_duration = seconds("eval_duration")
+    prompt_eval_count = final_chunk.get("prompt_eval_count")
+    eval_count = final_chunk.get("eval_count")
+    return {
+        "response": "".join(pieces),
+        "response_time": end_time - start_time,
+        "ttft": (first_token_time - start_time) if first_token_time is not None else None,
+        "load_duration": seconds("load_duration"),
+        "prompt_eval_count": prompt_eval_count,
+        "prompt_eval_duration": prompt_eval_duration,
+        "prompt_eval_rate": prompt_eval_count / prompt_eval_duration if prompt_eval_count and prompt_eval_duration else None,
+        "eval_count": eval_count,
+        "eval_rate": eval_count / eval_duration if eval_count and eval_duration else None,
+        "total_duration": seconds("total_duration"),
+        "context": final_chunk.get("context"),
+    }
+
+def percentile(values, pct):
+    """Persentil dengan interpolasi linear (sama seperti numpy.percentile default)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+def summarize_metrics(results, metrics=BENCHMARK_METRICS):
+    """Meringkas daftar hasil menjadi {metrik: {'p50': .., 'p95': .., 'p99': .., 'mean': ..}}."""
+    summary = {}
+    for metric in metrics:
+        values = [r[metric] for r in results if r.get(metric) is not None]
+        if not values:
+            continue
+        summary[metric] = {f"p{pct}": percentile(values, pct) for pct in BENCHMARK_PERCENTILES}
+        summary[metric]["mean"] = sum(values) / len(values)
+    return summary
+
+def summarize_benchmark(benchmark_results):
+    """
+    Ringkasan persentil per pertanyaan dan keseluruhan untuk hasil benchmark yang berhasil.
+    Hasil pengukuran cold/warm start dilaporkan terpisah di 'start' dan tidak ikut dalam persentil.
+    """
+    start = {r["phase"].replace("_start", ""): {metric: r.get(metric) for metric in BENCHMARK_METRICS}
+             for r in benchmark_results if r.get("phase")}
+    benchmark_results = [r for r in benchmark_results if not r.get("phase")]
+    successful = [r for r in benchmark_results if r["success"]]
+    per_question = {}
+    for result in successful:
+        per_question.setdefault(result["question"], []).append(result)
+    return {
+        "per_question": {question: summarize_metrics(results) for question, results in per_question.items()},
+        "overall": summarize_metrics(successful),
+        "start": start,
+        "requests": len(benchmark_results),
+        "errors": len(benchmark_results) - len(successful),
+    }
+
+def log_benchmark_summary(summary):
+    """Menampilkan latensi cold/warm start dan tabel persentil metrik benchmark keseluruhan."""
+    start = summary.get("start", {})
+    if "cold" in start and "warm" in start:
+        cold, warm = start["cold"], start["warm"]
+        log_message(
+            f"🧊 Cold start: {cold['response_time']:.2f} detik (muat model {cold['load_duration'] or 0:.2f} detik) | "
+            f"🔥 Warm start: {warm['response_time']:.2f} detik "
+            f"(hemat {cold['response_time'] - warm['response_time']:.2f} detik)"
+        )
+    overall = summary["overall"]
+    if not overall:
+        return
+    log_message(f"📈 Ringkasan benchmark ({summary['requests']} permintaan, {summary['errors']} gagal):")
+    labels = {
+        "response_time": ("Waktu respons", "s"), "ttft": ("Time-to-first-token", "s"),
+        "load_duration": ("Load model", "s"), "prompt_eval_duration": ("Prompt eval", "s"),
+        "prompt_eval_rate": ("Prompt eval", "tok/s"), "eval_rate": ("Generasi", "tok/s"),
+        "total_duration": ("Total (server)", "s"),
+    }
+    for metric, (label, unit) in labels.items():
+        stats = overall.get(metric)
+        if stats:
+            log_message(
+                f"   - {label:<20} p50 {stats['p50']:8.3f} | p95 {stats['p95']:8.3f} | p99 {stats['p99']:8.3f} {unit}"
+            )
+
+def unload_model(client, model_name):
+    """Melepas model dari memori (keep_alive=0) agar pengukuran berikutnya dimulai dari kondisi yang sama."""
+    try:
+        client.generate(model_name, "", keep_alive=0, stream=False, timeout=60)
+    except OllamaError as e:
+        log_message(f"  - ⚠️ Gagal melepas model {model_name} dari memori: {e}")
+
+def parse_keep_alive(value):
+    """Mengubah nilai --keep-alive menjadi nilai API: bilangan menjadi detik (int), durasi seperti '30m' tetap string."""
+    value = str(value).strip()
+    if re.fullmatch(r"-?\d+", value):
+        return int(value)
+    if not re.fullmatch(r"(\d+(\.\d+)?(ms|s|m|h))+", value):
+        raise ValueError(f"Format keep-alive tidak valid: '{value}' (contoh: 30m, 1h, 3600, -1)")
+    return value
+
+@_tracer.traced("warmup")
+def warm_up_model(client, model_name, keep_alive=DEFAULT_KEEP_ALIVE, timeout=300):
+    """
+    Memuat model ke memori dengan `keep_alive` dan memproses prefix SYSTEM sekali (satu token keluaran),
+    sehingga permintaan berikutnya tidak membayar waktu muat dan prefix SYSTEM sudah ada di cache prompt.
+    """
+    log_message(f"🔥 Warm-up model '{model_name}' (keep_alive={keep_alive})...")
+    metrics = timed_generate(
+        client, model_name, WARMUP_PROMPT, timeout=timeout, keep_alive=keep_alive, options={"num_predict": 1}
+    )
+    _tracer.current().set(model=model_name, keep_alive=keep_alive)
+    log_message(
+        f"  - ✅ Model siap dalam {metrics['response_time']:.2f} detik "
+        f"(muat {metrics['load_duration'] or 0:.2f} detik, prefix {metrics['prompt_eval_count'] or 0} token)."
+    )
+    if keep_alive == -1:
+        log_message("  - 📌 Model disematkan di memori sampai server Ollama dihentikan.")
+    return metrics
+
+def measure_start_latency(client, model_name, prompt, keep_alive=DEFAULT_KEEP_ALIVE, timeout=300):
+    """
+    Mengukur latensi cold start (model dilepas dulu dari memori) dan warm start (setelah warm-up)
+    untuk prompt yang sama. Setelah fungsi ini model dalam keadaan termuat dan ter-warm-up.
+    """
+    log_message("🧊 Mengukur cold start vs warm start...")
+    unload_model(client, model_name)
+    cold = timed_generate(client, model_name, prompt, timeout=timeout, keep_alive=keep_alive)
+    unload_model(client, model_name)
+    warm_up_model(client, model_name, keep_alive=keep_alive, timeout=timeout)
+    warm = timed_generate(client, model_name, prompt, timeout=timeout, keep_alive=keep_alive)
+    return cold, warm
+
+@_tracer.traced("benchmark")
+def benchmark_model(model_name, gpu_info, index_path=KNOWLEDGE_INDEX_FILE, repeats=1, knowledge_tokens=None,
+                    keep_alive=DEFAULT_KEEP_ALIVE, measure_start=True):
+    """
+    Benchmark yang ditingkatkan dengan animasi loading dan konteks retrieval.
+    Setiap pertanyaan diulang `repeats` kali agar persentil per pertanyaan bermakna.
+    Dengan `measure_start`, latensi cold start dan warm start diukur terlebih dahulu dan dicatat
+    sebagai hasil berfase 'cold_start'/'warm_start' yang tidak ikut dihitung dalam persentil.
+    """
     log_message("🏃 Menjalankan benchmark performa...")
+    knowledge_index = KnowledgeIndex(index_path)
+    client = get_ollama_client()
     
     test_questions = [
         "Siapa yang membuat Anda?",
@@ -353,131 +998,1787 @@ def benchmark_model(model_name, gpu_info):
         "Ceritakan tentang SD Muhammadiyah Malang"
     ]
     benchmark_results = []
+
+    if measure_start:
+        prompt = create_retrieval_prompt(test_questions[0], knowledge_index, max_tokens=knowledge_tokens)
+        try:
+            for phase, metrics in zip(("cold_start", "warm_start"),
+                                      measure_start_latency(client, model_name, prompt, keep_alive=keep_alive)):
+                metrics.pop("context", None)
+                benchmark_results.append({"question": test_questions[0], "phase": phase, "success": True, **metrics})
+        except OllamaError as e:
+            log_message(f"  - ⚠️ Pengukuran cold/warm start gagal: {e}", error=True)
     
     for i, question in enumerate(test_questions, 1):
-        log_message(f"  - 💬 Tes {i}/{len(test_questions)}: \"{question}\"")
-        start_time = time.time()
-        
-        stop_event = threading.Event()
-        loading_thread = threading.Thread(
-            target=show_loading_animation, 
-            args=(f"    ⏳ Menunggu respons dari AI", stop_event)
+        prompt = create_retrieval_prompt(question, knowledge_index, max_tokens=knowledge_tokens)
+        for repeat in range(repeats):
+            suffix = f" (ulangan {repeat + 1}/{repeats})" if repeats > 1 else ""
+            log_message(f"  - 💬 Tes {i}/{len(test_questions)}{suffix}: \"{question}\"")
+            
+            stop_event = threading.Event()
+            loading_thread = threading.Thread(
+                target=show_loading_animation, 
+                args=(f"    ⏳ Menunggu respons dari AI", stop_event)
+            )
+            loading_thread.start()
+            
+            try:
+                metrics = timed_generate(client, model_name, prompt, timeout=120, keep_alive=keep_alive)
+                error = None
+            except OllamaError as e:
+                metrics, error = None, str(e)
+            
+            stop_event.set()
+            loading_thread.join()
+            
+            if metrics is not None:
+                ttft = f"{metrics['ttft']:.2f}" if metrics['ttft'] is not None else "-"
+                eval_rate = f"{metrics['eval_rate']:.1f}" if metrics['eval_rate'] else "-"
+                log_message(
+                    f"    ✅ Respons diterima dalam {metrics['response_time']:.2f} detik "
+                    f"(TTFT {ttft} detik, {eval_rate} token/detik)."
+                )
+                metrics.pop("context", None)
+                benchmark_results.append({"question": question, "success": True, **metrics})
+            else:
+                log_message(f"    ❌ Gagal mendapat respons. Error: {error}", error=True)
+                benchmark_results.append({"question": question, "response_time": None, "success": False, "error": error})
+
+    knowledge_index.close()
+    _tracer.current().set(
+        model=model_name, rows=len(benchmark_results),
+        bytes=sum(len(r.get("response", "").encode("utf-8")) for r in benchmark_results)
+    )
+    log_benchmark_summary(summarize_benchmark(benchmark_results))
+    return benchmark_results
+
+@_tracer.traced("multi_turn")
+def benchmark_multi_turn(model_name, index_path=KNOWLEDGE_INDEX_FILE, num_ctx=None, prefix_tokens=0,
+                         knowledge_tokens=None, keep_alive=DEFAULT_KEEP_ALIVE, questions=MULTI_TURN_CONVERSATION):
+    """
+    Skenario multi-turn: percakapan yang sama dijalankan dua kali lewat /api/chat, pertama stateless
+    (riwayat diringkas sebagai teks di dalam satu pesan user baru, sehingga prompt berubah di tengah dan
+    sebagian besar harus dievaluasi ulang), lalu lewat SessionManager yang mengirim riwayat pesan
+    persis seperti sebelumnya sehingga prefixnya diambil dari cache server. Token dan durasi prompt
+    eval diambil dari respons server (token yang berasal dari cache tidak dihitung). Mengembalikan
+    prompt eval per giliran dan waktu yang dihemat.
+    """
+    log_message(f"🔁 Benchmark multi-turn: {len(questions)} giliran, stateless vs riwayat sesi (cache prefix)...")
+    knowledge_index = KnowledgeIndex(index_path)
+    client = get_ollama_client()
+    runs = {}
+    for mode, reuse_context in (("stateless", False), ("session", True)):
+        manager = SessionManager(
+            client, model_name, max_context_tokens=num_ctx or CONTEXT_SIZE_CANDIDATES[0], prefix_tokens=prefix_tokens,
+            prompt_builder=lambda question: create_retrieval_prompt(question, knowledge_index, max_tokens=knowledge_tokens),
+            estimate_tokens=estimate_tokens, keep_alive=keep_alive, reuse_context=reuse_context,
         )
-        loading_thread.start()
-        
-        success, output = run_command(f'ollama run {model_name} "{question}"', timeout=120)
-        
-        stop_event.set()
-        loading_thread.join()
-        
-        response_time = time.time() - start_time
-        
-        if success:
-            log_message(f"    ✅ Respons diterima dalam {response_time:.2f} detik.")
-            benchmark_results.append({"question": question, "response_time": response_time, "success": True})
+        session_id = f"benchmark-{mode}"
+        runs[mode] = []
+        for question in questions:
+            try:
+                runs[mode].append(manager.ask(session_id, question))
+            except OllamaError as e:
+                log_message(f"  - ⚠️ Giliran {mode} gagal: {e}", error=True)
+                break
+    knowledge_index.close()
+
+    turns = []
+    for index, (stateless, session) in enumerate(zip(runs["stateless"], runs["session"]), 1):
+        turns.append({
+            "turn": index,
+            "question": session["question"],
+            "stateless_prompt_tokens": stateless["prompt_eval_count"],
+            "session_prompt_tokens": session["prompt_eval_count"],
+            "stateless_prompt_eval": stateless["prompt_eval_duration"],
+            "session_prompt_eval": session["prompt_eval_duration"],
+            "saved_seconds": stateless["prompt_eval_duration"] - session["prompt_eval_duration"],
+            "context_tokens": session["context_tokens"],
+            "reset": session["reset"],
+        })
+    report = {
+        "turns": turns,
+        "stateless_prompt_eval": sum(t["stateless_prompt_eval"] for t in turns),
+        "session_prompt_eval": sum(t["session_prompt_eval"] for t in turns),
+        "saved_seconds": sum(t["saved_seconds"] for t in turns),
+        "saved_tokens": sum(t["stateless_prompt_tokens"] - t["session_prompt_tokens"] for t in turns),
+    }
+    log_multi_turn_report(report)
+    return report
+
+def log_multi_turn_report(report):
+    """Menampilkan prompt eval per giliran untuk mode stateless dan sesi beserta waktu yang dihemat."""
+    print(f"   {'Giliran':<8} {'Token (stateless)':>18} {'Token (sesi)':>13} {'Eval stateless':>15} "
+          f"{'Eval sesi':>10} {'Hemat':>8} {'Konteks':>8}")
+    for turn in report["turns"]:
+        marker = " ↺" if turn["reset"] and turn["turn"] > 1 else ""
+        print(f"   {turn['turn']:<8} {turn['stateless_prompt_tokens']:>18} {turn['session_prompt_tokens']:>13} "
+              f"{turn['stateless_prompt_eval']:>14.3f}s {turn['session_prompt_eval']:>9.3f}s "
+              f"{turn['saved_seconds']:>7.3f}s {turn['context_tokens']:>8}{marker}")
+    total = report["stateless_prompt_eval"]
+    saved_share = report["saved_seconds"] / total * 100 if total else 0.0
+    log_message(
+        f"   - 💾 Riwayat sesi (cache prefix server) menghemat {report['saved_seconds']:.2f} detik prompt eval "
+        f"({saved_share:.0f}%, {report['saved_tokens']} token) dalam {len(report['turns'])} giliran."
+    )
+
+def answer_question(client, model_name, question, knowledge_index, response_cache=None, timeout=120,
+                    knowledge_tokens=None, keep_alive=DEFAULT_KEEP_ALIVE):
+    """
+    Menjawab satu pertanyaan melalui cache (jika ada) lalu model.
+    Mengembalikan metrik seperti timed_generate ditambah field `source`
+    ('model', 'exact', 'near', atau 'dataset').
+    """
+    if response_cache is not None:
+        start_time = time.perf_counter()
+        hit = response_cache.lookup(question)
+        if hit is not None:
+            return {"response": hit.answer, "response_time": time.perf_counter() - start_time,
+                    "ttft": None, "source": hit.kind}
+    results = retrieve_knowledge(question, knowledge_index, max_tokens=knowledge_tokens)
+    metrics = timed_generate(
+        client, model_name, format_retrieval_prompt(question, results), timeout=timeout, keep_alive=keep_alive
+    )
+    if response_cache is not None:
+        # Sidik jari dokumen sumber disimpan agar jawaban dibuang saat dokumen itu berubah
+        sources = [knowledge_index.fingerprint(result["doc_id"]).hex() for result in results]
+        response_cache.store(question, metrics["response"], metrics["response_time"], sources=sources)
+    metrics["source"] = "model"
+    return metrics
+
+def log_cache_metrics(response_cache):
+    """Menampilkan hit rate dan estimasi latensi yang dihemat oleh cache jawaban."""
+    metrics = response_cache.metrics()
+    log_message(
+        f"   - 🗃️ Cache: hit rate {metrics['hit_rate'] * 100:.1f}% "
+        f"(identik {metrics['exact_hits']}, near {metrics['near_hits']}, dataset {metrics['dataset_hits']}, "
+        f"miss {metrics['misses']}) | hemat ~{metrics['latency_saved']:.1f} detik | {metrics['entries']} entri"
+    )
+
+@_tracer.traced("load_test")
+def run_load_test(model_name, csv_dataset, index_path=KNOWLEDGE_INDEX_FILE, concurrency=4, rate=None,
+                  duration=60, request_timeout=120, seed=None, response_cache=None, knowledge_tokens=None,
+                  keep_alive=DEFAULT_KEEP_ALIVE):
+    """
+    Uji beban konkuren terhadap model yang sudah dibuat.
+    Dengan `rate` (permintaan/detik) kedatangan bersifat open-loop (Poisson) sehingga antrean
+    terlihat ketika server lebih lambat dari laju kedatangan; tanpa `rate` setiap worker
+    mengirim permintaan berikutnya segera setelah yang sebelumnya selesai (closed-loop).
+    Pertanyaan diambil acak dari dataset. Dengan `response_cache`, permintaan dilayani lewat cache jawaban.
+    """
+    mode = f"open-loop {rate:.2f} permintaan/detik" if rate else "closed-loop"
+    log_message(f"🔥 Menjalankan uji beban: konkurensi {concurrency}, {mode}, durasi {duration} detik...")
+    rng = random.Random(seed)
+    questions = [record.question for record in csv_dataset]
+    knowledge_index = KnowledgeIndex(index_path)
+    # Klien terpisah dengan pool sebesar konkurensi agar setiap worker memakai koneksi keep-alive sendiri
+    client = OllamaClient(timeout=request_timeout, pool_size=concurrency)
+    results = []
+    results_lock = threading.Lock()
+    in_flight = [0, 0]  # [sedang berjalan, puncak backlog (berjalan + mengantre)]
+
+    def execute(question, scheduled_at):
+        started_at = time.perf_counter()
+        record = {"question": question, "queue_wait": started_at - scheduled_at, "success": False, "timed_out": False}
+        try:
+            metrics = answer_question(client, model_name, question, knowledge_index, response_cache,
+                                      timeout=request_timeout, knowledge_tokens=knowledge_tokens, keep_alive=keep_alive)
+            metrics.pop("context", None)
+            metrics.pop("response", None)
+            record.update(metrics, success=True, timed_out=False)
+        except Exception as e:
+            # Error apa pun (bukan hanya OllamaError) dicatat sebagai permintaan gagal agar worker tetap hidup
+            record.update(success=False, timed_out=getattr(e, "timed_out", False), error=str(e) or type(e).__name__,
+                          response_time=time.perf_counter() - started_at)
+        finally:
+            record["latency"] = time.perf_counter() - scheduled_at
+            with results_lock:
+                results.append(record)
+                in_flight[0] -= 1
+
+    start_time = time.perf_counter()
+    deadline = start_time + duration
+    futures = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if rate:
+            next_arrival = start_time
+            while next_arrival < deadline:
+                time.sleep(max(0.0, next_arrival - time.perf_counter()))
+                with results_lock:
+                    in_flight[0] += 1
+                    in_flight[1] = max(in_flight[1], in_flight[0])
+                futures.append(executor.submit(execute, rng.choice(questions), next_arrival))
+                next_arrival += rng.expovariate(rate)
         else:
-            log_message(f"    ❌ Gagal mendapat respons. Error: {output}", error=True)
-            benchmark_results.append({"question": question, "response_time": None, "success": False})
+            def closed_loop_worker(worker_seed):
+                worker_rng = random.Random(worker_seed)
+                while time.perf_counter() < deadline:
+                    with results_lock:
+                        in_flight[0] += 1
+                        in_flight[1] = max(in_flight[1], in_flight[0])
+                    execute(worker_rng.choice(questions), time.perf_counter())
 
-    return benchmark_results
+            for _ in range(concurrency):
+                futures.append(executor.submit(closed_loop_worker, rng.random()))
+    elapsed = time.perf_counter() - start_time
+    for future in futures:
+        future.result()  # Kegagalan di luar execute() tidak boleh hilang diam-diam
 
-def read_and_process_csv():
-    """Membaca dan memvalidasi data CSV."""
-    log_message("📂 Membaca dan memproses data CSV...")
-    csv_files = ['NewBrain.csv','UMM_Assistant_Data.csv', 'SD_Muhammadiyah_Data.csv', 'training_data.csv', 'dataset.csv']
-    csv_file_found = next((f for f in csv_files if os.path.exists(f)), None)
+    client.close()
+    knowledge_index.close()
+    _tracer.current().set(rows=len(results), api_calls=client.request_count)
+    report = summarize_load_test(results, elapsed, concurrency, rate, in_flight[1])
+    log_load_test_report(report)
+    if response_cache is not None:
+        report["cache"] = response_cache.metrics()
+        log_cache_metrics(response_cache)
+    return report
 
-    if not csv_file_found:
-        raise FileNotFoundError("File data CSV tidak ditemukan! Pastikan file data ada di direktori yang sama.")
-    log_message(f"  - 📄 Menggunakan file: {csv_file_found}")
+def summarize_load_test(results, elapsed, concurrency, rate, peak_backlog):
+    """Menghitung throughput, persentil latensi, tingkat error/timeout, dan perilaku antrean."""
+    successful = [r for r in results if r["success"]]
+    timeouts = sum(1 for r in results if r["timed_out"])
+    generated_tokens = sum(r.get("eval_count") or 0 for r in successful)
+    return {
+        "concurrency": concurrency,
+        "target_rate": rate,
+        "elapsed": elapsed,
+        "requests": len(results),
+        "successful": len(successful),
+        "throughput": len(successful) / elapsed if elapsed else 0.0,
+        "token_throughput": generated_tokens / elapsed if elapsed else 0.0,
+        "error_rate": (len(results) - len(successful)) / len(results) if results else 0.0,
+        "timeout_rate": timeouts / len(results) if results else 0.0,
+        "peak_backlog": peak_backlog,
+        "metrics": summarize_metrics(successful, ("latency", "queue_wait", "response_time", "ttft", "eval_rate")),
+    }
+
+def log_load_test_report(report):
+    """Menampilkan hasil uji beban."""
+    log_message(
+        f"📊 Uji beban selesai: {report['requests']} permintaan dalam {report['elapsed']:.1f} detik "
+        f"({report['successful']} berhasil)"
+    )
+    log_message(f"   - Throughput: {report['throughput']:.2f} permintaan/detik | {report['token_throughput']:.1f} token/detik")
+    log_message(f"   - Error: {report['error_rate'] * 100:.1f}% | Timeout: {report['timeout_rate'] * 100:.1f}%")
+    log_message(f"   - Puncak backlog (berjalan + mengantre): {report['peak_backlog']} (konkurensi {report['concurrency']})")
+    labels = {"latency": "Latensi end-to-end", "queue_wait": "Waktu antre", "ttft": "Time-to-first-token"}
+    for metric, label in labels.items():
+        stats = report["metrics"].get(metric)
+        if stats:
+            log_message(
+                f"   - {label:<20} p50 {stats['p50']:8.3f} | p95 {stats['p95']:8.3f} | p99 {stats['p99']:8.3f} s"
+            )
+
+@_tracer.traced("evaluation")
+def run_fidelity_evaluation(model_name, csv_dataset, index_path=KNOWLEDGE_INDEX_FILE, sample_size=EVAL_SAMPLE_SIZE,
+                            concurrency=EVAL_CONCURRENCY, seed=EVAL_SEED, holdout=True, knowledge_tokens=None,
+                            threshold=DEFAULT_PASS_THRESHOLD, request_timeout=120, keep_alive=DEFAULT_KEEP_ALIVE):
+    """
+    Mengukur apakah model masih menjawab dengan benar: sampel pasangan Q/A dari dataset ditanyakan
+    secara konkuren lalu jawabannya dinilai terhadap kolom `answer` (F-beta token dan n-gram karakter).
+    Secara default (`holdout`) entri yang sedang ditanyakan dikeluarkan dari konteks retrieval sehingga model
+    harus menjawab dari entri lain yang berdekatan; `holdout=False` menyisakan jawaban asli di prompt
+    (akurasi bocor, hanya untuk menguji jalur retrieval). Cache jawaban sengaja tidak dipakai.
+    Mengembalikan ringkasan akurasi beserta latensi dan throughput pada beban evaluasi yang sama.
+    """
+    samples = sample_evaluation_set(csv_dataset, sample_size, seed=seed)
+    mode = fidelity_mode_label(holdout)
+    log_message(f"🎯 Evaluasi kualitas '{model_name}': {len(samples)} pertanyaan, konkurensi {concurrency}, {mode}...")
+    knowledge_index = KnowledgeIndex(index_path)
+    client = OllamaClient(timeout=request_timeout, pool_size=concurrency)
+
+    def evaluate(record):
+        exclude = set()
+        if holdout:
+            doc_id = knowledge_index.find_document(document_fingerprint(record.question, record.answer))
+            if doc_id is not None:
+                exclude.add(doc_id)
+        prompt = create_retrieval_prompt(
+            record.question, knowledge_index, max_tokens=knowledge_tokens, exclude_doc_ids=exclude
+        )
+        result = {"question": record.question}
+        try:
+            metrics = timed_generate(
+                client, model_name, prompt, timeout=request_timeout, keep_alive=keep_alive, options={"seed": seed}
+            )
+        except OllamaError as e:
+            result.update(success=False, error=str(e))
+            return result
+        result.update(
+            success=True, response_time=metrics["response_time"], ttft=metrics["ttft"],
+            eval_count=metrics["eval_count"], eval_rate=metrics["eval_rate"],
+            **score_answer(metrics["response"], record.answer, threshold),
+        )
+        result["response"] = metrics["response"]
+        return result
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(_tracer.bind(evaluate), samples))
+    elapsed = time.perf_counter() - start_time
+    client.close()
+    knowledge_index.close()
+    _tracer.current().set(rows=len(samples), api_calls=client.request_count)
+
+    successful = [r for r in results if r["success"]]
+    # Permintaan yang gagal dihitung sebagai jawaban salah agar akurasi tidak naik karena error
+    scores = [r if r["success"] else {"correct": False, "similarity": 0.0, "token_f": 0.0, "char_f": 0.0}
+              for r in results]
+    report = {
+        "model": model_name,
+        "holdout": holdout,
+        "seed": seed,
+        "threshold": threshold,
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "errors": len(results) - len(successful),
+        "throughput": len(successful) / elapsed if elapsed else 0.0,
+        "token_throughput": sum(r.get("eval_count") or 0 for r in successful) / elapsed if elapsed else 0.0,
+        **summarize_scores(scores),
+        "metrics": summarize_metrics(successful, ("response_time", "ttft", "eval_rate")),
+        "worst": [
+            {"question": r["question"], "similarity": r["similarity"], "response": r["response"][:200]}
+            for r in sorted(successful, key=lambda r: r["similarity"])[:3]
+        ],
+        "results": [{k: v for k, v in r.items() if k != "response"} for r in results],
+    }
+    log_fidelity_report(report)
+    return report
+
+def fidelity_mode_label(holdout):
+    """Label mode evaluasi untuk laporan; mode tanpa holdout ditandai bocor."""
+    return "held-out" if holdout else "BOCOR: entri asli di konteks"
+
+def log_fidelity_report(report):
+    """Menampilkan akurasi jawaban berdampingan dengan latensi dan throughput evaluasi."""
+    latency = report["metrics"].get("response_time", {})
+    log_message(
+        f"🎯 Akurasi: {report['accuracy'] * 100:.1f}% ({report['samples']} sampel, {fidelity_mode_label(report['holdout'])}, "
+        f"ambang {report['threshold']:.2f}) | "
+        f"kemiripan rata-rata {report['similarity']:.3f} (token {report['token_f']:.3f}, karakter {report['char_f']:.3f})"
+    )
+    if latency:
+        log_message(
+            f"   - Latensi p50 {latency['p50']:.2f} | p95 {latency['p95']:.2f} detik | "
+            f"{report['throughput']:.2f} jawaban/detik | {report['token_throughput']:.1f} token/detik"
+        )
+    if not report["holdout"]:
+        log_message("   - ⚠️ Jawaban asli ikut dikirim sebagai konteks: akurasi ini bukan ukuran kualitas model", error=True)
+    if report["errors"]:
+        log_message(f"   - ⚠️ {report['errors']} permintaan gagal (dihitung sebagai jawaban salah)", error=True)
+    for worst in report["worst"]:
+        log_message(f"   - 🔻 {worst['similarity']:.2f} | {worst['question'][:60]}")
+
+def retrieval_prompt_builder(knowledge_index, knowledge_tokens=None):
+    """
+    prompt_builder(pertanyaan) untuk gateway: prompt retrieval dengan anggaran token pipeline,
+    beserta sidik jari (hex) dokumen yang disisipkan sebagai sumber untuk cache jawaban.
+    """
+    def build(question):
+        results = retrieve_knowledge(question, knowledge_index, max_tokens=knowledge_tokens)
+        sources = [knowledge_index.fingerprint(result["doc_id"]).hex() for result in results]
+        return format_retrieval_prompt(question, results), sources
+
+    return build
+
+def serve_gateway(model_name, index_path, knowledge_tokens=None, keep_alive=None, host="127.0.0.1",
+                  port=GATEWAY_PORT, workers=gateway.DEFAULT_WORKERS, max_queue=gateway.DEFAULT_MAX_QUEUE,
+                  request_timeout=gateway.DEFAULT_REQUEST_TIMEOUT, dataset_hash=None, cache_size=2048,
+                  cache_ttl=24 * 3600):
+    """
+    Menjalankan gateway OpenAI-compatible di depan model sampai dihentikan (Ctrl+C).
+    Pesan user terakhir diberi konteks retrieval dengan anggaran token yang sama seperti benchmark.
+    Dengan `dataset_hash`, cache jawaban (RESPONSE_CACHE_FILE, sama dengan uji beban) dipasang
+    di depan backend dan disimpan kembali saat gateway berhenti.
+    """
+    knowledge_index = KnowledgeIndex(index_path)
+    backend = gateway.ollama_backend(
+        get_ollama_client(), prompt_builder=retrieval_prompt_builder(knowledge_index, knowledge_tokens),
+        keep_alive=keep_alive,
+    )
+    response_cache = None
+    if dataset_hash is not None:
+        response_cache = ResponseCache(
+            dataset_hash, max_entries=cache_size, ttl=cache_ttl,
+            knowledge_index=knowledge_index, cache_path=RESPONSE_CACHE_FILE
+        )
+    model_gateway = gateway.Gateway(
+        backend, model_name, workers=workers, max_queue=max_queue, request_timeout=request_timeout,
+        response_cache=response_cache,
+    ).start()
+    server = gateway.create_server(model_gateway, host, port)
+    log_message(f"🌐 Gateway berjalan di http://{host}:{port}/v1/chat/completions (model {model_name})")
+    log_message(f"   - Antrean maks {max_queue}, {workers} worker | /health dan /metrics tersedia | Ctrl+C untuk berhenti")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log_message("🛑 Gateway dihentikan.")
+    finally:
+        server.server_close()
+        model_gateway.stop()
+        if response_cache is not None:
+            log_cache_metrics(response_cache)
+            response_cache.save()
+        knowledge_index.close()
+
+def collect_hardware_summary(gpu_info):
+    """Ringkasan perangkat keras untuk dicatat bersama hasil benchmark."""
+    summary = {
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cpu_logical": os.cpu_count(),
+        "gpu": {key: value for key, value in gpu_info.items()},
+    }
+    try:
+        import psutil
+        summary["cpu_physical"] = psutil.cpu_count(logical=False)
+        summary["ram_gb"] = round(psutil.virtual_memory().total / (1024**3), 1)
+    except ImportError:
+        pass
+    return summary
+
+def append_benchmark_history(entry, history_path=BENCHMARK_HISTORY_FILE):
+    """Menambahkan satu run benchmark ke file riwayat JSONL; mengembalikan run_id."""
+    timestamp = datetime.now()
+    entry = dict(entry)
+    entry.setdefault("timestamp", timestamp.isoformat())
+    entry.setdefault(
+        "run_id",
+        f"{timestamp.strftime('%Y%m%d-%H%M%S')}-"
+        f"{hashlib.sha256(json.dumps(entry, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:6]}"
+    )
+    with open(history_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+    return entry["run_id"]
+
+def load_benchmark_history(history_path=BENCHMARK_HISTORY_FILE):
+    """Membaca semua run dari file riwayat; baris rusak dilewati."""
+    runs = []
+    try:
+        with open(history_path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    runs.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    except OSError:
+        pass
+    return runs
+
+def find_history_run(runs, run_ref):
+    """Mencari run berdasarkan awalan run_id, atau 'latest'/'previous'."""
+    if not runs:
+        return None
+    if run_ref == "latest":
+        return runs[-1]
+    if run_ref == "previous":
+        return runs[-2] if len(runs) > 1 else None
+    matches = [run for run in runs if run.get("run_id", "").startswith(run_ref)]
+    return matches[-1] if matches else None
+
+def mann_whitney_u(sample_a, sample_b):
+    """
+    Uji Mann-Whitney U dua sisi dengan aproksimasi normal dan koreksi ties.
+    Tidak mengasumsikan distribusi normal, cocok untuk latensi yang miring ke kanan.
+    Mengembalikan p-value, atau None jika sampel terlalu sedikit.
+    """
+    n_a, n_b = len(sample_a), len(sample_b)
+    if n_a < 3 or n_b < 3:
+        return None
+    combined = sorted([(value, 0) for value in sample_a] + [(value, 1) for value in sample_b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        average_rank = (i + j) / 2.0 + 1.0
+        for k in range(i, j + 1):
+            ranks[k] = average_rank
+        tied = j - i + 1
+        tie_term += tied ** 3 - tied
+        i = j + 1
+    rank_sum_a = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u_a = rank_sum_a - n_a * (n_a + 1) / 2.0
+    n = n_a + n_b
+    variance = n_a * n_b / 12.0 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u_a - n_a * n_b / 2.0) - 0.5) / math.sqrt(variance)
+    return max(0.0, min(1.0, math.erfc(max(z, 0.0) / math.sqrt(2.0))))
+
+def compare_benchmark_runs(baseline, candidate):
+    """
+    Membandingkan metrik per-permintaan dua run. Regresi ditandai jika perbedaannya
+    signifikan (p < REGRESSION_ALPHA) dan median memburuk lebih dari REGRESSION_MIN_CHANGE.
+    Jika kedua run memiliki evaluasi kualitas, kemiripan jawaban per pertanyaan ikut dibandingkan.
+    """
+    def samples(run, metric):
+        source = run.get("results", [])
+        if metric == "similarity":
+            source = (run.get("evaluation") or {}).get("results", [])
+        return [r[metric] for r in source if r.get("success") and not r.get("phase") and r.get(metric) is not None]
+
+    comparisons = []
+    for metric, label, lower_is_better in REGRESSION_METRICS + (("similarity", "Kemiripan jawaban", False),):
+        values_a = samples(baseline, metric)
+        values_b = samples(candidate, metric)
+        if not values_a or not values_b:
+            continue
+        median_a, median_b = percentile(values_a, 50), percentile(values_b, 50)
+        change = (median_b - median_a) / median_a if median_a else 0.0
+        p_value = mann_whitney_u(values_a, values_b)
+        worse = change > 0 if lower_is_better else change < 0
+        significant = p_value is not None and p_value < REGRESSION_ALPHA and abs(change) >= REGRESSION_MIN_CHANGE
+        comparisons.append({
+            "metric": metric,
+            "label": label,
+            "baseline_median": median_a,
+            "candidate_median": median_b,
+            "change": change,
+            "p_value": p_value,
+            "status": ("regresi" if worse else "perbaikan") if significant else "tidak signifikan",
+        })
+    return comparisons
+
+def run_history_comparison(baseline_ref, candidate_ref="latest", history_path=BENCHMARK_HISTORY_FILE):
+    """Membandingkan dua run dari riwayat; mengembalikan True jika ada regresi."""
+    runs = load_benchmark_history(history_path)
+    baseline = find_history_run(runs, baseline_ref)
+    candidate = find_history_run(runs, candidate_ref)
+    if baseline is None or candidate is None:
+        raise ValueError(f"Run '{baseline_ref if baseline is None else candidate_ref}' tidak ditemukan di {history_path}.")
+
+    log_message(f"🔬 Membandingkan run {candidate['run_id']} dengan baseline {baseline['run_id']}...")
+    for key in ("model", "quantization", "gpu_layers", "dataset_hash", "modelfile_hash"):
+        if baseline.get(key) != candidate.get(key):
+            log_message(f"  - 🔀 {key}: {str(baseline.get(key))[:16]} → {str(candidate.get(key))[:16]}")
+
+    for run, role in ((baseline, "baseline"), (candidate, "kandidat")):
+        if run.get("evaluation"):
+            evaluation = run["evaluation"]
+            # Run lama tanpa kunci "holdout" dievaluasi dengan entri asli di konteks
+            log_message(f"  - 🎯 Akurasi {role}: {evaluation['accuracy'] * 100:.1f}% ({evaluation['samples']} sampel, "
+                        f"{fidelity_mode_label(evaluation.get('holdout', False))})")
+
+    comparisons = compare_benchmark_runs(baseline, candidate)
+    icons = {"regresi": "🔴", "perbaikan": "🟢", "tidak signifikan": "⚪"}
+    for c in comparisons:
+        p_value = f"{c['p_value']:.3f}" if c['p_value'] is not None else "n/a"
+        log_message(
+            f"  {icons[c['status']]} {c['label']:<22} {c['baseline_median']:9.3f} → {c['candidate_median']:9.3f} "
+            f"({c['change'] * 100:+.1f}%, p={p_value}) {c['status']}"
+        )
+    if any(c["p_value"] is None for c in comparisons):
+        log_message("  - ℹ️ Sebagian metrik memiliki < 3 sampel; gunakan --benchmark-repeats untuk uji yang bermakna.")
+    has_regression = any(c["status"] == "regresi" for c in comparisons)
+    if has_regression:
+        log_message("⚠️ Regresi performa terdeteksi!", error=True)
+    else:
+        log_message("✅ Tidak ada regresi signifikan.")
+    return has_regression
+
+_TOKEN_PIECE_PATTERN = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]|_", re.UNICODE)
+_token_estimate_scale = None
+
+def _raw_token_estimate(text):
+    """
+    Perkiraan mentah mengikuti pola tokenizer BPE Llama 3: satu token per kata pendek,
+    kata panjang dipecah per ~6 huruf, angka per kelompok 3 digit, tanda baca per karakter.
+    """
+    count = 0
+    for piece in _TOKEN_PIECE_PATTERN.findall(text):
+        count += 1 + (len(piece) - 1) // 6 if piece[0].isalpha() else 1
+    return count
 
-    cleaned_dataset = []
-    encodings = ['utf-8', 'utf-8-sig', 'latin-1']
-    for encoding in encodings:
+def get_token_estimate_scale():
+    """Faktor kalibrasi estimator token (dari TOKEN_CALIBRATION_FILE jika ada)."""
+    global _token_estimate_scale
+    if _token_estimate_scale is None:
+        _token_estimate_scale = DEFAULT_TOKEN_ESTIMATE_SCALE
         try:
-            with open(csv_file_found, 'r', encoding=encoding, newline='') as file:
-                reader = csv.reader(file)
-                header = next(reader)
-                
-                q_idx = next((i for i, h in enumerate(header) if 'question' in h.lower() or 'pertanyaan' in h.lower()), 0)
-                a_idx = next((i for i, h in enumerate(header) if 'answer' in h.lower() or 'jawaban' in h.lower()), 1)
-                
-                log_message(f"  - 📈 Header CSV: {header}. Kolom Pertanyaan: {q_idx}, Kolom Jawaban: {a_idx}")
-                
-                for row_num, row in enumerate(reader, 2):
-                    if len(row) > max(q_idx, a_idx):
-                        question = row[q_idx].strip()
-                        answer = row[a_idx].strip()
-                        if question and answer:
-                            cleaned_dataset.append({"question": question, "answer": answer})
-            log_message(f"  - ✅ Berhasil dibaca dengan encoding '{encoding}'.")
+            with open(TOKEN_CALIBRATION_FILE, "r", encoding="utf-8") as f:
+                _token_estimate_scale = float(json.load(f)["scale"])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+    return _token_estimate_scale
+
+def _machine_identity():
+    """Identitas mesin yang murah dihitung, untuk memastikan cache perangkat keras milik mesin ini."""
+    return {"node": platform.node(), "machine": platform.machine(), "system": platform.system(),
+            "cpu_logical": os.cpu_count()}
+
+def _static_gpu_info(gpu_info):
+    """Bagian gpu_info yang tidak berubah selama mesin sama (jenis GPU dan total VRAM)."""
+    return {key: gpu_info[key] for key in HARDWARE_CACHE_GPU_KEYS if key in gpu_info}
+
+def _is_valid_hardware_cache(cached):
+    return (isinstance(cached, dict) and HARDWARE_CACHE_REQUIRED_KEYS <= cached.keys()
+            and isinstance(cached["probed_at"], (int, float)) and isinstance(cached.get("gpu_info"), dict)
+            and "has_gpu" in cached["gpu_info"])
+
+def load_hardware_cache(ttl=HARDWARE_CACHE_TTL_SECONDS, cache_path=HARDWARE_CACHE_FILE):
+    """Memuat hasil probe perangkat keras jika masih dalam TTL dan berasal dari mesin yang sama."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not _is_valid_hardware_cache(cached):
+        return None  # File rusak, ditimpa dengan JSON lain, atau tidak lengkap: probe ulang
+    if cached["identity"] != _machine_identity() or time.time() - cached["probed_at"] > ttl:
+        return None
+    cached["gpu_info"] = _static_gpu_info(cached.get("gpu_info") or {})  # Cache lama bisa berisi VRAM bebas
+    return cached
+
+def save_hardware_cache(gpu_info, quantization_method, gpu_layers, cache_path=HARDWARE_CACHE_FILE):
+    """Menyimpan fakta statis hasil probe perangkat keras ke disk (tanpa nilai volatil seperti VRAM bebas)."""
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"identity": _machine_identity(), "probed_at": time.time(), "gpu_info": _static_gpu_info(gpu_info),
+                   "quantization": quantization_method, "gpu_layers": gpu_layers}, f, indent=2)
+    os.replace(tmp_path, cache_path)
+
+def _timed_call(function, *args):
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+@_tracer.traced("preflight")
+def run_preflight(use_hardware_cache=True, hardware_cache_ttl=HARDWARE_CACHE_TTL_SECONDS):
+    """
+    Menjalankan pemeriksaan awal secara paralel: layanan Ollama, GPU, dan sumber daya sistem.
+    Hasil probe perangkat keras diambil dari cache disk bila masih segar, sehingga biasanya
+    hanya pemeriksaan layanan yang benar-benar berjalan. Daftar model dari pemeriksaan layanan
+    dikembalikan untuk dipakai ulang pada pemeriksaan model dasar.
+    """
+    log_message("🛫 Menjalankan preflight paralel...")
+    start_time = time.perf_counter()
+    timings = {}
+    cached = load_hardware_cache(hardware_cache_ttl) if use_hardware_cache else None
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        service_future = executor.submit(_tracer.bind(_timed_call), check_ollama_service)
+        if cached is None:
+            gpu_future = executor.submit(_tracer.bind(_timed_call), check_gpu_availability)
+            resources_future = executor.submit(_tracer.bind(_timed_call), select_quantization_method)
+            gpu_info, timings["Probe GPU"] = gpu_future.result()
+            (quantization_method, gpu_layers), timings["Sumber daya sistem"] = resources_future.result()
+            save_hardware_cache(gpu_info, quantization_method, gpu_layers)
+        else:
+            gpu_info = cached["gpu_info"]
+            quantization_method, gpu_layers = cached["quantization"], cached["gpu_layers"]
+            age_minutes = (time.time() - cached["probed_at"]) / 60
+            log_message(
+                f"  - ♻️ Memakai cache perangkat keras ({age_minutes:.0f} menit): "
+                f"GPU {'AKTIF' if gpu_info['has_gpu'] else 'NONAKTIF'}, {quantization_method.upper()}, {gpu_layers} layer"
+            )
+        (healthy, message, model_names), timings["Layanan Ollama"] = service_future.result()
+
+    if not healthy:
+        log_message("Layanan Ollama bermasalah, mencoba restart...", error=True)
+        (healthy, message, model_names), timings["Restart Ollama"] = _timed_call(restart_ollama_service)
+        if not healthy:
+            raise ConnectionError(f"Gagal terhubung ke Ollama: {message}")
+
+    total = time.perf_counter() - start_time
+    log_message(f"⏱️ Preflight selesai dalam {total:.2f} detik:")
+    for label, duration in timings.items():
+        log_message(f"   - {label:<20} {duration:6.2f} detik")
+    if cached is not None:
+        log_message(f"   - {'Probe perangkat keras':<20}  (cache)")
+    return gpu_info, quantization_method, gpu_layers, model_names
+
+def compute_hardware_fingerprint(gpu_info):
+    """Sidik jari perangkat keras untuk memastikan hasil tuning hanya dipakai di mesin yang sama."""
+    hardware = collect_hardware_summary(gpu_info)
+    identity = {
+        "machine": hardware["machine"],
+        "cpu_logical": hardware["cpu_logical"],
+        "cpu_physical": hardware.get("cpu_physical"),
+        "ram_gb": round(hardware.get("ram_gb") or 0),
+        "gpu": {k: gpu_info.get(k) for k in HARDWARE_CACHE_GPU_KEYS},
+    }
+    return hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def build_tuning_grid(gpu_info, gpu_layers, token_budget, quantizations):
+    """
+    Menyusun grid (kuantisasi, num_gpu, num_thread, num_ctx). num_ctx hanya diambil dari ukuran
+    yang memenuhi kebutuhan anggaran token dan muat di memori, sehingga wilayah yang pasti gagal tidak diuji.
+    """
+    physical = get_physical_cpu_count()
+    logical = os.cpu_count() or physical
+    thread_options = sorted({max(1, physical // 2), physical, logical})
+    if gpu_info['has_gpu']:
+        max_layers = MODEL_ARCHITECTURE["layers"] + 1  # +1 untuk layer output
+        gpu_options = sorted({0, max(1, gpu_layers // 2), min(gpu_layers, max_layers), max_layers})
+    else:
+        gpu_options = [0]
+    ctx_options = [size for size in CONTEXT_SIZE_CANDIDATES
+                   if token_budget["required_tokens"] <= size <= max(token_budget["max_context_by_memory"], 2048)][:2]
+    ctx_options = ctx_options or [token_budget["num_ctx"]]
+    return [
+        {"quantization": quant, "num_gpu": num_gpu, "num_thread": num_thread, "num_ctx": num_ctx}
+        for quant in quantizations
+        for num_gpu in gpu_options
+        for num_thread in thread_options
+        for num_ctx in ctx_options
+    ]
+
+def probe_configuration(client, config, system_prompt, prompt, probes, timeout):
+    """Menjalankan permintaan pemanasan (memuat model) lalu `probes` permintaan terukur untuk satu konfigurasi."""
+    options = {"num_gpu": config["num_gpu"], "num_thread": config["num_thread"], "num_ctx": config["num_ctx"],
+               "num_predict": TUNING_MAX_TOKENS}
+    model = config["base_model"]
+    # Pemanasan agar waktu load model tidak tercampur ke pengukuran
+    timed_generate(client, model, prompt, timeout=timeout, system=system_prompt, options=options)
+    samples = []
+    for _ in range(probes):
+        metrics = timed_generate(client, model, prompt, timeout=timeout, system=system_prompt, options=options)
+        samples.append({"eval_rate": metrics["eval_rate"], "ttft": metrics["ttft"]})
+    return samples
+
+@_tracer.traced("tuning")
+def run_auto_tuner(gpu_info, gpu_layers, token_budget, index_path=KNOWLEDGE_INDEX_FILE, quantizations=None,
+                   probes=2, rounds=3, timeout=300):
+    """
+    Mencari konfigurasi tercepat secara empiris dengan successive halving:
+    setiap putaran semua kandidat diukur, konfigurasi yang gagal atau TTFT-nya jauh lebih buruk
+    dibuang, lalu separuh terbaik (berdasarkan median token/detik) lanjut ke putaran berikutnya.
+    Jika num_gpu tertentu gagal (mis. kehabisan VRAM), semua num_gpu yang lebih besar ikut dibuang.
+    """
+    client = get_ollama_client()
+    quantizations = quantizations or [None]
+    system_prompt, _ = create_system_prompt()
+    with KnowledgeIndex(index_path) as knowledge_index:
+        prompt = create_retrieval_prompt(TUNING_QUESTION, knowledge_index, max_tokens=token_budget["knowledge_tokens"])
+
+    available_models = client.list_model_names(timeout=60)
+    for quant in quantizations:
+        base_model = QUANTIZATION_BASE_MODELS.get(quant, DEFAULT_BASE_MODEL) if quant else DEFAULT_BASE_MODEL
+        if not model_name_matches(base_model, available_models):
+            log_message(f"  - 📥 Mengunduh {base_model} untuk tuning...")
+            for _ in client.pull(base_model, timeout=1800):
+                pass
+
+    grid = build_tuning_grid(gpu_info, gpu_layers, token_budget, quantizations)
+    for config in grid:
+        quant = config["quantization"]
+        config["base_model"] = QUANTIZATION_BASE_MODELS.get(quant, DEFAULT_BASE_MODEL) if quant else DEFAULT_BASE_MODEL
+        config["samples"] = []
+    log_message(f"🎛️ Auto-tuning: {len(grid)} konfigurasi, maks. {rounds} putaran successive halving...")
+
+    candidates = list(grid)
+    failed_gpu_floor = {}  # base_model -> num_gpu terkecil yang gagal
+    for round_number in range(1, rounds + 1):
+        survivors = []
+        for config in candidates:
+            floor = failed_gpu_floor.get(config["base_model"])
+            if floor is not None and config["num_gpu"] >= floor:
+                continue
+            label = (f"{config['base_model']} gpu={config['num_gpu']} thread={config['num_thread']} "
+                     f"ctx={config['num_ctx']}")
+            try:
+                config["samples"] += probe_configuration(client, config, system_prompt, prompt, probes, timeout)
+            except OllamaError as e:
+                log_message(f"  - ❌ {label}: gagal ({e}), wilayah num_gpu >= {config['num_gpu']} dibuang.", error=True)
+                failed_gpu_floor[config["base_model"]] = min(config["num_gpu"], floor if floor is not None else config["num_gpu"])
+                continue
+            config["eval_rate"] = percentile([s["eval_rate"] for s in config["samples"] if s["eval_rate"]], 50) or 0.0
+            config["ttft"] = percentile([s["ttft"] for s in config["samples"] if s["ttft"] is not None], 50)
+            log_message(f"  - [{round_number}] {label}: {config['eval_rate']:.1f} token/detik, TTFT {config['ttft'] or 0:.2f} detik")
+            survivors.append(config)
+
+        if not survivors:
+            raise RuntimeError("Semua konfigurasi tuning gagal.")
+        best_ttft = min((c["ttft"] for c in survivors if c["ttft"] is not None), default=None)
+        if best_ttft:
+            survivors = [c for c in survivors if c["ttft"] is None or c["ttft"] <= best_ttft * TUNING_TTFT_PRUNE_FACTOR]
+        survivors.sort(key=lambda c: (-c["eval_rate"], c["ttft"] or 0.0))
+        candidates = survivors[:max(1, len(survivors) // 2)] if round_number < rounds else survivors
+        if len(candidates) == 1:
             break
-        except (UnicodeDecodeError, StopIteration):
-            log_message(f"  - ⚠️ Gagal membaca dengan encoding '{encoding}', mencoba yang berikutnya...")
+
+    best = candidates[0]
+    result = {
+        "quantization": best["quantization"],
+        "base_model": best["base_model"],
+        "num_gpu": best["num_gpu"],
+        "num_thread": best["num_thread"],
+        "num_ctx": best["num_ctx"],
+        "eval_rate": best["eval_rate"],
+        "ttft": best["ttft"],
+        "hardware_fingerprint": compute_hardware_fingerprint(gpu_info),
+        "evaluated": len([c for c in grid if c["samples"]]),
+        "grid_size": len(grid),
+        "tuned_at": datetime.now().isoformat(),
+    }
+    with open(TUNING_RESULT_FILE, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    log_message(
+        f"🏆 Konfigurasi terbaik: {best['base_model']} num_gpu={best['num_gpu']} num_thread={best['num_thread']} "
+        f"num_ctx={best['num_ctx']} ({best['eval_rate']:.1f} token/detik) → {TUNING_RESULT_FILE}"
+    )
+    return result
+
+def load_tuning_result(gpu_info):
+    """Memuat hasil tuning jika ada dan dibuat di perangkat keras yang sama."""
+    try:
+        with open(TUNING_RESULT_FILE, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if result.get("hardware_fingerprint") != compute_hardware_fingerprint(gpu_info):
+        log_message(f"  - ⚠️ {TUNING_RESULT_FILE} dibuat di perangkat keras lain, diabaikan.")
+        return None
+    return result
+
+def plan_build_matrix(quantizations, context_sizes, gpu_info):
+    """Daftar varian (kuantisasi x num_ctx) beserta nama model, nama Modelfile, dan estimasi memorinya."""
+    memory_budget, _ = get_memory_budget_bytes(gpu_info)
+    variants = []
+    for quant in quantizations:
+        for num_ctx in context_sizes:
+            estimated = estimate_model_weights_bytes(quant) + KV_CACHE_BYTES_PER_TOKEN * num_ctx + RUNTIME_OVERHEAD_BYTES
+            variants.append({
+                "model": f"{get_final_model_name(BASE_MODEL_NAME, quant, gpu_info)}-ctx{num_ctx}",
+                "modelfile": f"Modelfile_UMM_Assistant_Demo_{quant}_ctx{num_ctx}",
+                "quantization": quant,
+                "base_model": QUANTIZATION_BASE_MODELS[quant],
+                "num_ctx": num_ctx,
+                "estimated_memory_bytes": estimated,
+                "fits_memory": estimated <= memory_budget,
+            })
+    return variants
+
+def measure_loaded_model_memory(client, model_name):
+    """Pemakaian memori model yang sedang dimuat menurut /api/ps (total dan bagian di VRAM, dalam byte)."""
+    try:
+        for loaded in client.ps(timeout=30):
+            if model_name_matches(model_name, [loaded.get("name") or loaded.get("model")]):
+                return {"memory_bytes": loaded.get("size"), "vram_bytes": loaded.get("size_vram")}
+    except OllamaError as e:
+        log_message(f"  - ⚠️ Tidak dapat membaca /api/ps: {e}")
+    return {"memory_bytes": None, "vram_bytes": None}
+
+@_tracer.traced("build_matrix")
+def run_build_matrix(quantizations, context_sizes, gpu_info, gpu_layers, index_path, manifest, dataset_hash,
+                     available_models, knowledge_tokens=None, num_thread=None, jobs=1, repeats=1, force=False,
+                     csv_dataset=None, evaluation=None):
+    """
+    Membangun dan membandingkan beberapa varian model dalam satu run:
+    1. Modelfile semua varian dibuat paralel dari system prompt yang sama; dataset dan indeks dipakai bersama.
+    2. Varian dibangun lewat antrean job berkapasitas `jobs` yang dilayani `jobs` worker.
+    3. Setiap varian yang tersedia di-benchmark berurutan dengan beban kerja yang sama, lalu
+       pemakaian memorinya dibaca dari /api/ps sebelum model dilepas dari memori.
+    4. Dengan `evaluation` (argumen run_fidelity_evaluation) dan `csv_dataset`, akurasi jawaban
+       setiap varian diukur pada sampel pertanyaan yang sama.
+    Mengembalikan daftar baris perbandingan per varian.
+    """
+    if not quantizations or not context_sizes:
+        raise ValueError("Build matrix membutuhkan minimal satu kuantisasi dan satu ukuran konteks.")
+    unknown = [quant for quant in quantizations if quant not in QUANTIZATION_BASE_MODELS]
+    if unknown:
+        raise ValueError(
+            f"Kuantisasi tidak dikenal untuk build matrix: {', '.join(unknown)} "
+            f"(pilihan: {', '.join(QUANTIZATION_BASE_MODELS)})"
+        )
+    variants = plan_build_matrix(quantizations, context_sizes, gpu_info)
+    log_message(
+        f"🧮 Build matrix: {len(quantizations)} kuantisasi x {len(context_sizes)} ukuran konteks = {len(variants)} varian."
+    )
+    for variant in variants:
+        if not variant["fits_memory"]:
+            log_message(
+                f"  - ⚠️ {variant['model']} diperkirakan butuh "
+                f"{variant['estimated_memory_bytes'] / 1024**3:.1f} GB, melebihi anggaran memori."
+            )
+
+    system_prompt, _ = create_system_prompt()
+
+    def generate_modelfile(variant):
+        with _tracer.span("modelfile_build", model=variant["model"]) as span:
+            content = create_gpu_optimized_modelfile(
+                variant["quantization"], gpu_info, gpu_layers, num_ctx=variant["num_ctx"], num_thread=num_thread,
+                base_model=variant["base_model"], system_prompt=system_prompt
+            )
+            write_if_changed(variant["modelfile"], content)
+            span.set(bytes=len(content.encode("utf-8")))
+        return content
+
+    with ThreadPoolExecutor(max_workers=min(len(variants), os.cpu_count() or 4)) as executor:
+        for variant, content in zip(variants, executor.map(_tracer.bind(generate_modelfile), variants)):
+            variant["modelfile_content"] = content
+
+    jobs = max(1, jobs)
+    job_queue = queue.Queue(maxsize=jobs)
+
+    def build_worker():
+        while True:
+            variant = job_queue.get()
+            if variant is None:
+                return
+            build_params = {
+                "base_model": variant["base_model"],
+                "quantization": variant["quantization"],
+                "gpu_layers": gpu_layers,
+                "has_gpu": gpu_info['has_gpu'],
+            }
+            try:
+                built = build_model_variant(
+                    variant["model"], variant["modelfile"], variant["modelfile_content"], build_params, gpu_info,
+                    manifest, dataset_hash, available_models, force=force
+                )
+                variant["status"] = "built" if built else "cached"
+            except Exception as e:
+                variant["status"] = "failed"
+                variant["error"] = str(e)
+                log_message(f"❌ Varian '{variant['model']}' gagal dibangun: {e}", error=True)
+
+    log_message(f"🏗️ Membangun {len(variants)} varian dengan {jobs} worker...")
+    workers = [threading.Thread(target=_tracer.bind(build_worker), daemon=True) for _ in range(jobs)]
+    for worker in workers:
+        worker.start()
+    for variant in variants:
+        job_queue.put(variant)  # Memblokir selama antrean penuh
+    for _ in workers:
+        job_queue.put(None)
+    for worker in workers:
+        worker.join()
+
+    client = get_ollama_client()
+    matrix_id = datetime.now().strftime('%Y%m%d-%H%M%S')
+    rows = []
+    for variant in variants:
+        row = {key: value for key, value in variant.items() if key != "modelfile_content"}
+        rows.append(row)
+        if variant["status"] == "failed":
             continue
-    
+        log_message(f"🏁 Benchmark varian '{variant['model']}'...")
+        benchmark_results = benchmark_model(
+            variant["model"], gpu_info, index_path, repeats=repeats, knowledge_tokens=knowledge_tokens
+        )
+        summary = summarize_benchmark(benchmark_results)
+        row.update(measure_loaded_model_memory(client, variant["model"]))
+        evaluation_report = None
+        if evaluation is not None and csv_dataset is not None:
+            evaluation_report = run_fidelity_evaluation(
+                variant["model"], csv_dataset, index_path, knowledge_tokens=knowledge_tokens, **evaluation
+            )
+            row["evaluation"] = {key: evaluation_report[key]
+                                 for key in ("samples", "holdout", "accuracy", "similarity", "errors", "throughput")}
+        unload_model(client, variant["model"])
+        row["summary"] = {key: summary[key] for key in ("overall", "start", "requests", "errors")}
+        row["run_id"] = append_benchmark_history({
+            "model": variant["model"],
+            "quantization": variant["quantization"],
+            "num_ctx": variant["num_ctx"],
+            "gpu_layers": gpu_layers,
+            "matrix_id": matrix_id,
+            "trace_id": _tracer.trace_id,
+            "dataset_hash": dataset_hash,
+            "modelfile_hash": hashlib.sha256(variant["modelfile_content"].encode("utf-8")).hexdigest(),
+            "hardware": collect_hardware_summary(gpu_info),
+            "summary": summary,
+            "results": [{k: v for k, v in r.items() if k != "response"} for r in benchmark_results],
+            "evaluation": evaluation_report,
+        })
+
+    report = {"matrix_id": matrix_id, "created_at": datetime.now().isoformat(), "variants": rows}
+    with open(BUILD_MATRIX_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    log_build_matrix_report(rows)
+    log_message(f"🗂️ Perbandingan varian disimpan ke {BUILD_MATRIX_FILE} (matrix {matrix_id}).")
+    return rows
+
+def _matrix_stat(row, metric, key):
+    value = row.get("summary", {}).get("overall", {}).get(metric, {}).get(key)
+    return f"{value:.2f}" if value is not None else "-"
+
+def _matrix_cold_start(row):
+    value = row.get("summary", {}).get("start", {}).get("cold", {}).get("response_time")
+    return f"{value:.2f}" if value is not None else "-"
+
+def _matrix_accuracy(row):
+    value = row.get("evaluation", {}).get("accuracy")
+    return f"{value * 100:.1f}%" if value is not None else "-"
+
+def _matrix_gigabytes(value):
+    return f"{value / 1024**3:.2f}" if value is not None else "-"
+
+def log_build_matrix_report(rows):
+    """Menampilkan tabel perbandingan latensi, throughput, dan memori antar varian."""
+    ranked = [row for row in rows if row.get("summary", {}).get("overall", {}).get("response_time")]
+    fastest = min(ranked, key=lambda row: row["summary"]["overall"]["response_time"]["p50"], default=None)
+    log_message("📋 Perbandingan varian (latensi dalam detik, memori dalam GB):")
+    print(f"   {'Varian':<42} {'Status':<7} {'Cold':>7} {'p50':>7} {'p95':>7} {'TTFT':>7} {'tok/s':>7} "
+          f"{'Akurasi':>7} {'Memori':>7} {'VRAM':>7} {'Estim.':>7}")
+    for row in rows:
+        marker = " ⭐" if row is fastest else ""
+        print(f"   {row['model']:<42} {row['status']:<7} {_matrix_cold_start(row):>7} "
+              f"{_matrix_stat(row, 'response_time', 'p50'):>7} {_matrix_stat(row, 'response_time', 'p95'):>7} "
+              f"{_matrix_stat(row, 'ttft', 'p50'):>7} {_matrix_stat(row, 'eval_rate', 'mean'):>7} "
+              f"{_matrix_accuracy(row):>7} {_matrix_gigabytes(row.get('memory_bytes')):>7} "
+              f"{_matrix_gigabytes(row.get('vram_bytes')):>7} {_matrix_gigabytes(row['estimated_memory_bytes']):>7}{marker}")
+    evaluated = [row for row in rows if row.get("evaluation")]
+    if fastest is not None and evaluated:
+        best = max(row["evaluation"]["accuracy"] for row in evaluated)
+        fastest_accuracy = fastest.get("evaluation", {}).get("accuracy")
+        if fastest_accuracy is not None and fastest_accuracy < best:
+            log_message(
+                f"   - ⚖️ Varian tercepat kehilangan {(best - fastest_accuracy) * 100:.1f} poin akurasi "
+                f"dibanding varian terbaik ({best * 100:.1f}%)."
+            )
+
+def estimate_tokens(text):
+    """Estimasi jumlah token teks dengan estimator terkalibrasi."""
+    return max(1, round(_raw_token_estimate(text) * get_token_estimate_scale()))
+
+def calibrate_token_estimator(client, model_name, samples, timeout=120):
+    """
+    Mengkalibrasi estimator dengan membandingkan estimasi mentah terhadap prompt_eval_count
+    Ollama (mode raw, tanpa template) untuk sejumlah teks sampel. Hasil disimpan ke disk.
+    """
+    global _token_estimate_scale
+    log_message(f"📏 Mengkalibrasi estimator token dengan {len(samples)} sampel...")
+    actual_total = estimated_total = 0
+    for text in samples:
+        try:
+            response = client.generate(
+                model_name, text, raw=True, stream=False, options={"num_predict": 1}, timeout=timeout
+            )
+        except OllamaError as e:
+            log_message(f"  - ⚠️ Sampel dilewati: {e}", error=True)
+            continue
+        if response.get("prompt_eval_count"):
+            actual_total += response["prompt_eval_count"]
+            estimated_total += _raw_token_estimate(text)
+    if not estimated_total:
+        raise ValueError("Kalibrasi gagal: tidak ada sampel yang berhasil dievaluasi.")
+    _token_estimate_scale = actual_total / estimated_total
+    with open(TOKEN_CALIBRATION_FILE, "w", encoding="utf-8") as f:
+        json.dump({"scale": _token_estimate_scale, "model": model_name, "samples": len(samples),
+                   "calibrated_at": datetime.now().isoformat()}, f, indent=2)
+    log_message(f"  - ✅ Faktor kalibrasi: {_token_estimate_scale:.3f} token per token-estimasi ({TOKEN_CALIBRATION_FILE}).")
+    return _token_estimate_scale
+
+def estimate_model_weights_bytes(quantization_method):
+    """Ukuran bobot model pada kuantisasi tertentu."""
+    bits = QUANTIZATION_BITS_PER_WEIGHT.get(quantization_method.lower(), 8.5)
+    return MODEL_ARCHITECTURE["parameters"] * bits / 8
+
+def query_free_vram_mb():
+    """VRAM bebas (MiB) GPU NVIDIA pertama saat ini, atau None jika tidak bisa dibaca."""
+    try:
+        success, output = run_command(
+            ["nvidia-smi", "--query-gpu=memory.free", "--format=csv,noheader,nounits"], timeout=10
+        )
+    except FileNotFoundError:
+        return None
+    if not success:
+        return None
+    match = re.search(r"\d+", output)
+    return int(match.group(0)) if match else None
+
+def get_memory_budget_bytes(gpu_info):
+    """
+    Memori yang boleh dipakai model: VRAM bebas (dibaca langsung, bukan dari cache perangkat keras)
+    jika GPU NVIDIA terdeteksi, selain itu RAM yang tersedia; keduanya dikalikan MEMORY_BUDGET_FRACTION.
+    """
+    if gpu_info.get('nvidia'):
+        free_mb = query_free_vram_mb()
+        if free_mb:
+            return free_mb * 1024**2 * MEMORY_BUDGET_FRACTION, "VRAM"
+    try:
+        import psutil
+        available = psutil.virtual_memory().available
+    except ImportError:
+        available = 8 * 1024**3
+    return available * MEMORY_BUDGET_FRACTION, "RAM"
+
+def plan_token_budget(quantization_method, gpu_info, gpu_layers, knowledge_tokens=RETRIEVAL_KNOWLEDGE_TOKENS,
+                      num_ctx=None):
+    """
+    Menghitung anggaran konteks: token SYSTEM (aturan & identitas), contoh, ruang knowledge
+    retrieval, dan cadangan percakapan, lalu memilih num_ctx terkecil yang memenuhi kebutuhan
+    dan muat dalam memori KV cache. Jika memori tidak cukup, ruang knowledge yang dikurangi.
+    Dengan `num_ctx` (mis. hasil tuning) ukuran konteks tetap dan hanya pembagiannya yang dihitung.
+    """
+    system_prompt, example_conversation = create_system_prompt()
+    example_tokens = estimate_tokens(example_conversation)
+    system_tokens = estimate_tokens(system_prompt) - example_tokens
+    fixed_tokens = TEMPLATE_OVERHEAD_TOKENS + system_tokens + example_tokens + CONVERSATION_RESERVE_TOKENS
+    required_tokens = fixed_tokens + knowledge_tokens
+
+    memory_budget, memory_kind = get_memory_budget_bytes(gpu_info)
+    weights = estimate_model_weights_bytes(quantization_method)
+    if memory_kind == "VRAM":
+        weights *= min(1.0, gpu_layers / MODEL_ARCHITECTURE["layers"])
+    kv_budget = max(0.0, memory_budget - weights - RUNTIME_OVERHEAD_BYTES)
+    max_context_by_memory = min(int(kv_budget // KV_CACHE_BYTES_PER_TOKEN), MODEL_ARCHITECTURE["max_context"])
+
+    fitting = [size for size in CONTEXT_SIZE_CANDIDATES if size <= max_context_by_memory]
+    sufficient = [size for size in fitting if size >= required_tokens]
+    if num_ctx is None:
+        num_ctx = sufficient[0] if sufficient else (fitting[-1] if fitting else CONTEXT_SIZE_CANDIDATES[0])
+    knowledge_budget = max(0, min(knowledge_tokens, num_ctx - fixed_tokens))
+
+    return {
+        "num_ctx": num_ctx,
+        "template_tokens": TEMPLATE_OVERHEAD_TOKENS,
+        "system_tokens": system_tokens,
+        "example_tokens": example_tokens,
+        "knowledge_tokens": knowledge_budget,
+        "conversation_tokens": CONVERSATION_RESERVE_TOKENS,
+        "free_tokens": max(0, num_ctx - fixed_tokens - knowledge_budget),
+        "required_tokens": required_tokens,
+        "memory_kind": memory_kind,
+        "memory_budget_bytes": memory_budget,
+        "weights_bytes": weights,
+        "kv_cache_bytes": num_ctx * KV_CACHE_BYTES_PER_TOKEN,
+        "max_context_by_memory": max_context_by_memory,
+        "estimate_scale": get_token_estimate_scale(),
+    }
+
+def log_token_budget(plan):
+    """Menampilkan pembagian anggaran konteks dan memori."""
+    num_ctx = plan["num_ctx"]
+    log_message(f"🧮 Anggaran konteks: num_ctx {num_ctx} (maks. {plan['max_context_by_memory']} menurut memori)")
+    for key, label in (("template_tokens", "Template"), ("system_tokens", "SYSTEM (aturan & identitas)"),
+                       ("example_tokens", "Contoh perilaku"), ("knowledge_tokens", "Knowledge retrieval"),
+                       ("conversation_tokens", "Cadangan percakapan"), ("free_tokens", "Sisa")):
+        log_message(f"   - {label:<28} {plan[key]:6d} token ({plan[key] / num_ctx * 100:5.1f}%)")
+    gib = 1024**3
+    log_message(
+        f"   - Memori {plan['memory_kind']}: anggaran {plan['memory_budget_bytes'] / gib:.1f} GB | "
+        f"bobot {plan['weights_bytes'] / gib:.1f} GB | KV cache {plan['kv_cache_bytes'] / gib:.2f} GB"
+    )
+    if plan["knowledge_tokens"] + plan["system_tokens"] + plan["example_tokens"] + plan["template_tokens"] \
+            + plan["conversation_tokens"] < plan["required_tokens"]:
+        log_message("   - ⚠️ Memori tidak cukup untuk anggaran penuh; ruang knowledge retrieval dikurangi.", error=True)
+
+def _shingles(text, size=2):
+    """Membuat himpunan shingle kata dari teks yang sudah dinormalisasi."""
+    words = text.split()
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _minhash_signature(shingles):
+    """
+    Signature MinHash satu-permutasi: setiap shingle di-hash sekali lalu dibagi ke bucket,
+    bucket kosong diisi dari bucket tetangga (densifikasi) agar signature tetap sebanding.
+    """
+    signature = [None] * MINHASH_NUM_BUCKETS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        bucket = value % MINHASH_NUM_BUCKETS
+        if signature[bucket] is None or value < signature[bucket]:
+            signature[bucket] = value
+    for i in range(MINHASH_NUM_BUCKETS):
+        offset = 1
+        while signature[i] is None:
+            donor = signature[(i + offset) % MINHASH_NUM_BUCKETS]
+            if donor is not None and not isinstance(donor, tuple):
+                signature[i] = (donor, offset)
+            offset += 1
+    return tuple(signature)
+
+def _find_near_duplicate_clusters(texts):
+    """
+    Mengelompokkan teks yang hampir identik dengan MinHash-LSH.
+    Hanya pasangan kandidat yang berbagi band yang dibandingkan secara eksak (Jaccard),
+    sehingga tidak ada perbandingan O(n²). Mengembalikan parent union-find per indeks.
+    """
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    shingle_sets = [_shingles(text) for text in texts]
+    rows_per_band = MINHASH_NUM_BUCKETS // MINHASH_BANDS
+    band_buckets = {}
+    for i, shingles in enumerate(shingle_sets):
+        signature = _minhash_signature(shingles)
+        for band in range(MINHASH_BANDS):
+            key = (band, signature[band * rows_per_band:(band + 1) * rows_per_band])
+            band_buckets.setdefault(key, []).append(i)
+
+    for members in band_buckets.values():
+        if len(members) < 2:
+            continue
+        first = members[0]
+        for other in members[1:]:
+            root_a, root_b = find(first), find(other)
+            if root_a == root_b:
+                continue
+            a, b = shingle_sets[first], shingle_sets[other]
+            if len(a & b) / len(a | b) >= NEAR_DUPLICATE_THRESHOLD:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return [find(i) for i in range(len(texts))]
+
+def _knowledge_payload_size(record):
+    """Ukuran (byte, token) sebuah entri ketika ditulis sebagai blok P:/J: knowledge base."""
+    text = f"P: {record.question}\nJ: {record.answer}\n\n"
+    return len(text.encode("utf-8")), estimate_tokens(text)
+
+def deduplicate_dataset(records):
+    """
+    Menghapus duplikat eksak (pertanyaan & jawaban ternormalisasi) secara streaming lalu
+    menggabungkan near-duplicate. Entri pertama dari setiap kelompok dipertahankan.
+    Mengembalikan dataset bersih dan laporan penghematan.
+    """
+    log_message("🧹 Menghapus duplikat dari dataset...")
+    seen = set()
+    unique_entries = []
+    normalized_texts = []
+    rows_in = bytes_in = tokens_in = 0
+    for record in records:
+        rows_in += 1
+        size_bytes, size_tokens = _knowledge_payload_size(record)
+        bytes_in += size_bytes
+        tokens_in += size_tokens
+        normalized = (normalize_text(record.question), normalize_text(record.answer))
+        # Simpan digest, bukan string, agar memori himpunan tetap kecil
+        key = hashlib.blake2b("\x1f".join(normalized).encode("utf-8"), digest_size=16).digest()
+        if key not in seen:
+            seen.add(key)
+            unique_entries.append(record)
+            normalized_texts.append(" ".join(normalized))
+    exact_removed = rows_in - len(unique_entries)
+
+    roots = _find_near_duplicate_clusters(normalized_texts)
+    del normalized_texts
+    deduplicated = [record for i, record in enumerate(unique_entries) if roots[i] == i]
+    near_removed = len(unique_entries) - len(deduplicated)
+
+    bytes_out = tokens_out = 0
+    for record in deduplicated:
+        size_bytes, size_tokens = _knowledge_payload_size(record)
+        bytes_out += size_bytes
+        tokens_out += size_tokens
+
+    report = {
+        "rows_in": rows_in,
+        "rows_out": len(deduplicated),
+        "exact_duplicates": exact_removed,
+        "near_duplicates": near_removed,
+        "bytes_saved": bytes_in - bytes_out,
+        "tokens_saved": tokens_in - tokens_out,
+    }
+    log_message(
+        f"  - ✂️ Duplikat eksak: {exact_removed} | Near-duplicate: {near_removed} | "
+        f"Tersisa: {report['rows_out']}/{report['rows_in']} entri"
+    )
+    log_message(
+        f"  - 💾 Penghematan: {report['bytes_saved'] / 1024:.0f} KB (~{report['tokens_saved']} token)"
+    )
+    return deduplicated, report
+
+def detect_file_encoding(path, sample_size=ENCODING_SAMPLE_BYTES):
+    """
+    Mendeteksi encoding file sekali dari sampel byte awal, tanpa membaca ulang seluruh file.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(sample_size)
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    try:
+        # final=False agar karakter multi-byte yang terpotong di akhir sampel tidak dianggap error
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+def resolve_dataset_sources(paths=None):
+    """
+    Mengubah daftar path (file, direktori, atau pola glob) menjadi daftar file data terurut.
+    Tanpa argumen, file pertama yang ada dari DEFAULT_DATA_FILES yang dipakai.
+    """
+    if not paths:
+        default_file = next((f for f in DEFAULT_DATA_FILES if os.path.exists(f)), None)
+        return [default_file] if default_file else []
+
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(DATA_FILE_EXTENSIONS)
+            )
+        elif any(ch in path for ch in "*?["):
+            candidates = sorted(glob.glob(path, recursive=True))
+        else:
+            candidates = [path] if os.path.exists(path) else []
+        for candidate in candidates:
+            if candidate.lower().endswith(DATA_FILE_EXTENSIONS) and candidate not in sources:
+                sources.append(candidate)
+    return sources
+
+def _find_column(header, aliases, default):
+    return next((i for i, h in enumerate(header) if any(alias in h.lower() for alias in aliases)), default)
+
+def iter_csv_records(path):
+    """Membaca baris CSV satu per satu sebagai QARecord."""
+    encoding = detect_file_encoding(path)
+    # errors='replace' menjaga pembacaan tetap satu kali jalan meskipun ada byte rusak setelah sampel
+    with open(path, "r", encoding=encoding, errors="replace", newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        q_idx = _find_column(header, QUESTION_FIELD_ALIASES, 0)
+        a_idx = _find_column(header, ANSWER_FIELD_ALIASES, 1)
+        log_message(f"  - 📈 {path} [{encoding}] Kolom Pertanyaan: {q_idx}, Kolom Jawaban: {a_idx}")
+
+        min_len = max(q_idx, a_idx)
+        for row in reader:
+            if len(row) > min_len:
+                question = row[q_idx].strip()
+                answer = row[a_idx].strip()
+                if question and answer:
+                    yield QARecord(question, answer, path)
+
+def iter_jsonl_records(path):
+    """Membaca file JSONL (satu objek per baris) sebagai QARecord; baris tanpa pasangan Q/A dilewati."""
+    encoding = detect_file_encoding(path)
+    log_message(f"  - 📈 {path} [{encoding}] JSONL")
+    with open(path, "r", encoding=encoding, errors="replace") as file:
+        for line_num, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                log_message(f"  - ⚠️ Baris {line_num} di {path} bukan JSON valid, dilewati.")
+                continue
+            if not isinstance(item, dict):
+                continue
+            question = next((item[k] for k in JSONL_QUESTION_KEYS if isinstance(item.get(k), str)), "").strip()
+            answer = next((item[k] for k in JSONL_ANSWER_KEYS if isinstance(item.get(k), str)), "").strip()
+            if question and answer:
+                yield QARecord(question, answer, path)
+
+def iter_dataset_records(sources):
+    """Generator tunggal atas semua sumber data (CSV dan JSONL), dibaca secara streaming."""
+    for path in sources:
+        if path.lower().endswith(".jsonl"):
+            yield from iter_jsonl_records(path)
+        else:
+            yield from iter_csv_records(path)
+
+@_tracer.traced("csv_read")
+def read_and_process_csv(paths=None, deduplicate=True):
+    """
+    Membaca, memvalidasi, dan (opsional) menghapus duplikat data.
+    `paths` dapat berisi file CSV/JSONL, direktori shard, atau pola glob.
+    """
+    log_message("📂 Membaca dan memproses data CSV...")
+    sources = resolve_dataset_sources(paths)
+    if not sources:
+        raise FileNotFoundError("File data CSV tidak ditemukan! Pastikan file data ada di direktori yang sama.")
+    log_message(f"  - 📄 Menggunakan {len(sources)} file: {', '.join(sources[:5])}{' ...' if len(sources) > 5 else ''}")
+
+    records = iter_dataset_records(sources)
+    if deduplicate:
+        cleaned_dataset, report = deduplicate_dataset(records)
+        rows_read = report["rows_in"]
+    else:
+        cleaned_dataset = list(records)
+        rows_read = len(cleaned_dataset)
+
     if not cleaned_dataset:
         raise ValueError("Tidak ada data valid yang ditemukan dalam file CSV.")
-    
-    log_message(f"  - ✨ Berhasil memproses {len(cleaned_dataset)} pasangan pertanyaan-jawaban.")
-    return cleaned_dataset, csv_file_found
+
+    log_message(f"  - ✨ Berhasil memproses {rows_read} baris menjadi {len(cleaned_dataset)} pasangan pertanyaan-jawaban.")
+    _tracer.current().set(
+        rows=len(cleaned_dataset), rows_read=rows_read, bytes=sum(os.path.getsize(source) for source in sources)
+    )
+    return cleaned_dataset, ", ".join(sources)
+
+def export_pipeline_trace(trace_path=PIPELINE_TRACE_FILE, metrics_path=PIPELINE_METRICS_FILE):
+    """Menyimpan span tahap pipeline ke JSONL dan metrik Prometheus, lalu menampilkan ringkasannya."""
+    if not _tracer.spans:
+        return
+    span_count = _tracer.export_jsonl(trace_path)
+    _tracer.export_prometheus(metrics_path)
+    log_message(f"🧭 Rincian waktu per tahap (trace {_tracer.trace_id}):")
+    print(f"   {'Tahap':<16} {'Span':>4} {'Durasi':>9} {'Baris':>7} {'Byte':>10} {'Proses':>6} {'API':>5} {'Gagal':>5}")
+    for stage, stats in _tracer.summarize().items():
+        print(f"   {stage:<16} {stats['count']:>4} {stats['duration']:>8.2f}s {stats['rows']:>7} {stats['bytes']:>10} "
+              f"{stats['subprocess_calls']:>6} {stats['api_calls']:>5} {stats['errors']:>5}")
+    log_message(f"🗂️ {span_count} span disimpan ke {trace_path}; metrik Prometheus ke {metrics_path}.")
 
 # --- EKSEKUSI UTAMA ---
+def parse_arguments():
+    """Membaca argumen baris perintah."""
+    parser = argparse.ArgumentParser(description="Pembuatan model UMM Assistant Demo untuk SD Muhammadiyah Malang.")
+    parser.add_argument(
+        "--data", nargs="+", metavar="PATH",
+        help="File CSV/JSONL, direktori shard, atau pola glob (default: file data pertama yang ditemukan)."
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="Abaikan manifest build dan bangun ulang indeks serta model."
+    )
+    parser.add_argument(
+        "--benchmark-repeats", type=int, default=1, metavar="N",
+        help="Jumlah pengulangan setiap pertanyaan benchmark (untuk persentil p50/p95/p99)."
+    )
+    parser.add_argument(
+        "--multi-turn", action="store_true",
+        help="Tambahkan skenario percakapan multi-turn yang mengukur prompt eval yang dihemat oleh riwayat sesi "
+             "(cache prefix server)."
+    )
+    parser.add_argument(
+        "--refresh-hardware", action="store_true",
+        help=f"Abaikan cache perangkat keras ({HARDWARE_CACHE_FILE}) dan probe ulang GPU/RAM."
+    )
+    parser.add_argument(
+        "--knowledge-tokens", type=int, default=RETRIEVAL_KNOWLEDGE_TOKENS, metavar="N",
+        help=f"Anggaran token untuk konteks retrieval per pertanyaan (default: {RETRIEVAL_KNOWLEDGE_TOKENS})."
+    )
+    parser.add_argument(
+        "--calibrate-tokens", type=int, default=0, metavar="N",
+        help="Kalibrasi estimator token dengan N sampel dataset melalui model dasar sebelum menghitung anggaran."
+    )
+    tuning_group = parser.add_argument_group("auto-tuning")
+    tuning_group.add_argument(
+        "--tune", action="store_true",
+        help="Cari num_gpu, num_thread, dan num_ctx terbaik secara empiris lalu tulis ke Modelfile."
+    )
+    tuning_group.add_argument(
+        "--tune-quantizations", metavar="Q1,Q2",
+        help=f"Sertakan kuantisasi dalam pencarian (pilihan: {', '.join(QUANTIZATION_BASE_MODELS)})."
+    )
+    tuning_group.add_argument("--tune-probes", type=int, default=2, help="Jumlah pengukuran per konfigurasi per putaran.")
+    history_group = parser.add_argument_group("riwayat benchmark")
+    history_group.add_argument(
+        "--compare", nargs="+", metavar="RUN_ID",
+        help="Bandingkan run CANDIDATE (default: latest) dengan BASELINE dari riwayat lalu keluar. "
+             "RUN_ID boleh berupa awalan, 'latest', atau 'previous'."
+    )
+    history_group.add_argument("--list-history", action="store_true", help="Tampilkan daftar run di riwayat lalu keluar.")
+    warmup_group = parser.add_argument_group("warm-up & keep-alive")
+    warmup_group.add_argument(
+        "--keep-alive", default=DEFAULT_KEEP_ALIVE,
+        help=f"Lama model tetap di memori setelah dipakai, mis. '30m', '2h', atau detik (default: {DEFAULT_KEEP_ALIVE})."
+    )
+    warmup_group.add_argument(
+        "--pin-model", action="store_true",
+        help="Sematkan model di memori tanpa batas waktu (keep_alive=-1) untuk produksi."
+    )
+    matrix_group = parser.add_argument_group("build matrix")
+    matrix_group.add_argument(
+        "--matrix-quantizations", default=None,
+        help="Bangun dan bandingkan varian untuk beberapa kuantisasi sekaligus, mis. 'q4_k_m,q5_k_m,q8_0'."
+    )
+    matrix_group.add_argument(
+        "--matrix-ctx", default=None,
+        help="Daftar num_ctx untuk build matrix, mis. '2048,4096,8192' (default: hasil perencanaan token)."
+    )
+    matrix_group.add_argument(
+        "--matrix-jobs", type=int, default=1,
+        help="Jumlah pembuatan varian yang berjalan bersamaan (default: 1)."
+    )
+    load_group = parser.add_argument_group("uji beban")
+    load_group.add_argument("--load-test", action="store_true", help="Jalankan uji beban konkuren setelah benchmark.")
+    load_group.add_argument("--concurrency", type=int, default=4, help="Jumlah permintaan paralel maksimum (default: 4).")
+    load_group.add_argument(
+        "--rate", type=float, default=None,
+        help="Laju kedatangan permintaan/detik (open-loop). Tanpa opsi ini uji berjalan closed-loop."
+    )
+    load_group.add_argument("--duration", type=float, default=60, help="Durasi uji beban dalam detik (default: 60).")
+    load_group.add_argument("--request-timeout", type=float, default=120, help="Timeout per permintaan dalam detik.")
+    eval_group = parser.add_argument_group("evaluasi kualitas")
+    eval_group.add_argument(
+        "--evaluate", action="store_true",
+        help="Ukur akurasi jawaban terhadap dataset setelah benchmark (juga per varian di build matrix)."
+    )
+    eval_group.add_argument("--eval-samples", type=int, default=EVAL_SAMPLE_SIZE,
+                            help=f"Jumlah pertanyaan sampel (default: {EVAL_SAMPLE_SIZE}).")
+    eval_group.add_argument("--eval-concurrency", type=int, default=EVAL_CONCURRENCY,
+                            help=f"Permintaan evaluasi paralel (default: {EVAL_CONCURRENCY}).")
+    eval_group.add_argument("--eval-seed", type=int, default=EVAL_SEED, help="Seed sampel dan generasi.")
+    eval_group.add_argument(
+        "--eval-with-source", action="store_true",
+        help="Sertakan entri yang ditanyakan di konteks retrieval (akurasi bocor; default: entri dikeluarkan)."
+    )
+    eval_group.add_argument(
+        "--eval-threshold", type=float, default=DEFAULT_PASS_THRESHOLD,
+        help=f"Kemiripan minimum agar jawaban dihitung benar (default: {DEFAULT_PASS_THRESHOLD})."
+    )
+    serve_group = parser.add_argument_group("gateway")
+    serve_group.add_argument(
+        "--serve", action="store_true",
+        help="Setelah build, layani model lewat gateway HTTP OpenAI-compatible dengan antrean dan backpressure."
+    )
+    serve_group.add_argument("--serve-host", default="127.0.0.1", help="Alamat bind gateway (default: 127.0.0.1).")
+    serve_group.add_argument("--serve-port", type=int, default=GATEWAY_PORT, help=f"Port gateway (default: {GATEWAY_PORT}).")
+    serve_group.add_argument(
+        "--serve-workers", type=int, default=gateway.DEFAULT_WORKERS,
+        help="Permintaan paralel ke Ollama; samakan dengan OLLAMA_NUM_PARALLEL."
+    )
+    serve_group.add_argument(
+        "--serve-queue", type=int, default=gateway.DEFAULT_MAX_QUEUE,
+        help="Kapasitas antrean gateway; permintaan berikutnya ditolak dengan 429."
+    )
+    cache_group = parser.add_argument_group("cache jawaban")
+    cache_group.add_argument(
+        "--response-cache", action="store_true",
+        help="Layani permintaan uji beban dan gateway (--serve) lewat cache jawaban "
+             "(identik, near-exact, dan jawaban langsung dari dataset)."
+    )
+    cache_group.add_argument("--cache-size", type=int, default=2048, help="Jumlah entri maksimum cache (LRU).")
+    cache_group.add_argument("--cache-ttl", type=float, default=24 * 3600, help="Umur maksimum entri cache dalam detik.")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency minimal 1.")
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate harus lebih besar dari 0 (tanpa --rate uji berjalan closed-loop).")
+    if args.matrix_quantizations is not None:
+        # Sumbu build matrix diurai di sini agar daftar kosong tidak berakhir sebagai 0 varian / 0 worker
+        quantizations = [q.strip().lower() for q in args.matrix_quantizations.split(",") if q.strip()]
+        if not quantizations:
+            parser.error("--matrix-quantizations tidak boleh kosong, mis. 'q4_k_m,q8_0'.")
+        unknown = [quant for quant in quantizations if quant not in QUANTIZATION_BASE_MODELS]
+        if unknown:
+            parser.error(f"--matrix-quantizations: kuantisasi tidak dikenal {', '.join(unknown)} "
+                         f"(pilihan: {', '.join(QUANTIZATION_BASE_MODELS)}).")
+        args.matrix_quantizations = quantizations
+    if args.matrix_ctx is not None:
+        if args.matrix_quantizations is None:
+            parser.error("--matrix-ctx hanya berlaku bersama --matrix-quantizations.")
+        try:
+            context_sizes = [int(c) for c in args.matrix_ctx.split(",") if c.strip()]
+        except ValueError:
+            parser.error(f"--matrix-ctx harus berupa daftar bilangan bulat, mis. '2048,4096' (diberikan: '{args.matrix_ctx}').")
+        if not context_sizes or min(context_sizes) < 1:
+            parser.error("--matrix-ctx harus berisi minimal satu ukuran konteks positif, mis. '2048,4096'.")
+        args.matrix_ctx = context_sizes
+    if args.matrix_jobs < 1:
+        parser.error("--matrix-jobs minimal 1.")
+    return args
+
 if __name__ == "__main__":
+    args = parse_arguments()
+    if args.list_history:
+        for run in load_benchmark_history():
+            overall = run.get("summary", {}).get("overall", {}).get("response_time", {})
+            p50 = f"{overall['p50']:.2f}s" if overall else "-"
+            print(f"{run.get('run_id')}  {run.get('model')}  p50={p50}  dataset={str(run.get('dataset_hash'))[:8]}")
+        sys.exit(0)
+    if args.compare:
+        try:
+            regression = run_history_comparison(args.compare[0], args.compare[1] if len(args.compare) > 1 else "latest")
+        except ValueError as e:
+            log_message(str(e), error=True)
+            sys.exit(2)
+        sys.exit(1 if regression else 0)
     try:
         log_message("🚀 Memulai Script Pembuatan UMM Assistant Demo untuk SD Muhammadiyah Malang 🚀")
         print("="*70)
+        keep_alive = parse_keep_alive("-1" if args.pin_model else args.keep_alive)
         
-        # 1. Periksa Layanan Ollama
-        healthy, message = check_ollama_service()
-        if not healthy:
-            log_message("Layanan Ollama bermasalah, mencoba restart...", error=True)
-            healthy, message = restart_ollama_service()
-            if not healthy:
-                raise ConnectionError(f"Gagal terhubung ke Ollama: {message}")
-
-        # 2. Periksa GPU dan Sumber Daya Sistem
-        gpu_info = check_gpu_availability()
-        quantization_method, gpu_layers = select_quantization_method()
+        # 1-2. Preflight: Layanan Ollama, GPU, dan Sumber Daya Sistem (paralel)
+        gpu_info, quantization_method, gpu_layers, available_models = run_preflight(
+            use_hardware_cache=not args.refresh_hardware
+        )
 
         # 3. Baca Data CSV
-        csv_dataset, csv_file_used = read_and_process_csv()
-
-        # 4. Buat Modelfile
-        modelfile_content = create_gpu_optimized_modelfile(csv_dataset, quantization_method, gpu_info, gpu_layers)
-        modelfile_name = f"Modelfile_UMM_Assistant_Demo_{quantization_method}"
-        with open(modelfile_name, "w", encoding="utf-8") as f:
-            f.write(modelfile_content)
-        log_message(f"✅ Modelfile '{modelfile_name}' berhasil dibuat.")
-
-        # 5. Periksa & Tarik Model Dasar
-        log_message("📦 Memeriksa model dasar llama3.2...")
-        success, output = run_command("ollama list", timeout=60)
-        if "llama3.2" not in output:
-            log_message("  - ⚠️ Model dasar tidak ditemukan. Mengunduh llama3.2...")
-            print("-" * 70)
-            pull_success, pull_output = run_command_with_progress(
-                "ollama pull llama3.2", "Mengunduh llama3.2", timeout=1800
-            )
-            print("-" * 70)
-            if not pull_success:
-                raise Exception(f"Gagal mengunduh llama3.2: {pull_output}")
+        csv_dataset, csv_file_used = read_and_process_csv(args.data)
+
+        if args.calibrate_tokens:
+            samples = random.Random(0).sample(csv_dataset, min(args.calibrate_tokens, len(csv_dataset)))
+            try:
+                # Kalibrasi memakai tokenizer model dasar, jadi model dasar harus tersedia lebih dulu
+                ensure_base_model(DEFAULT_BASE_MODEL, available_models)
+                calibrate_token_estimator(
+                    get_ollama_client(), DEFAULT_BASE_MODEL, [f"P: {r.question}\nJ: {r.answer}" for r in samples]
+                )
+            except Exception as e:
+                log_message(
+                    f"⚠️ Kalibrasi token dilewati, memakai estimator heuristik "
+                    f"(faktor {get_token_estimate_scale():.3f}): {e}", error=True
+                )
+
+        # 4. Bangun Indeks Retrieval & Buat Modelfile
+        manifest = load_build_manifest()
+        dataset_hash = compute_dataset_hash(csv_dataset)
+        index_path = KNOWLEDGE_INDEX_FILE
+        previous_dataset_hash = manifest["index"].get("dataset_hash")
+        if (not args.force and os.path.exists(index_path) and previous_dataset_hash == dataset_hash
+                and manifest["index"].get("version") == INDEX_VERSION):
+            log_message(f"♻️ Dataset tidak berubah, memakai ulang indeks '{index_path}'.")
         else:
-            log_message("  - ✅ Model dasar llama3.2 sudah tersedia.")
+            # Dataset berubah: indeks dibangun ulang penuh (statistik BM25 bersifat global), tetapi
+            # diff baris dihitung dulu dari indeks lama agar cache jawaban yang masih valid dipertahankan
+            row_diff = None if args.force else diff_dataset_rows(index_path, csv_dataset)
+            index_stats = build_knowledge_index(csv_dataset, index_path)
+            if row_diff is not None:
+                cache_result = invalidate_cached_answers(
+                    row_diff, previous_dataset_hash, dataset_hash, max_entries=args.cache_size, ttl=args.cache_ttl
+                )
+                log_rebuild_report(row_diff, index_stats, cache_result)
+            manifest["index"] = {
+                "path": index_path,
+                "dataset_hash": dataset_hash,
+                "version": INDEX_VERSION,
+                "built_at": datetime.now().isoformat(),
+            }
+            save_build_manifest(manifest)
 
-        # 6. Buat Model Final
-        base_model_name = "UMM-Assistant-Demo"
-        final_model_name = create_gpu_optimized_model(base_model_name, modelfile_name, quantization_method, gpu_info)
-        
-        # 7. Verifikasi dan Benchmark
-        log_message(f"✔️ Memverifikasi model '{final_model_name}'...")
-        success, output = run_command("ollama list", timeout=30)
-        if final_model_name not in output:
-            raise Exception("Model tidak ditemukan dalam daftar setelah pembuatan. Proses mungkin gagal.")
-        
-        log_message("✅ Model berhasil diverifikasi.")
-        benchmark_results = benchmark_model(final_model_name, gpu_info)
+        token_budget = plan_token_budget(quantization_method, gpu_info, gpu_layers, knowledge_tokens=args.knowledge_tokens)
+        log_token_budget(token_budget)
+
+        if args.tune:
+            quantizations = [q.strip().lower() for q in args.tune_quantizations.split(",")] if args.tune_quantizations else None
+            tuned = run_auto_tuner(gpu_info, gpu_layers, token_budget, index_path, quantizations=quantizations,
+                                   probes=args.tune_probes)
+        else:
+            tuned = load_tuning_result(gpu_info)
+        base_model = DEFAULT_BASE_MODEL
+        num_ctx = token_budget["num_ctx"]
+        num_thread = None
+        if tuned:
+            log_message(f"🎛️ Menerapkan hasil tuning dari {TUNING_RESULT_FILE}.")
+            if tuned.get("quantization"):
+                quantization_method = tuned["quantization"]
+            base_model = tuned.get("base_model", base_model)
+            gpu_layers = tuned.get("num_gpu", gpu_layers)
+            num_thread = tuned.get("num_thread")
+            # Anggaran dihitung ulang untuk kuantisasi dan num_ctx hasil tuning agar Modelfile dan
+            # anggaran knowledge retrieval sesuai dengan konfigurasi yang benar-benar dipakai
+            token_budget = plan_token_budget(
+                quantization_method, gpu_info, gpu_layers, knowledge_tokens=args.knowledge_tokens,
+                num_ctx=tuned.get("num_ctx")
+            )
+            log_token_budget(token_budget)
+            num_ctx = token_budget["num_ctx"]
+        if args.tune:
+            # Tuning dapat mengunduh tag model dasar baru; daftar dari preflight sudah usang
+            available_models = get_ollama_client().list_model_names(timeout=60)
+
+        evaluation = None
+        if args.evaluate:
+            evaluation = {
+                "sample_size": args.eval_samples, "concurrency": args.eval_concurrency, "seed": args.eval_seed,
+                "holdout": not args.eval_with_source, "threshold": args.eval_threshold, "request_timeout": args.request_timeout,
+                "keep_alive": keep_alive,
+            }
+
+        if args.matrix_quantizations:
+            # Mode build matrix: semua varian dibangun dan dibandingkan, lalu skrip selesai
+            matrix_rows = run_build_matrix(
+                args.matrix_quantizations, args.matrix_ctx or [num_ctx],
+                gpu_info, gpu_layers, index_path, manifest, dataset_hash, available_models,
+                knowledge_tokens=token_budget["knowledge_tokens"], num_thread=num_thread,
+                jobs=args.matrix_jobs, repeats=args.benchmark_repeats, force=args.force,
+                csv_dataset=csv_dataset, evaluation=evaluation
+            )
+            failed = [row["model"] for row in matrix_rows if row["status"] == "failed"]
+            if failed:
+                log_message(f"⚠️ {len(failed)} varian gagal dibangun: {', '.join(failed)}", error=True)
+            log_message(f"🎉 Build matrix selesai: {len(matrix_rows) - len(failed)}/{len(matrix_rows)} varian tersedia.")
+            sys.exit(1 if failed else 0)
+
+        with _tracer.span("modelfile_build") as span:
+            modelfile_content = create_gpu_optimized_modelfile(
+                quantization_method, gpu_info, gpu_layers, num_ctx=num_ctx, num_thread=num_thread, base_model=base_model
+            )
+            modelfile_name = f"Modelfile_UMM_Assistant_Demo_{quantization_method}"
+            if write_if_changed(modelfile_name, modelfile_content):
+                log_message(f"✅ Modelfile '{modelfile_name}' berhasil dibuat.")
+            else:
+                log_message(f"♻️ Modelfile '{modelfile_name}' tidak berubah.")
+            span.set(bytes=len(modelfile_content.encode("utf-8")))
+
+        final_model_name = get_final_model_name(BASE_MODEL_NAME, quantization_method, gpu_info)
+        build_params = {
+            "base_model": base_model,
+            "quantization": quantization_method,
+            "gpu_layers": gpu_layers,
+            "has_gpu": gpu_info['has_gpu'],
+        }
+
+        # 5-7. Tarik Model Dasar, Buat Model Final, dan Verifikasi (dilewati jika build tidak berubah)
+        build_model_variant(
+            final_model_name, modelfile_name, modelfile_content, build_params, gpu_info,
+            manifest, dataset_hash, available_models, force=args.force
+        )
+
+        # 8. Benchmark
+        benchmark_results = benchmark_model(
+            final_model_name, gpu_info, index_path, repeats=args.benchmark_repeats,
+            knowledge_tokens=token_budget["knowledge_tokens"], keep_alive=keep_alive
+        )
+
+        multi_turn_report = None
+        if args.multi_turn:
+            multi_turn_report = benchmark_multi_turn(
+                final_model_name, index_path, num_ctx=num_ctx,
+                prefix_tokens=sum(token_budget[key] for key in ("template_tokens", "system_tokens", "example_tokens")),
+                knowledge_tokens=token_budget["knowledge_tokens"], keep_alive=keep_alive
+            )
+
+        evaluation_report = None
+        if evaluation is not None:
+            evaluation_report = run_fidelity_evaluation(
+                final_model_name, csv_dataset, index_path, knowledge_tokens=token_budget["knowledge_tokens"], **evaluation
+            )
         
+        load_test_report = None
+        if args.load_test:
+            response_cache = None
+            cache_index = None
+            if args.response_cache:
+                cache_index = KnowledgeIndex(index_path)
+                response_cache = ResponseCache(
+                    dataset_hash, max_entries=args.cache_size, ttl=args.cache_ttl,
+                    knowledge_index=cache_index, cache_path=RESPONSE_CACHE_FILE
+                )
+            load_test_report = run_load_test(
+                final_model_name, csv_dataset, index_path, concurrency=args.concurrency, rate=args.rate,
+                duration=args.duration, request_timeout=args.request_timeout, response_cache=response_cache,
+                knowledge_tokens=token_budget["knowledge_tokens"], keep_alive=keep_alive
+            )
+            if response_cache is not None:
+                response_cache.save()
+                cache_index.close()
+
+        # 9. Warm-up akhir: model tetap termuat (atau disematkan) untuk pengguna pertama
+        try:
+            warm_up_model(get_ollama_client(), final_model_name, keep_alive=keep_alive)
+        except OllamaError as e:
+            log_message(f"⚠️ Warm-up akhir gagal: {e}", error=True)
+
+        run_id = append_benchmark_history({
+            "model": final_model_name,
+            "trace_id": _tracer.trace_id,
+            "quantization": quantization_method,
+            "gpu_layers": gpu_layers,
+            "dataset_hash": dataset_hash,
+            "modelfile_hash": hashlib.sha256(modelfile_content.encode("utf-8")).hexdigest(),
+            "hardware": collect_hardware_summary(gpu_info),
+            "summary": summarize_benchmark(benchmark_results),
+            "results": [{k: v for k, v in r.items() if k != "response"} for r in benchmark_results],
+            "load_test": load_test_report,
+            "evaluation": evaluation_report,
+            "multi_turn": multi_turn_report,
+        })
+        log_message(f"🗂️ Hasil benchmark disimpan ke {BENCHMARK_HISTORY_FILE} (run {run_id}).")
+
         successful_benchmarks = [r for r in benchmark_results if r['success']]
         avg_response_time = sum(r['response_time'] for r in successful_benchmarks) / len(successful_benchmarks) if successful_benchmarks else 0
         
@@ -492,20 +2793,52 @@ if __name__ == "__main__":
         if gpu_info['has_gpu']:
             log_message(f"   - Layer pada GPU: {gpu_layers}")
         log_message(f"📊 Data Training: {csv_file_used} ({len(csv_dataset)} entri)")
+        log_message(
+            f"🧠 Indeks Retrieval: {index_path} (hingga {RETRIEVAL_MAX_CANDIDATES} entri per pertanyaan dalam anggaran "
+            f"{token_budget['knowledge_tokens']} token, skor minimal {RETRIEVAL_MIN_RELATIVE_SCORE:.0%} dari skor teratas)"
+        )
         if avg_response_time > 0:
             log_message(f"⏱️ Rata-rata Waktu Respons: {avg_response_time:.2f} detik")
+        if multi_turn_report is not None:
+            log_message(f"🔁 Sesi Multi-turn (cache prefix): hemat {multi_turn_report['saved_seconds']:.2f} detik prompt eval "
+                        f"dalam {len(multi_turn_report['turns'])} giliran")
+        if evaluation_report is not None:
+            log_message(f"🎯 Akurasi Jawaban: {evaluation_report['accuracy'] * 100:.1f}% "
+                        f"({evaluation_report['samples']} sampel, {fidelity_mode_label(evaluation_report['holdout'])})")
+        log_message(f"📌 Keep-alive: {'disematkan (-1)' if keep_alive == -1 else keep_alive}")
+        cli_keep_alive = f"{keep_alive}s" if isinstance(keep_alive, int) else keep_alive
         
+        # Knowledge base tidak ada di Modelfile: jawaban berbasis data hanya didapat lewat jalur retrieval
         print("\n--- CARA MENGGUNAKAN MODEL ANDA ---")
         print(f"1. Buka terminal atau command prompt baru.")
-        print(f"2. Jalankan perintah: ollama run {final_model_name}")
-        print("3. Mulai bertanya, contoh:")
-        print("   >>> Siapa yang membuat Anda?")
-        print("   >>> Apa tujuan Anda di SD Muhammadiyah Malang?")
-        print("   >>> Ceritakan tentang nilai-nilai Muhammadiyah")
+        print(f"2. Jalankan gateway dengan konteks retrieval (anggaran {token_budget['knowledge_tokens']} token, "
+              f"sama seperti benchmark):")
+        print(f"   python gateway.py --model {final_model_name} --index {index_path} "
+              f"--knowledge-tokens {token_budget['knowledge_tokens']} --keep-alive {keep_alive}")
+        print("   (atau jalankan ulang skrip ini dengan --serve)")
+        print("3. Mulai bertanya lewat API OpenAI-compatible, contoh:")
+        print(f"   curl http://127.0.0.1:{GATEWAY_PORT}/v1/chat/completions -H 'Content-Type: application/json' \\")
+        print("        -d '{\"messages\": [{\"role\": \"user\", \"content\": \"Siapa yang membuat Anda?\"}]}'")
+        print("   Contoh pertanyaan lain: 'Apa tujuan Anda di SD Muhammadiyah Malang?', "
+              "'Ceritakan tentang nilai-nilai Muhammadiyah'")
+        print(f"⚠️ 'ollama run --keepalive {cli_keep_alive} {final_model_name}' juga bisa dipakai untuk uji cepat,")
+        print("   tetapi TANPA konteks knowledge base: model hanya mengenal SYSTEM prompt dan contoh perilakunya,")
+        print("   sehingga pertanyaan tentang isi dataset bisa dijawab keliru.")
         print("="*70)
         log_message("🌟 UMM Assistant Demo siap melayani SD Muhammadiyah Malang! 🌟")
 
+        if args.serve:
+            serve_gateway(
+                final_model_name, index_path, knowledge_tokens=token_budget["knowledge_tokens"],
+                keep_alive=keep_alive, host=args.serve_host, port=args.serve_port,
+                workers=args.serve_workers, max_queue=args.serve_queue, request_timeout=args.request_timeout,
+                dataset_hash=dataset_hash if args.response_cache else None, cache_size=args.cache_size,
+                cache_ttl=args.cache_ttl,
+            )
+
     except Exception as e:
         log_message(f"Terjadi kesalahan fatal: {str(e)}", error=True)
         log_message("Proses telah dihentikan.", error=True)
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
+    finally:
+        export_pipeline_trace()
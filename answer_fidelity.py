@@ -0,0 +1,86 @@
+import random
+from collections import Counter
+
+from knowledge_index import normalize_text, tokenize
+
+DEFAULT_PASS_THRESHOLD = 0.5
+CHAR_NGRAM_SIZE = 3
+# F-beta dengan beta=2 menimbang recall lebih berat (seperti chrF): jawaban model yang lebih
+# panjang dari jawaban referensi tidak dihukum selama fakta referensinya tercakup.
+F_BETA = 2.0
+
+
+def _f_beta(matched, candidate_total, reference_total, beta=F_BETA):
+    """(precision, recall, F-beta) dari jumlah unit yang cocok; dua teks kosong dianggap sama."""
+    if not candidate_total and not reference_total:
+        return 1.0, 1.0, 1.0
+    if not matched:
+        return 0.0, 0.0, 0.0
+    precision = matched / candidate_total
+    recall = matched / reference_total
+    beta2 = beta * beta
+    return precision, recall, (1 + beta2) * precision * recall / (beta2 * precision + recall)
+
+
+def token_overlap(candidate, reference):
+    """(precision, recall, F-beta) atas multiset token tanpa stopword."""
+    candidate_tokens, reference_tokens = Counter(tokenize(candidate)), Counter(tokenize(reference))
+    matched = sum((candidate_tokens & reference_tokens).values())
+    return _f_beta(matched, sum(candidate_tokens.values()), sum(reference_tokens.values()))
+
+
+def char_ngram_overlap(candidate, reference, n=CHAR_NGRAM_SIZE):
+    """
+    (precision, recall, F-beta) atas multiset n-gram karakter dari teks ternormalisasi.
+    Lebih toleran terhadap imbuhan dan variasi ejaan (mis. 'mengajar' vs 'pengajar') daripada token utuh.
+    """
+    def ngrams(text):
+        text = normalize_text(text)
+        return Counter(text[i:i + n] for i in range(max(0, len(text) - n + 1)))
+
+    candidate_grams, reference_grams = ngrams(candidate), ngrams(reference)
+    matched = sum((candidate_grams & reference_grams).values())
+    return _f_beta(matched, sum(candidate_grams.values()), sum(reference_grams.values()))
+
+
+def score_answer(candidate, reference, threshold=DEFAULT_PASS_THRESHOLD):
+    """
+    Menilai jawaban model terhadap jawaban referensi dataset.
+    `similarity` adalah rata-rata F-beta token dan n-gram karakter; jawaban dianggap benar
+    jika similarity >= threshold.
+    """
+    _, token_recall, token_f = token_overlap(candidate, reference)
+    _, _, char_f = char_ngram_overlap(candidate, reference)
+    similarity = (token_f + char_f) / 2
+    return {
+        "token_f": token_f,
+        "token_recall": token_recall,
+        "char_f": char_f,
+        "similarity": similarity,
+        "correct": similarity >= threshold,
+    }
+
+
+def sample_evaluation_set(records, size, seed=0):
+    """
+    Sampel deterministik pasangan Q/A untuk evaluasi. Dengan seed dan dataset yang sama setiap
+    konfigurasi dievaluasi pada pertanyaan yang sama, sehingga skor antar konfigurasi sebanding.
+    """
+    candidates = [record for record in records if record.question.strip() and record.answer.strip()]
+    if size >= len(candidates):
+        return candidates
+    return random.Random(seed).sample(candidates, size)
+
+
+def summarize_scores(scores):
+    """Akurasi dan rata-rata skor dari daftar hasil score_answer."""
+    if not scores:
+        return {"samples": 0, "accuracy": 0.0, "similarity": 0.0, "token_f": 0.0, "char_f": 0.0}
+    count = len(scores)
+    return {
+        "samples": count,
+        "accuracy": sum(1 for score in scores if score["correct"]) / count,
+        "similarity": sum(score["similarity"] for score in scores) / count,
+        "token_f": sum(score["token_f"] for score in scores) / count,
+        "char_f": sum(score["char_f"] for score in scores) / count,
+    }
@@ -0,0 +1,200 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+DEFAULT_MAX_SESSIONS = 256
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+DEFAULT_RESPONSE_RESERVE = 512  # Ruang token untuk jawaban giliran berikutnya
+MESSAGE_TEMPLATE_TOKENS = 8     # Perkiraan token penanda peran yang ditambahkan template per pesan
+
+# Satu giliran percakapan beserta biaya prompt eval yang benar-benar dibayar server.
+# prompt_eval_count dari server tidak menghitung token prefix yang diambil dari cache KV.
+# reset=True berarti prefix percakapan berubah (giliran pertama, riwayat dipadatkan, atau mode stateless).
+Turn = namedtuple(
+    "Turn", ["question", "answer", "prompt_eval_count", "prompt_eval_duration", "response_time", "context_tokens", "reset"]
+)
+
+
+def _rough_token_estimate(text):
+    return max(1, len(text) // 4)
+
+
+class ChatSession:
+    """State percakapan satu pengguna: riwayat pesan /api/chat persis seperti yang dikirim, dan daftar giliran."""
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.messages = []
+        self.turns = []
+        self.resets = 0
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()  # Giliran dalam satu sesi harus berurutan
+
+
+class SessionManager:
+    """
+    Mesin sesi multi-turn di atas /api/chat. Riwayat pesan disimpan persis seperti yang dikirim
+    (termasuk konteks retrieval tiap giliran) dan dikirim ulang utuh, sehingga prompt yang dirender
+    server diawali prefix yang sama dengan giliran sebelumnya: SYSTEM dari Modelfile, contoh perilaku,
+    dan giliran lama diambil dari cache prefix (KV cache) server, dan hanya pesan baru yang dievaluasi.
+    SYSTEM hanya dirender sekali di awal percakapan oleh template chat.
+
+    Jika riwayat tidak lagi muat di `max_context_tokens` (num_ctx model), riwayat dipadatkan menjadi
+    giliran terakhir yang muat di anggaran tanpa konteks retrieval lamanya; prefix berubah sehingga
+    giliran itu dievaluasi penuh sekali. Sesi yang lama tidak dipakai dibuang setelah `idle_timeout`
+    detik, dan jumlah sesi dibatasi `max_sessions` dengan eviksi LRU. Dengan reuse_context=False setiap
+    giliran mengirim riwayat sebagai teks di dalam satu pesan user (klien tanpa sesi), sebagai pembanding.
+    """
+
+    def __init__(self, client, model_name, max_context_tokens, prefix_tokens=0, max_sessions=DEFAULT_MAX_SESSIONS,
+                 idle_timeout=DEFAULT_IDLE_TIMEOUT, response_reserve=DEFAULT_RESPONSE_RESERVE, prompt_builder=None,
+                 estimate_tokens=None, keep_alive=None, options=None, reuse_context=True):
+        self.client = client
+        self.model_name = model_name
+        self.max_context_tokens = max_context_tokens
+        self.prefix_tokens = prefix_tokens  # SYSTEM + contoh + template yang dirender server di awal percakapan
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.response_reserve = response_reserve
+        self.prompt_builder = prompt_builder
+        self.estimate_tokens = estimate_tokens or _rough_token_estimate
+        self.keep_alive = keep_alive
+        self.options = options
+        self.reuse_context = reuse_context
+        self._sessions = OrderedDict()  # Urutan pemakaian: paling lama di depan
+        self._lock = threading.Lock()
+        self.counters = {"turns": 0, "resets": 0, "idle_evictions": 0, "lru_evictions": 0,
+                         "prompt_eval_count": 0, "prompt_eval_duration": 0.0}
+
+    # --- Manajemen sesi ---
+
+    def get(self, session_id=None):
+        """Mengambil sesi (dibuat jika belum ada) dan menandainya sebagai yang terbaru dipakai."""
+        with self._lock:
+            self._evict_idle_locked()
+            session_id = session_id or uuid.uuid4().hex
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = ChatSession(session_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.counters["lru_evictions"] += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+            return session
+
+    def _evict_idle_locked(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self.counters["idle_evictions"] += 1
+
+    def evict_idle(self):
+        """Membuang sesi yang melewati idle_timeout; mengembalikan jumlah sesi yang dibuang."""
+        with self._lock:
+            before = len(self._sessions)
+            self._evict_idle_locked()
+            return before - len(self._sessions)
+
+    def close(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # --- Percakapan ---
+
+    def _message_tokens(self, messages):
+        return sum(self.estimate_tokens(message["content"]) + MESSAGE_TEMPLATE_TOKENS for message in messages)
+
+    def _history_budget(self, prompt):
+        return (self.max_context_tokens - self.prefix_tokens - self.response_reserve
+                - self.estimate_tokens(prompt) - MESSAGE_TEMPLATE_TOKENS)
+
+    def _recent_turns(self, session, budget):
+        """Giliran terbaru (tanpa konteks retrieval lamanya) yang muat di anggaran, urut dari yang terlama."""
+        recent = []
+        for turn in reversed(session.turns):
+            cost = self.estimate_tokens(turn.question) + self.estimate_tokens(turn.answer) + 2 * MESSAGE_TEMPLATE_TOKENS
+            if cost > budget:
+                break
+            recent.insert(0, turn)
+            budget -= cost
+        return recent
+
+    def _compact_messages(self, session, prompt):
+        """Riwayat sebagai pasangan pesan user/assistant berisi pertanyaan asli, dipangkas ke anggaran."""
+        messages = []
+        for turn in self._recent_turns(session, self._history_budget(prompt)):
+            messages += [{"role": "user", "content": turn.question}, {"role": "assistant", "content": turn.answer}]
+        return messages
+
+    def _history_prompt(self, session, prompt):
+        """Riwayat sebagai teks di dalam satu pesan user, diikuti prompt baru (mode stateless)."""
+        lines = [f"Pengguna: {turn.question}\nAsisten: {turn.answer}\n"
+                 for turn in self._recent_turns(session, self._history_budget(prompt))]
+        if not lines:
+            return prompt
+        return "--- RIWAYAT PERCAKAPAN ---\n" + "\n".join(lines) + "\n" + prompt
+
+    def ask(self, session_id, question, timeout=120):
+        """
+        Menjawab satu giliran dalam sesi. Mengembalikan dict berisi response, session_id, dan metrik
+        prompt eval (prompt_eval_count, prompt_eval_duration dalam detik, context_tokens perkiraan
+        panjang percakapan di server, reset).
+        """
+        session = self.get(session_id)
+        with session.lock:
+            prompt = self.prompt_builder(question) if self.prompt_builder is not None else question
+            if not self.reuse_context:
+                history, reset = [], True
+                prompt = self._history_prompt(session, prompt)
+            elif self._message_tokens(session.messages) > self._history_budget(prompt):
+                # Riwayat penuh: dipadatkan, prefix berubah sehingga giliran ini dievaluasi penuh
+                history, reset = self._compact_messages(session, prompt), True
+                session.resets += 1
+                with self._lock:
+                    self.counters["resets"] += 1
+            else:
+                history, reset = session.messages, not session.messages
+            messages = history + [{"role": "user", "content": prompt}]
+
+            start_time = time.perf_counter()
+            response = self.client.chat(
+                self.model_name, messages, stream=False, keep_alive=self.keep_alive,
+                options=self.options, timeout=timeout
+            )
+            response_time = time.perf_counter() - start_time
+            answer = response.get("message", {}).get("content", "")
+            if self.reuse_context:
+                session.messages = messages + [{"role": "assistant", "content": answer}]
+            turn = Turn(
+                question=question,
+                answer=answer,
+                prompt_eval_count=response.get("prompt_eval_count") or 0,
+                prompt_eval_duration=(response.get("prompt_eval_duration") or 0) / 1e9,
+                response_time=response_time,
+                context_tokens=self.prefix_tokens + self._message_tokens(messages) + (response.get("eval_count") or 0),
+                reset=reset,
+            )
+            session.turns.append(turn)
+            session.last_used = time.monotonic()
+
+        with self._lock:
+            self.counters["turns"] += 1
+            self.counters["prompt_eval_count"] += turn.prompt_eval_count
+            self.counters["prompt_eval_duration"] += turn.prompt_eval_duration
+        metrics = turn._asdict()
+        metrics["response"] = metrics.pop("answer")
+        return {"session_id": session.session_id, **metrics}
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions), **self.counters}
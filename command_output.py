@@ -0,0 +1,169 @@
+import re
+import threading
+import time
+from collections import deque, namedtuple
+
+DEFAULT_MAX_LINES = 200
+
+# Satu pembaruan progres dari output `ollama pull`/`ollama create`.
+# completed/total dalam byte, rate dalam byte/detik, eta dalam detik; None jika tidak ada di baris.
+ProgressEvent = namedtuple(
+    "ProgressEvent", ["seq", "stage", "digest", "percent", "completed", "total", "rate", "eta", "timestamp"]
+)
+
+_ANSI_PATTERN = re.compile(r"\x1b\[[0-9;?]*[ -/]*[@-~]")
+_SIZE = r"\d+(?:\.\d+)?\s*[KMGT]?i?B"
+_PROGRESS_PATTERN = re.compile(
+    r"^(?P<stage>[a-zA-Z][a-zA-Z ]*?)\s+"
+    r"(?:(?:sha256[:-])?(?P<digest>[0-9a-f]{6,64})(?:\.\.\.)?:?\s+)?"
+    r"(?P<percent>\d{1,3})%"
+    # 'selesai/total' saat berjalan, atau satu ukuran di akhir baris untuk layer yang sudah selesai
+    rf"(?:.*?(?P<completed>{_SIZE})\s*/\s*(?P<total>{_SIZE})|.*?(?<![\d.])(?P<size>{_SIZE})(?=\s*$))?"
+    rf"(?:\s+(?P<rate>{_SIZE})/s)?"
+    r"(?:\s+(?P<eta>(?:\d+h)?(?:\d+m)?(?:\d+s)?))?\s*$"
+)
+_SIZE_UNITS = {"B": 1, "KB": 1000, "MB": 1000**2, "GB": 1000**3, "TB": 1000**4,
+               "KIB": 1024, "MIB": 1024**2, "GIB": 1024**3, "TIB": 1024**4}
+_ETA_PATTERN = re.compile(r"(\d+)([hms])")
+
+
+def strip_ansi(text):
+    """Membuang kode escape ANSI (warna, gerakan kursor) dari output terminal."""
+    return _ANSI_PATTERN.sub("", text)
+
+
+def parse_size(text):
+    """'2.0 GB' -> 2000000000 (byte); Ollama memakai satuan desimal."""
+    number, unit = re.match(r"(\d+(?:\.\d+)?)\s*([KMGT]?i?B)", text).groups()
+    return int(float(number) * _SIZE_UNITS[unit.upper()])
+
+
+def parse_eta(text):
+    """'1m2s' -> 62 (detik); string kosong -> None."""
+    if not text:
+        return None
+    return sum(int(value) * {"h": 3600, "m": 60, "s": 1}[unit] for value, unit in _ETA_PATTERN.findall(text))
+
+
+def parse_progress_line(line, seq=0):
+    """
+    Mengurai baris progres Ollama, mis.
+    'pulling 6a0746a1ec1a... 45% ▕███     ▏ 900 MB/2.0 GB  25 MB/s  44s' atau baris layer
+    selesai 'pulling 6a0746a1ec1a... 100% ▕████████▏ 2.0 GB' (completed = total = ukuran),
+    menjadi ProgressEvent. Baris yang bukan progres menghasilkan None.
+    """
+    match = _PROGRESS_PATTERN.match(strip_ansi(line).strip())
+    if match is None:
+        return None
+    fields = match.groupdict()
+    if fields["size"]:
+        fields["completed"] = fields["total"] = fields["size"]
+    return ProgressEvent(
+        seq=seq,
+        stage=fields["stage"].strip().lower(),
+        digest=fields["digest"],
+        percent=min(100, int(fields["percent"])),
+        completed=parse_size(fields["completed"]) if fields["completed"] else None,
+        total=parse_size(fields["total"]) if fields["total"] else None,
+        rate=parse_size(fields["rate"]) if fields["rate"] else None,
+        eta=parse_eta(fields["eta"]),
+        timestamp=time.time(),
+    )
+
+
+class OutputRingBuffer:
+    """
+    Buffer cincin berukuran tetap untuk baris output proses; aman ditulis dari beberapa thread.
+    Setiap baris diberi nomor urut global sehingga urutan kedatangan stdout/stderr tetap jelas
+    dan pembaca dapat mengambil baris baru secara inkremental lewat lines(since=...).
+    """
+
+    def __init__(self, max_lines=DEFAULT_MAX_LINES):
+        self._lines = deque(maxlen=max_lines)
+        self._lock = threading.Lock()
+        self._seq = 0
+
+    def append(self, stream, line, keep=True):
+        """
+        Mencatat satu baris dan mengembalikan nomor urutnya. Dengan keep=False baris hanya
+        diberi nomor tanpa disimpan (mis. pembaruan progres yang berulang).
+        """
+        with self._lock:
+            self._seq += 1
+            if keep:
+                self._lines.append((self._seq, stream, line))
+            return self._seq
+
+    @property
+    def total(self):
+        """Jumlah seluruh baris yang pernah dicatat."""
+        return self._seq
+
+    @property
+    def dropped(self):
+        """Jumlah baris yang tidak ada di buffer (tergeser atau tidak disimpan)."""
+        with self._lock:
+            return self._seq - len(self._lines)
+
+    def lines(self, since=0):
+        """Daftar (seq, stream, baris) yang masih ada di buffer dengan seq > since."""
+        with self._lock:
+            return [entry for entry in self._lines if entry[0] > since]
+
+    def text(self, last=None):
+        """Baris-baris terakhir sebagai satu string; baris yang tergeser ditandai di awal."""
+        with self._lock:
+            entries = list(self._lines)[-last:] if last else list(self._lines)
+            omitted = self._seq - len(entries)
+        lines = [line for _, _, line in entries]
+        if omitted:
+            lines.insert(0, f"... ({omitted} baris sebelumnya tidak disimpan)")
+        return "\n".join(lines)
+
+
+class TransferStats:
+    """Mengakumulasi ProgressEvent menjadi statistik transfer per layer dan keseluruhan."""
+
+    def __init__(self):
+        self._layers = {}  # digest -> [completed awal, completed terakhir, total]
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.peak_rate = 0
+        self.events = 0
+
+    def update(self, event):
+        if event is None or event.completed is None:
+            return
+        key = event.digest or event.stage
+        with self._lock:
+            self.events += 1
+            layer = self._layers.setdefault(key, [event.completed, event.completed, event.total])
+            layer[1] = max(layer[1], event.completed)
+            layer[2] = event.total or layer[2]
+            if event.rate:
+                self.peak_rate = max(self.peak_rate, event.rate)
+
+    def summary(self):
+        """Byte yang benar-benar ditransfer selama perintah berjalan, ukuran total, dan throughput rata-rata."""
+        elapsed = time.perf_counter() - self.started_at
+        with self._lock:
+            transferred = sum(last - first for first, last, _ in self._layers.values())
+            total = sum(size or 0 for _, _, size in self._layers.values())
+            layers = len(self._layers)
+        return {
+            "layers": layers,
+            "transferred_bytes": transferred,
+            "total_bytes": total,
+            "elapsed": elapsed,
+            "throughput": transferred / elapsed if elapsed > 0 else 0.0,
+            "peak_rate": self.peak_rate,
+        }
+
+
+def format_bytes(value):
+    """Ukuran byte dalam satuan desimal yang mudah dibaca (sama seperti tampilan Ollama)."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(value) < 1000:
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value:.0f} B"
+        value /= 1000
+    return f"{value:.1f} TB"
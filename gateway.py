@@ -0,0 +1,786 @@
+"""
+Gateway HTTP ringan yang kompatibel dengan OpenAI Chat Completions untuk model UMM Assistant.
+
+Fitur: antrean permintaan berkapasitas terbatas dengan penjadwalan round-robin per klien,
+batas konkurensi per klien yang mengidentifikasi diri, penggabungan permintaan identik, timeout dan pembatalan
+(termasuk saat klien memutus koneksi), penolakan beban dengan 429 saat penuh, cache jawaban opsional
+di depan backend, serta endpoint /health dan /metrics (format teks Prometheus).
+
+Backend dapat diganti: fungsi backend(model, messages, options) yang menghasilkan potongan
+teks (str) dan opsional dict usage (boleh berisi `sources`, sidik jari dokumen konteks untuk cache).
+Gunakan --stub untuk menjalankan gateway tanpa Ollama.
+Dengan --index, konteks retrieval disusun oleh prompt builder pipeline (SampriTrainWalawe)
+dengan anggaran --knowledge-tokens yang sama seperti saat benchmark.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import queue
+import select
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ollama_client import OllamaClient
+
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 2             # Samakan dengan OLLAMA_NUM_PARALLEL di server
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_MAX_PENDING_PER_CLIENT = 8
+DEFAULT_MAX_IN_FLIGHT_PER_CLIENT = 1
+DEFAULT_REQUEST_TIMEOUT = 120
+LATENCY_WINDOW = 1024           # Jumlah sampel terakhir untuk kuantil latensi di /metrics
+METRIC_PREFIX = "umm_gateway"
+POLL_INTERVAL = 0.25
+
+
+class GatewayBusy(Exception):
+    """Permintaan ditolak karena antrean penuh atau batas per klien tercapai (HTTP 429)."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    """Satu permintaan chat di antrean; dapat ditunggu oleh beberapa klien bila digabung."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, client_id, model, messages, options, stream, timeout, key, identified=True):
+        self.job_id = next(self._ids)
+        self.client_id = client_id
+        self.identified = identified  # False: client_id hanya alamat IP, batas per klien tidak berlaku
+        self.model = model
+        self.messages = messages
+        self.options = options
+        self.key = key
+        self.created_at = time.perf_counter()
+        self.deadline = self.created_at + timeout
+        self.started_at = None
+        self.finished_at = None
+        self.chunks = queue.Queue() if stream else None
+        self.cache_question = None  # Pertanyaan yang jawabannya disimpan ke cache setelah generasi
+        self.done = threading.Event()
+        self.cancelled = threading.Event()
+        self.waiters = 1
+        self.status = None
+        self.error = None
+        self.content = ""
+        self.usage = {}
+
+
+class RequestScheduler:
+    """
+    Antrean berkapasitas terbatas dengan antrean terpisah per klien yang dilayani bergiliran
+    (round-robin), sehingga satu klien yang mengirim banyak permintaan tidak memonopoli worker.
+    Klien yang sudah mencapai batas permintaan berjalan dilewati sampai salah satunya selesai.
+    Batas per klien hanya berlaku untuk job dari klien yang mengidentifikasi diri; job yang hanya
+    dikenali dari alamat IP (banyak pengguna bisa berbagi satu IP di balik NAT) tetap dilayani
+    bergiliran, tetapi hanya dibatasi kapasitas antrean global.
+    """
+
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE, max_pending_per_client=DEFAULT_MAX_PENDING_PER_CLIENT,
+                 max_in_flight_per_client=DEFAULT_MAX_IN_FLIGHT_PER_CLIENT):
+        self.max_queue = max_queue
+        self.max_pending_per_client = max_pending_per_client
+        self.max_in_flight_per_client = max_in_flight_per_client
+        self._pending = {}          # client_id -> deque job
+        self._rotation = deque()    # client_id yang punya job menunggu, urutan giliran
+        self._in_flight = {}        # client_id -> jumlah job berjalan
+        self._depth = 0
+        self._condition = threading.Condition()
+
+    @property
+    def depth(self):
+        return self._depth
+
+    @property
+    def in_flight(self):
+        return sum(self._in_flight.values())
+
+    @property
+    def clients(self):
+        with self._condition:
+            return len(set(self._pending) | {c for c, n in self._in_flight.items() if n})
+
+    def submit(self, job):
+        """Memasukkan job ke antrean; GatewayBusy jika antrean global atau antrean klien penuh."""
+        with self._condition:
+            if self._depth >= self.max_queue:
+                raise GatewayBusy("Antrean gateway penuh, coba lagi sebentar.", retry_after=2)
+            client_queue = self._pending.get(job.client_id)
+            if (job.identified and client_queue is not None
+                    and len(client_queue) >= self.max_pending_per_client):
+                raise GatewayBusy("Terlalu banyak permintaan menunggu dari klien ini.", retry_after=1)
+            if client_queue is None:
+                client_queue = self._pending[job.client_id] = deque()
+                self._rotation.append(job.client_id)
+            client_queue.append(job)
+            self._depth += 1
+            self._condition.notify()
+
+    def next_job(self, timeout=None):
+        """Mengambil job berikutnya secara round-robin; None jika tidak ada job yang boleh jalan."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._condition:
+            while True:
+                for _ in range(len(self._rotation)):
+                    client_id = self._rotation[0]
+                    self._rotation.rotate(-1)
+                    client_queue = self._pending[client_id]
+                    if (client_queue[0].identified
+                            and self._in_flight.get(client_id, 0) >= self.max_in_flight_per_client):
+                        continue
+                    job = client_queue.popleft()
+                    if not client_queue:
+                        del self._pending[client_id]
+                        self._rotation.remove(client_id)
+                    self._depth -= 1
+                    self._in_flight[client_id] = self._in_flight.get(client_id, 0) + 1
+                    return job
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def finish(self, job):
+        """Menandai job selesai dijalankan sehingga slot klien tersebut terbuka lagi."""
+        with self._condition:
+            count = self._in_flight.get(job.client_id, 0) - 1
+            if count > 0:
+                self._in_flight[job.client_id] = count
+            else:
+                self._in_flight.pop(job.client_id, None)
+            self._condition.notify_all()
+
+    def remove(self, job):
+        """Mengeluarkan job yang belum berjalan dari antrean; False jika job sudah diambil worker."""
+        with self._condition:
+            client_queue = self._pending.get(job.client_id)
+            if client_queue is None or job not in client_queue:
+                return False
+            client_queue.remove(job)
+            if not client_queue:
+                del self._pending[job.client_id]
+                self._rotation.remove(job.client_id)
+            self._depth -= 1
+            return True
+
+    def wake_all(self):
+        with self._condition:
+            self._condition.notify_all()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+class Gateway:
+    """Inti gateway: antrean, worker yang memanggil backend, penggabungan permintaan, dan metrik."""
+
+    def __init__(self, backend, model_name, workers=DEFAULT_WORKERS, max_queue=DEFAULT_MAX_QUEUE,
+                 max_pending_per_client=DEFAULT_MAX_PENDING_PER_CLIENT,
+                 max_in_flight_per_client=DEFAULT_MAX_IN_FLIGHT_PER_CLIENT,
+                 request_timeout=DEFAULT_REQUEST_TIMEOUT, coalesce=True, response_cache=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.workers = workers
+        self.request_timeout = request_timeout
+        self.coalesce = coalesce
+        self.response_cache = response_cache
+        self.scheduler = RequestScheduler(max_queue, max_pending_per_client, max_in_flight_per_client)
+        self._coalescable = {}      # kunci permintaan -> job non-stream yang belum selesai
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self.started_at = time.time()
+        self.counters = {"requests": {}, "coalesced": 0, "cancelled": 0, "completion_tokens": 0}
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._queue_waits = deque(maxlen=LATENCY_WINDOW)
+
+    # --- Siklus hidup ---
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"gateway-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        self.scheduler.wake_all()
+        for thread in self._threads:
+            thread.join(timeout=2)
+
+    # --- Penerimaan permintaan ---
+
+    @staticmethod
+    def request_key(model, messages, options):
+        payload = json.dumps([model, messages, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def cacheable_question(messages, options):
+        """
+        Pertanyaan untuk cache jawaban, atau None. Hanya permintaan satu giliran (satu pesan user,
+        tanpa riwayat atau system tambahan) dengan opsi sampling default yang jawabannya bisa dipakai ulang.
+        """
+        if options or len(messages) != 1 or messages[0]["role"] != "user":
+            return None
+        return messages[0]["content"]
+
+    def submit(self, client_id, messages, options=None, stream=False, timeout=None, identified=True):
+        """
+        Mendaftarkan permintaan. Dengan cache jawaban, pertanyaan yang sudah pernah dijawab
+        (identik, near-exact, atau cocok dengan dataset) langsung diselesaikan tanpa masuk antrean.
+        Permintaan non-stream yang identik dengan permintaan yang masih menunggu atau berjalan
+        digabung ke job tersebut. identified=False berarti client_id hanya alamat IP sehingga
+        batas per klien tidak diterapkan. Mengembalikan (job, digabung).
+        """
+        options = options or {}
+        key = self.request_key(self.model_name, messages, options)
+        timeout = min(timeout or self.request_timeout, self.request_timeout)
+        question = self.cacheable_question(messages, options) if self.response_cache is not None else None
+        if question is not None:
+            hit = self.response_cache.lookup(question)
+            if hit is not None:
+                return self._cached_job(client_id, messages, options, stream, timeout, key, identified, hit), False
+        with self._lock:
+            if self.coalesce and not stream:
+                existing = self._coalescable.get(key)
+                if existing is not None and not existing.done.is_set() and not existing.cancelled.is_set():
+                    existing.waiters += 1
+                    self.counters["coalesced"] += 1
+                    return existing, True
+            job = _Job(client_id, self.model_name, messages, options, stream, timeout, key, identified)
+            job.cache_question = question
+            try:
+                self.scheduler.submit(job)
+            except GatewayBusy:
+                self.counters["requests"][429] = self.counters["requests"].get(429, 0) + 1
+                raise
+            if self.coalesce and not stream:
+                self._coalescable[key] = job
+        return job, False
+
+    def _cached_job(self, client_id, messages, options, stream, timeout, key, identified, hit):
+        """Job yang sudah selesai dengan jawaban dari cache; backend dan antrean tidak disentuh."""
+        job = _Job(client_id, self.model_name, messages, options, stream, timeout, key, identified)
+        job.started_at = job.finished_at = time.perf_counter()
+        job.content = hit.answer
+        job.usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        job.status = 200
+        if job.chunks is not None:
+            job.chunks.put(hit.answer)
+            job.chunks.put(None)
+        with self._lock:
+            self._latencies.append(job.finished_at - job.created_at)
+            self._queue_waits.append(0.0)
+        self._count_status(200)
+        job.done.set()
+        return job
+
+    def release(self, job, status):
+        """
+        Dipanggil saat satu penunggu berhenti menunggu (timeout atau koneksi putus). Job dibatalkan
+        hanya jika tidak ada penunggu lain; job yang belum berjalan langsung dikeluarkan dari antrean.
+        """
+        with self._lock:
+            job.waiters -= 1
+            if job.waiters > 0:
+                return
+            job.cancelled.set()
+            if self._coalescable.get(job.key) is job:
+                del self._coalescable[job.key]
+            self.counters["cancelled"] += 1
+        if self.scheduler.remove(job):
+            job.status = status
+            job.done.set()
+            if job.chunks is not None:
+                job.chunks.put(None)
+        self._count_status(status)
+
+    def wait(self, job, disconnected=None):
+        """
+        Menunggu job selesai sambil memeriksa batas waktu dan koneksi klien.
+        Mengembalikan status HTTP: 200, 502, 504 (timeout), atau 499 (klien memutus koneksi).
+        """
+        deadline = job.deadline
+        while not job.done.wait(POLL_INTERVAL):
+            if disconnected is not None and disconnected():
+                self.release(job, 499)
+                return 499
+            if time.perf_counter() > deadline:
+                self.release(job, 504)
+                return 504
+        return job.status
+
+    # --- Worker ---
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self.scheduler.next_job(timeout=POLL_INTERVAL)
+            if job is None:
+                continue
+            try:
+                self._run(job)
+            finally:
+                self.scheduler.finish(job)
+
+    def _run(self, job):
+        job.started_at = time.perf_counter()
+        self._queue_waits.append(job.started_at - job.created_at)
+        status, pieces = 200, []
+        if job.cancelled.is_set() or job.started_at > job.deadline:
+            status = 499 if job.cancelled.is_set() else 504
+        else:
+            generator = None
+            try:
+                generator = iter(self.backend(job.model, job.messages, job.options))
+                for item in generator:
+                    if isinstance(item, dict):
+                        job.usage.update(item)
+                        continue
+                    if job.cancelled.is_set():
+                        status = 499
+                        break
+                    if time.perf_counter() > job.deadline:
+                        status = 504
+                        break
+                    pieces.append(item)
+                    if job.chunks is not None:
+                        job.chunks.put(item)
+            except Exception as e:  # Error backend dilaporkan ke klien sebagai 502
+                status, job.error = 502, str(e)
+            finally:
+                if generator is not None and hasattr(generator, "close"):
+                    generator.close()  # Menutup stream ke backend agar generasi ikut berhenti
+
+        job.finished_at = time.perf_counter()
+        job.content = "".join(pieces)
+        with self._lock:
+            if self._coalescable.get(job.key) is job:
+                del self._coalescable[job.key]
+            already_released = job.done.is_set()
+            job.status = job.status or status
+            if status == 200:
+                self._latencies.append(job.finished_at - job.created_at)
+                self.counters["completion_tokens"] += job.usage.get("completion_tokens", 0)
+        if status == 200 and job.cache_question is not None:
+            self.response_cache.store(job.cache_question, job.content, job.finished_at - job.started_at,
+                                      sources=job.usage.get("sources"))
+        if not already_released and not job.cancelled.is_set():
+            # Status permintaan yang dilepas klien sudah dihitung di release()
+            for _ in range(job.waiters):
+                self._count_status(job.status)
+        job.done.set()
+        if job.chunks is not None:
+            job.chunks.put(None)
+
+    # --- Metrik ---
+
+    def _count_status(self, status):
+        with self._lock:
+            self.counters["requests"][status] = self.counters["requests"].get(status, 0) + 1
+
+    def health(self):
+        saturated = self.scheduler.depth >= self.scheduler.max_queue
+        return {
+            "status": "saturated" if saturated else "ok",
+            "model": self.model_name,
+            "queue_depth": self.scheduler.depth,
+            "queue_capacity": self.scheduler.max_queue,
+            "in_flight": self.scheduler.in_flight,
+            "workers": self.workers,
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+        }
+
+    def metrics_text(self):
+        """Metrik gateway dalam format teks Prometheus."""
+        with self._lock:
+            requests = dict(self.counters["requests"])
+            latencies = list(self._latencies)
+            queue_waits = list(self._queue_waits)
+            coalesced = self.counters["coalesced"]
+            cancelled = self.counters["cancelled"]
+            completion_tokens = self.counters["completion_tokens"]
+        lines = [
+            f"# HELP {METRIC_PREFIX}_queue_depth Jumlah permintaan yang menunggu di antrean.",
+            f"# TYPE {METRIC_PREFIX}_queue_depth gauge",
+            f"{METRIC_PREFIX}_queue_depth {self.scheduler.depth}",
+            f"# HELP {METRIC_PREFIX}_queue_capacity Kapasitas maksimum antrean.",
+            f"# TYPE {METRIC_PREFIX}_queue_capacity gauge",
+            f"{METRIC_PREFIX}_queue_capacity {self.scheduler.max_queue}",
+            f"# HELP {METRIC_PREFIX}_in_flight Jumlah permintaan yang sedang diproses backend.",
+            f"# TYPE {METRIC_PREFIX}_in_flight gauge",
+            f"{METRIC_PREFIX}_in_flight {self.scheduler.in_flight}",
+            f"# HELP {METRIC_PREFIX}_active_clients Jumlah klien dengan permintaan menunggu atau berjalan.",
+            f"# TYPE {METRIC_PREFIX}_active_clients gauge",
+            f"{METRIC_PREFIX}_active_clients {self.scheduler.clients}",
+            f"# HELP {METRIC_PREFIX}_requests_total Permintaan selesai per status HTTP.",
+            f"# TYPE {METRIC_PREFIX}_requests_total counter",
+        ]
+        lines += [f'{METRIC_PREFIX}_requests_total{{status="{status}"}} {count}'
+                  for status, count in sorted(requests.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_coalesced_total Permintaan yang digabung ke permintaan identik.",
+            f"# TYPE {METRIC_PREFIX}_coalesced_total counter",
+            f"{METRIC_PREFIX}_coalesced_total {coalesced}",
+            f"# HELP {METRIC_PREFIX}_cancelled_total Permintaan yang dibatalkan (timeout atau koneksi putus).",
+            f"# TYPE {METRIC_PREFIX}_cancelled_total counter",
+            f"{METRIC_PREFIX}_cancelled_total {cancelled}",
+            f"# HELP {METRIC_PREFIX}_completion_tokens_total Token keluaran yang dihasilkan backend.",
+            f"# TYPE {METRIC_PREFIX}_completion_tokens_total counter",
+            f"{METRIC_PREFIX}_completion_tokens_total {completion_tokens}",
+        ]
+        if self.response_cache is not None:
+            lines += self._cache_metric_lines(self.response_cache.metrics())
+        for name, help_text, values in (
+            ("request_latency_seconds", "Latensi permintaan sukses dari masuk antrean sampai selesai.", latencies),
+            ("queue_wait_seconds", "Waktu tunggu di antrean sebelum diproses worker.", queue_waits),
+        ):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} summary"]
+            lines += [f'{metric}{{quantile="{q}"}} {_percentile(values, q * 100):.6f}' for q in (0.5, 0.95, 0.99)]
+            lines += [f"{metric}_sum {sum(values):.6f}", f"{metric}_count {len(values)}"]
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _cache_metric_lines(stats):
+        metric = f"{METRIC_PREFIX}_cache"
+        lines = [
+            f"# HELP {metric}_hits_total Permintaan yang dijawab dari cache per jenis kecocokan.",
+            f"# TYPE {metric}_hits_total counter",
+        ]
+        lines += [f'{metric}_hits_total{{kind="{kind}"}} {stats[f"{kind}_hits"]}' for kind in ("exact", "near", "dataset")]
+        for name, help_text, value in (
+            ("misses_total", "Pertanyaan yang tidak ada di cache dan diteruskan ke backend.", stats["misses"]),
+            ("evictions_total", "Entri yang dibuang karena cache penuh (LRU).", stats["evictions"]),
+            ("expired_total", "Entri yang dibuang karena melewati TTL.", stats["expired"]),
+        ):
+            lines += [f"# HELP {metric}_{name} {help_text}", f"# TYPE {metric}_{name} counter", f"{metric}_{name} {value}"]
+        lines += [
+            f"# HELP {metric}_entries Jumlah entri di cache jawaban.",
+            f"# TYPE {metric}_entries gauge",
+            f"{metric}_entries {stats['entries']}",
+            f"# HELP {metric}_latency_saved_seconds_total Estimasi waktu generasi yang dihemat cache.",
+            f"# TYPE {metric}_latency_saved_seconds_total counter",
+            f"{metric}_latency_saved_seconds_total {stats['latency_saved']:.6f}",
+        ]
+        return lines
+
+
+# --- HTTP ---
+
+def _client_disconnected(sock):
+    """True jika klien sudah menutup koneksi (socket terbaca tetapi tidak ada data)."""
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+def _completion_id(job):
+    return f"chatcmpl-{job.job_id:08x}"
+
+
+def make_handler(gateway):
+    """Membuat kelas handler HTTP yang terikat ke instance Gateway."""
+
+    class GatewayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        server_version = "UMMGateway/1.0"
+
+        def log_message(self, format, *args):
+            pass  # Log akses tidak ditampilkan; gunakan /metrics
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                self.close_connection = True  # Klien sudah menutup koneksi
+
+        def _send_error(self, status, message, error_type, headers=None):
+            self._send_json(status, {"error": {"message": message, "type": error_type, "code": status}}, headers)
+
+        def _client_id(self, body):
+            """(client_id, teridentifikasi); tanpa identitas eksplisit dipakai alamat IP."""
+            client_id = self.headers.get("X-Client-Id") or body.get("user") or self.headers.get("Authorization")
+            if client_id:
+                return str(client_id), True
+            return f"ip:{self.client_address[0]}", False
+
+        def do_GET(self):
+            if self.path == "/health":
+                health = gateway.health()
+                self._send_json(200 if health["status"] == "ok" else 503, health)
+            elif self.path == "/metrics":
+                body = gateway.metrics_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            elif self.path == "/v1/models":
+                self._send_json(200, {"object": "list", "data": [
+                    {"id": gateway.model_name, "object": "model", "created": int(gateway.started_at), "owned_by": "umm"}
+                ]})
+            else:
+                self._send_error(404, f"Endpoint tidak dikenal: {self.path}", "not_found")
+
+        def do_POST(self):
+            if self.path != "/v1/chat/completions":
+                self._send_error(404, f"Endpoint tidak dikenal: {self.path}", "not_found")
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                messages = body["messages"]
+                if not isinstance(messages, list) or not messages:
+                    raise ValueError("'messages' harus berupa daftar yang tidak kosong")
+                for message in messages:
+                    if not isinstance(message, dict):
+                        raise ValueError("setiap pesan harus berupa objek {'role', 'content'}")
+                    if not isinstance(message.get("role"), str) or not isinstance(message.get("content"), str):
+                        raise ValueError("'role' dan 'content' setiap pesan harus berupa string")
+                messages = [{"role": m["role"], "content": m["content"]} for m in messages]
+                timeout = body.get("timeout")
+                if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                            or not timeout > 0):
+                    raise ValueError("'timeout' harus berupa angka positif (detik)")
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_error(400, f"Permintaan tidak valid: {e}", "invalid_request_error")
+                return
+
+            options = {}
+            if body.get("max_tokens") is not None:
+                options["num_predict"] = body["max_tokens"]
+            for field in ("temperature", "top_p", "seed", "stop"):
+                if body.get(field) is not None:
+                    options[field] = body[field]
+            stream = bool(body.get("stream"))
+            client_id, identified = self._client_id(body)
+            try:
+                job, _ = gateway.submit(client_id, messages, options, stream=stream, timeout=timeout,
+                                        identified=identified)
+            except GatewayBusy as e:
+                self._send_error(429, str(e), "rate_limit_exceeded", {"Retry-After": str(e.retry_after)})
+                return
+
+            if stream:
+                self._stream_response(job)
+            else:
+                self._complete_response(job)
+
+        def _complete_response(self, job):
+            status = gateway.wait(job, disconnected=lambda: _client_disconnected(self.connection))
+            if status == 499:
+                self.close_connection = True
+                return
+            if status == 504:
+                self._send_error(504, "Permintaan melebihi batas waktu.", "timeout")
+                return
+            if status != 200:
+                self._send_error(502, f"Backend gagal: {job.error}", "backend_error")
+                return
+            prompt_tokens = job.usage.get("prompt_tokens", 0)
+            completion_tokens = job.usage.get("completion_tokens", 0)
+            self._send_json(200, {
+                "id": _completion_id(job),
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": job.model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": job.content},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            })
+
+        def _stream_response(self, job):
+            """Server-sent events seperti OpenAI; penulisan yang gagal berarti klien sudah pergi."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def event(delta, finish_reason=None):
+                chunk = {"id": _completion_id(job), "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": job.model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def finish(status):
+                """Chunk penutup; timeout dan error backend diberi finish_reason sendiri dan chunk error."""
+                if status == 200:
+                    event({}, "stop")
+                    return
+                # Bukan "length": jawaban yang terpotong karena batas waktu tidak sama dengan batas token
+                if status == 504:
+                    finish_reason, error_type, message = "timeout", "timeout", "Permintaan melebihi batas waktu."
+                else:
+                    finish_reason, error_type, message = "error", "backend_error", f"Backend gagal: {job.error}"
+                event({}, finish_reason)
+                error = {"error": {"message": message, "type": error_type, "code": status}}
+                self.wfile.write(f"data: {json.dumps(error, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+            try:
+                event({"role": "assistant"})
+                while True:
+                    try:
+                        piece = job.chunks.get(timeout=POLL_INTERVAL)
+                    except queue.Empty:
+                        if time.perf_counter() > job.deadline:
+                            gateway.release(job, 504)
+                            finish(504)
+                            break
+                        if _client_disconnected(self.connection):
+                            gateway.release(job, 499)
+                            return
+                        continue
+                    if piece is None:
+                        finish(job.status)
+                        break
+                    event({"content": piece})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except OSError:
+                if not job.done.is_set():
+                    gateway.release(job, 499)
+
+    return GatewayHandler
+
+
+def create_server(gateway, host="127.0.0.1", port=DEFAULT_PORT):
+    """Membuat ThreadingHTTPServer untuk gateway (belum dijalankan)."""
+    server = ThreadingHTTPServer((host, port), make_handler(gateway))
+    server.daemon_threads = True
+    return server
+
+
+# --- Backend ---
+
+def ollama_backend(client=None, prompt_builder=None, keep_alive=None):
+    """
+    Backend yang meneruskan percakapan ke /api/chat Ollama secara streaming.
+    `prompt_builder(pertanyaan)` opsional mengganti isi pesan user terakhir, mis. dengan prompt
+    yang sudah disisipi konteks retrieval, dan mengembalikan (prompt, sources); sources (sidik jari
+    dokumen konteks, atau None) dilaporkan lewat usage agar cache jawaban tahu kapan entri basi.
+    SYSTEM tetap diambil dari Modelfile.
+    """
+    client = client or OllamaClient()
+
+    def backend(model, messages, options):
+        if prompt_builder is not None and messages and messages[-1]["role"] == "user":
+            prompt, sources = prompt_builder(messages[-1]["content"])
+            messages = messages[:-1] + [{"role": "user", "content": prompt}]
+            yield {"sources": sources}
+        for chunk in client.chat(model, messages, options=options, stream=True, keep_alive=keep_alive):
+            piece = chunk.get("message", {}).get("content", "")
+            if piece:
+                yield piece
+            if chunk.get("done"):
+                yield {"prompt_tokens": chunk.get("prompt_eval_count", 0),
+                       "completion_tokens": chunk.get("eval_count", 0)}
+
+    return backend
+
+
+def stub_backend(delay=0.05, words=12):
+    """Backend tiruan untuk uji coba tanpa GPU: mengulang pertanyaan terakhir kata demi kata."""
+
+    def backend(model, messages, options):
+        question = messages[-1]["content"]
+        reply = f"Jawaban contoh untuk: {question}".split()[:words]
+        for word in reply:
+            time.sleep(delay)
+            yield word + " "
+        yield {"prompt_tokens": sum(len(m["content"].split()) for m in messages), "completion_tokens": len(reply)}
+
+    return backend
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Gateway OpenAI-compatible untuk model UMM Assistant Demo.")
+    parser.add_argument("--model", required=True, help="Nama model Ollama, mis. UMM-Assistant-Demo-q4_k_m-gpu.")
+    parser.add_argument("--host", default="127.0.0.1", help="Alamat bind gateway (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port gateway (default: {DEFAULT_PORT}).")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Permintaan paralel ke backend; samakan dengan OLLAMA_NUM_PARALLEL.")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="Kapasitas antrean sebelum 429.")
+    parser.add_argument("--max-pending-per-client", type=int, default=DEFAULT_MAX_PENDING_PER_CLIENT,
+                        help="Permintaan menunggu maksimum per klien.")
+    parser.add_argument("--max-in-flight-per-client", type=int, default=DEFAULT_MAX_IN_FLIGHT_PER_CLIENT,
+                        help="Permintaan berjalan maksimum per klien yang mengirim X-Client-Id, user, atau Authorization.")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT,
+                        help="Batas waktu per permintaan (antre + generasi) dalam detik.")
+    parser.add_argument("--no-coalesce", action="store_true", help="Jangan gabungkan permintaan identik.")
+    parser.add_argument("--index", default=None, help="File indeks retrieval untuk menyisipkan konteks pengetahuan.")
+    parser.add_argument("--knowledge-tokens", type=int, default=None, metavar="N",
+                        help="Anggaran token konteks retrieval per pertanyaan (default: sama dengan pipeline).")
+    parser.add_argument("--response-cache", action="store_true",
+                        help="Jawab pertanyaan satu giliran yang berulang dari cache (di memori) sebelum ke backend.")
+    parser.add_argument("--cache-size", type=int, default=2048, help="Jumlah entri maksimum cache jawaban (LRU).")
+    parser.add_argument("--keep-alive", default=None, help="keep_alive untuk permintaan ke Ollama, mis. 30m atau -1.")
+    parser.add_argument("--stub", action="store_true", help="Gunakan backend tiruan (tanpa Ollama/GPU).")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    knowledge_index = None
+    if args.index:
+        from knowledge_index import KnowledgeIndex
+        knowledge_index = KnowledgeIndex(args.index)
+    if args.stub:
+        backend = stub_backend()
+    else:
+        keep_alive = int(args.keep_alive) if args.keep_alive and args.keep_alive.lstrip("-").isdigit() else args.keep_alive
+        prompt_builder = None
+        if knowledge_index is not None:
+            # Prompt builder dan anggaran token yang sama dengan pipeline build/benchmark
+            from SampriTrainWalawe import RETRIEVAL_KNOWLEDGE_TOKENS, retrieval_prompt_builder
+            knowledge_tokens = args.knowledge_tokens or RETRIEVAL_KNOWLEDGE_TOKENS
+            prompt_builder = retrieval_prompt_builder(knowledge_index, knowledge_tokens)
+        backend = ollama_backend(prompt_builder=prompt_builder, keep_alive=keep_alive)
+    response_cache = None
+    if args.response_cache:
+        from response_cache import ResponseCache
+        # Tanpa dataset_hash/cache_path: cache hanya hidup selama proses gateway berjalan
+        response_cache = ResponseCache(None, max_entries=args.cache_size, knowledge_index=knowledge_index)
+    gateway = Gateway(
+        backend, args.model, workers=args.workers, max_queue=args.max_queue,
+        max_pending_per_client=args.max_pending_per_client, max_in_flight_per_client=args.max_in_flight_per_client,
+        request_timeout=args.timeout, coalesce=not args.no_coalesce, response_cache=response_cache,
+    ).start()
+    server = create_server(gateway, args.host, args.port)
+    print(f"🌐 Gateway untuk '{args.model}' berjalan di http://{args.host}:{args.port}/v1/chat/completions", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        gateway.stop()
+        if knowledge_index is not None:
+            knowledge_index.close()
@@ -0,0 +1,317 @@
+import array
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import unicodedata
+
+# Format file indeks: MAGIC | panjang header (uint32) | header JSON | bagian-bagian biner.
+# Semua bagian biner disejajarkan 4 byte agar bisa di-cast langsung dari mmap.
+INDEX_MAGIC = b"UMMKBIX1"
+INDEX_VERSION = 2
+FINGERPRINT_SIZE = 8  # Byte per sidik jari dokumen (BLAKE2b)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+QUESTION_WEIGHT = 2.0  # Istilah pada pertanyaan lebih menentukan daripada istilah pada jawaban
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "\"'.,!?;:()[]{}-–—“”‘’ "
+_STOPWORDS = frozenset("""
+a an the is are was were be been of to in on for and or at by with from as it its this that
+what which who whom how why when where do does did can could will would should about into
+yang dan di ke dari untuk dengan pada adalah itu ini apa siapa bagaimana kapan mengapa dimana
+atau juga akan dalam oleh sebagai tidak ada anda saya kami kita
+""".split())
+
+# Urutan bagian biner di dalam file beserta kode tipe array-nya
+_SECTIONS = (
+    ("term_offsets", "I"),
+    ("term_blob", "B"),
+    ("postings_offsets", "I"),
+    ("postings_docs", "I"),
+    ("postings_weights", "f"),
+    ("idf", "f"),
+    ("doc_lengths", "f"),
+    ("doc_offsets", "I"),
+    ("doc_blob", "B"),
+    ("doc_fingerprints", "B"),
+)
+
+_FIELD_SEPARATOR = "\x1f"
+
+
+def normalize_text(text):
+    """Normalisasi teks untuk perbandingan: NFKC, huruf kecil, spasi dirapikan, tanda baca di tepi dibuang."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE_PATTERN.sub(" ", text).strip(_EDGE_PUNCTUATION)
+
+
+def tokenize(text, keep=frozenset()):
+    """Memecah teks menjadi daftar token huruf kecil tanpa stopword; kata di `keep` tidak dibuang."""
+    return [t for t in _TOKEN_PATTERN.findall(text.lower()) if t in keep or t not in _STOPWORDS]
+
+
+def document_fingerprint(question, answer):
+    """Sidik jari pasangan Q/A; dipakai untuk membandingkan dataset dengan build sebelumnya."""
+    return hashlib.blake2b(
+        f"{question}{_FIELD_SEPARATOR}{answer}".encode("utf-8"), digest_size=FINGERPRINT_SIZE
+    ).digest()
+
+
+def _weighted_terms(question, answer):
+    """Menghitung bobot istilah sebuah dokumen Q/A (pertanyaan diberi bobot lebih)."""
+    weights = {}
+    for term in tokenize(question):
+        weights[term] = weights.get(term, 0.0) + QUESTION_WEIGHT
+    for term in tokenize(answer):
+        weights[term] = weights.get(term, 0.0) + 1.0
+    return weights
+
+
+def _to_little_endian(arr):
+    if sys.byteorder != "little" and arr.typecode != "B":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr
+
+
+def write_knowledge_index(entries, index_path):
+    """
+    Membangun indeks BM25 dari pasangan (pertanyaan, jawaban) dan menyimpannya ke disk.
+    Setiap dokumen disertai sidik jarinya agar build berikutnya bisa menghitung baris yang berubah.
+    File ditulis secara atomik agar proses yang sedang membaca indeks lama tidak rusak.
+    Mengembalikan ringkasan statistik indeks.
+    """
+    doc_lengths = array.array("f")
+    doc_offsets = array.array("I", [0])
+    doc_blob = bytearray()
+    doc_fingerprints = bytearray()
+    postings = {}
+
+    for doc_id, (question, answer) in enumerate(entries):
+        weights = _weighted_terms(question, answer)
+        doc_lengths.append(sum(weights.values()))
+        for term, weight in weights.items():
+            postings.setdefault(term, []).append((doc_id, weight))
+        doc_blob += f"{question}{_FIELD_SEPARATOR}{answer}".encode("utf-8")
+        doc_offsets.append(len(doc_blob))
+        doc_fingerprints += document_fingerprint(question, answer)
+
+    n_docs = len(doc_lengths)
+    if n_docs == 0:
+        raise ValueError("Tidak ada entri untuk diindeks.")
+
+    avgdl = sum(doc_lengths) / n_docs
+    term_offsets = array.array("I", [0])
+    term_blob = bytearray()
+    postings_offsets = array.array("I", [0])
+    postings_docs = array.array("I")
+    postings_weights = array.array("f")
+    idf = array.array("f")
+
+    # Kosakata disimpan terurut agar pencarian istilah cukup dengan binary search di mmap
+    for term in sorted(postings):
+        term_blob += term.encode("utf-8")
+        term_offsets.append(len(term_blob))
+        term_postings = postings[term]
+        for doc_id, weight in term_postings:
+            postings_docs.append(doc_id)
+            postings_weights.append(weight)
+        postings_offsets.append(len(postings_docs))
+        df = len(term_postings)
+        idf.append(math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)))
+
+    sections = {
+        "term_offsets": term_offsets,
+        "term_blob": array.array("B", bytes(term_blob)),
+        "postings_offsets": postings_offsets,
+        "postings_docs": postings_docs,
+        "postings_weights": postings_weights,
+        "idf": idf,
+        "doc_lengths": doc_lengths,
+        "doc_offsets": doc_offsets,
+        "doc_blob": array.array("B", bytes(doc_blob)),
+        "doc_fingerprints": array.array("B", bytes(doc_fingerprints)),
+    }
+
+    layout = {}
+    payload = bytearray()
+    for name, _typecode in _SECTIONS:
+        data = _to_little_endian(sections[name]).tobytes()
+        layout[name] = [len(payload), len(data)]
+        payload += data
+        payload += b"\0" * (-len(payload) % 4)
+
+    header = {
+        "version": INDEX_VERSION,
+        "k1": BM25_K1,
+        "b": BM25_B,
+        "n_docs": n_docs,
+        "n_terms": len(idf),
+        "avgdl": avgdl,
+        "sections": layout,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    header_bytes += b" " * (-(len(INDEX_MAGIC) + 4 + len(header_bytes)) % 4)
+
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        f.write(payload)
+    os.replace(tmp_path, index_path)
+
+    return {"documents": n_docs, "terms": len(idf), "bytes": os.path.getsize(index_path)}
+
+
+class KnowledgeIndex:
+    """Indeks BM25 read-only yang dimuat dengan mmap; aman dibagi antar thread."""
+
+    def __init__(self, index_path):
+        self.path = index_path
+        self._file = open(index_path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"File indeks kosong: {index_path}")
+
+        if self._mmap[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            self.close()
+            raise ValueError(f"Bukan file indeks knowledge base: {index_path}")
+
+        header_start = len(INDEX_MAGIC) + 4
+        (header_len,) = struct.unpack_from("<I", self._mmap, len(INDEX_MAGIC))
+        header = json.loads(bytes(self._mmap[header_start:header_start + header_len]))
+        if header.get("version") != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"Versi indeks tidak didukung: {header.get('version')}")
+
+        self.n_docs = header["n_docs"]
+        self.n_terms = header["n_terms"]
+        self.avgdl = header["avgdl"] or 1.0
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self._fingerprint_ids = None
+
+        base = header_start + header_len
+        view = memoryview(self._mmap)
+        self._views = [view]
+        for name, typecode in _SECTIONS:
+            offset, length = header["sections"][name]
+            section = view[base + offset:base + offset + length]
+            if typecode != "B":
+                section = section.cast(typecode)
+                if sys.byteorder != "little":
+                    # Mesin big-endian: salin dan balik urutan byte sekali saat dimuat
+                    section = array.array(typecode, section.tobytes())
+                    section.byteswap()
+            self._views.append(section)
+            setattr(self, f"_{name}", section)
+
+    def __len__(self):
+        return self.n_docs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Melepas semua view dan menutup mmap."""
+        for view in reversed(getattr(self, "_views", [])):
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        if getattr(self, "_mmap", None) is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+    def _term_id(self, term):
+        """Binary search istilah pada kosakata terurut di dalam mmap."""
+        target = term.encode("utf-8")
+        lo, hi = 0, self.n_terms
+        offsets, blob = self._term_offsets, self._term_blob
+        while lo < hi:
+            mid = (lo + hi) // 2
+            candidate = blob[offsets[mid]:offsets[mid + 1]].tobytes()
+            if candidate < target:
+                lo = mid + 1
+            elif candidate > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def fingerprint(self, doc_id):
+        """Sidik jari dokumen doc_id (lihat document_fingerprint)."""
+        start = doc_id * FINGERPRINT_SIZE
+        return self._doc_fingerprints[start:start + FINGERPRINT_SIZE].tobytes()
+
+    def fingerprints(self):
+        """Sidik jari semua dokumen, berurutan menurut doc_id (satu kali salin dari mmap)."""
+        raw = self._doc_fingerprints.tobytes()
+        return [raw[start:start + FINGERPRINT_SIZE] for start in range(0, len(raw), FINGERPRINT_SIZE)]
+
+    def find_document(self, fingerprint):
+        """doc_id untuk sidik jari tertentu, atau None jika dokumen tidak ada di indeks."""
+        if self._fingerprint_ids is None:
+            self._fingerprint_ids = {value: doc_id for doc_id, value in enumerate(self.fingerprints())}
+        return self._fingerprint_ids.get(fingerprint)
+
+    def iter_entries(self):
+        """Iterator (doc_id, pertanyaan, jawaban) untuk semua dokumen."""
+        for doc_id in range(self.n_docs):
+            question, answer = self.get_entry(doc_id)
+            yield doc_id, question, answer
+
+    def get_entry(self, doc_id):
+        """Mengembalikan pasangan (pertanyaan, jawaban) untuk doc_id."""
+        raw = self._doc_blob[self._doc_offsets[doc_id]:self._doc_offsets[doc_id + 1]].tobytes()
+        question, answer = raw.decode("utf-8").split(_FIELD_SEPARATOR, 1)
+        return question, answer
+
+    def search(self, query, top_k=5):
+        """
+        Mencari top-k pasangan Q/A yang paling relevan untuk query.
+        Mengembalikan daftar dict berisi doc_id, score, question, dan answer.
+        """
+        scores = {}
+        k1, b, avgdl = self.k1, self.b, self.avgdl
+        for term in set(tokenize(query)):
+            term_id = self._term_id(term)
+            if term_id is None:
+                continue
+            idf = self._idf[term_id]
+            start, end = self._postings_offsets[term_id], self._postings_offsets[term_id + 1]
+            docs = self._postings_docs[start:end]
+            weights = self._postings_weights[start:end]
+            for doc_id, tf in zip(docs, weights):
+                norm = k1 * (1.0 - b + b * self._doc_lengths[doc_id] / avgdl)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1.0) / (tf + norm)
+
+        results = []
+        for doc_id, score in heapq.nlargest(top_k, scores.items(), key=lambda item: item[1]):
+            question, answer = self.get_entry(doc_id)
+            results.append({"doc_id": doc_id, "score": score, "question": question, "answer": answer})
+        return results
+
+
+def format_knowledge_context(results):
+    """Menyusun blok konteks BASIS PENGETAHUAN dari hasil pencarian."""
+    lines = ["--- BASIS PENGETAHUAN RELEVAN ---", ""]
+    for result in results:
+        lines.append(f"P: {result['question']}")
+        lines.append(f"J: {result['answer']}")
+        lines.append("")
+    return "\n".join(lines)
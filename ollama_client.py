@@ -0,0 +1,229 @@
+import http.client
+import json
+import os
+import queue
+import socket
+import threading
+from urllib.parse import urlsplit
+
+DEFAULT_OLLAMA_HOST = "http://127.0.0.1:11434"
+DEFAULT_TIMEOUT = 120
+DEFAULT_POOL_SIZE = 4
+
+# Error koneksi yang menandakan koneksi keep-alive di pool sudah ditutup oleh server
+_STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError)
+
+
+class OllamaError(Exception):
+    """Kesalahan saat berkomunikasi dengan API Ollama."""
+
+    def __init__(self, message, status=None, timed_out=False):
+        super().__init__(message)
+        self.status = status
+        self.timed_out = timed_out
+
+
+def resolve_ollama_host(host=None):
+    """
+    Menormalisasi alamat server dari argumen atau variabel OLLAMA_HOST
+    (mis. '0.0.0.0:11434' menjadi 'http://127.0.0.1:11434').
+    """
+    host = host or os.environ.get("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST
+    if "://" not in host:
+        host = f"http://{host}"
+    parts = urlsplit(host)
+    hostname = parts.hostname or "127.0.0.1"
+    if hostname == "0.0.0.0":
+        hostname = "127.0.0.1"
+    port = parts.port or (443 if parts.scheme == "https" else 11434)
+    return f"{parts.scheme}://{hostname}:{port}"
+
+
+def model_name_matches(name, available_names):
+    """Mencocokkan nama model dengan daftar dari /api/tags (tag ':latest' boleh dihilangkan)."""
+    candidates = {name, f"{name}:latest"} if ":" not in name else {name}
+    return any(available in candidates for available in available_names)
+
+
+class OllamaClient:
+    """
+    Klien HTTP untuk REST API Ollama dengan pool koneksi keep-alive.
+    Aman dipakai dari beberapa thread; setiap request meminjam satu koneksi dari pool.
+    `on_request(method, path)` opsional dipanggil untuk setiap request yang terkirim (mis. untuk tracing).
+    """
+
+    def __init__(self, host=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE, on_request=None):
+        self.base_url = resolve_ollama_host(host)
+        parts = urlsplit(self.base_url)
+        self._scheme = parts.scheme
+        self._host = parts.hostname
+        self._port = parts.port
+        self.timeout = timeout
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.on_request = on_request
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Manajemen koneksi ---
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self._scheme == "https" else http.client.HTTPConnection
+        return connection_class(self._host, self._port, timeout=self.timeout)
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait(), True
+        except queue.Empty:
+            return self._new_connection(), False
+
+    def _release(self, connection):
+        try:
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self):
+        """Menutup semua koneksi di pool."""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _open(self, method, path, payload, timeout):
+        """Mengirim request dan mengembalikan (koneksi, response); koneksi basi dari pool dicoba ulang sekali."""
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        while True:
+            connection, reused = self._acquire()
+            connection.timeout = timeout or self.timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(connection.timeout)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+            except _STALE_CONNECTION_ERRORS:
+                connection.close()
+                if reused:
+                    continue
+                raise OllamaError(f"Koneksi ke {self.base_url} terputus.")
+            except OSError as e:
+                connection.close()
+                raise OllamaError(
+                    f"Tidak dapat terhubung ke {self.base_url}: {e}", timed_out=isinstance(e, socket.timeout)
+                ) from e
+            with self._lock:
+                self.request_count += 1
+            if self.on_request is not None:
+                self.on_request(method, path)
+            if response.status >= 400:
+                raw = response.read()
+                self._release(connection)
+                try:
+                    message = json.loads(raw).get("error", raw.decode("utf-8", "replace"))
+                except (ValueError, AttributeError):
+                    message = raw.decode("utf-8", "replace")
+                raise OllamaError(f"{method} {path} gagal ({response.status}): {message}", status=response.status)
+            return connection, response
+
+    def _request(self, method, path, payload=None, timeout=None):
+        connection, response = self._open(method, path, payload, timeout)
+        try:
+            raw = response.read()
+        except OSError as e:
+            connection.close()
+            raise OllamaError(f"Gagal membaca respons {path}: {e}", timed_out=isinstance(e, socket.timeout)) from e
+        self._release(connection)
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError as e:
+            raise OllamaError(f"Respons {path} bukan JSON yang valid: {e}", status=response.status) from e
+
+    def _stream(self, method, path, payload=None, timeout=None):
+        """
+        Generator atas objek JSON per baris (NDJSON) dari respons streaming.
+        Koneksi dikembalikan ke pool hanya jika respons dibaca sampai habis.
+        """
+        connection, response = self._open(method, path, payload, timeout)
+        finished = False
+        try:
+            for line in iter(response.readline, b""):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    chunk = json.loads(line)
+                except ValueError as e:
+                    raise OllamaError(f"Stream {path} berisi baris yang bukan JSON: {line[:80]!r}") from e
+                if "error" in chunk:
+                    raise OllamaError(f"{path}: {chunk['error']}")
+                yield chunk
+            # readline() tidak menutup respons ber-Content-Length yang sudah habis; read() menutupnya
+            # sehingga koneksi siap dipakai ulang
+            response.read()
+            finished = True
+        except OSError as e:
+            raise OllamaError(f"Stream {path} terputus: {e}", timed_out=isinstance(e, socket.timeout)) from e
+        finally:
+            if finished:
+                self._release(connection)
+            else:
+                connection.close()
+
+    # --- Endpoint API ---
+
+    def tags(self, timeout=None):
+        """GET /api/tags: daftar model lokal."""
+        return self._request("GET", "/api/tags", timeout=timeout).get("models", [])
+
+    def list_model_names(self, timeout=None):
+        """Nama semua model lokal, mis. ['llama3.2:latest', ...]."""
+        return [model.get("name") or model.get("model") for model in self.tags(timeout=timeout)]
+
+    def ps(self, timeout=None):
+        """GET /api/ps: model yang sedang dimuat beserta pemakaian memorinya (size, size_vram)."""
+        return self._request("GET", "/api/ps", timeout=timeout).get("models", [])
+
+    def generate(self, model, prompt, system=None, options=None, stream=True, keep_alive=None,
+                 context=None, timeout=None, **extra):
+        """
+        POST /api/generate. Dengan stream=True mengembalikan iterator chunk;
+        chunk terakhir (done=True) berisi metrik waktu dari server.
+        """
+        payload = {"model": model, "prompt": prompt, "stream": stream, **extra}
+        if system is not None:
+            payload["system"] = system
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        if context is not None:
+            payload["context"] = context
+        if stream:
+            return self._stream("POST", "/api/generate", payload, timeout)
+        return self._request("POST", "/api/generate", payload, timeout)
+
+    def chat(self, model, messages, options=None, stream=True, keep_alive=None, timeout=None, **extra):
+        """POST /api/chat dengan riwayat pesan [{'role': ..., 'content': ...}]."""
+        payload = {"model": model, "messages": messages, "stream": stream, **extra}
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        if stream:
+            return self._stream("POST", "/api/chat", payload, timeout)
+        return self._request("POST", "/api/chat", payload, timeout)
+
+    def pull(self, model, stream=True, timeout=None):
+        """POST /api/pull untuk mengunduh model dari registry."""
+        payload = {"name": model, "model": model, "stream": stream}
+        if stream:
+            return self._stream("POST", "/api/pull", payload, timeout)
+        return self._request("POST", "/api/pull", payload, timeout)
+
@@ -0,0 +1,176 @@
+import contextvars
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+METRIC_PREFIX = "umm_pipeline_stage"
+
+# Counter standar yang selalu diekspor (nilai 0 jika tidak pernah ditambah)
+STANDARD_COUNTERS = ("bytes", "rows", "subprocess_calls", "api_calls")
+
+_current_span = contextvars.ContextVar("pipeline_current_span", default=None)
+
+
+class Span:
+    """Satu tahap pipeline: waktu mulai, durasi, status, atribut, dan counter."""
+
+    def __init__(self, span_id, name, parent, attributes):
+        self.span_id = span_id
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes)
+        self.counters = dict.fromkeys(STANDARD_COUNTERS, 0)
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        """Menetapkan atribut bebas (mis. nama model) atau nilai counter standar."""
+        for key, value in attributes.items():
+            if key in self.counters:
+                self.counters[key] = value
+            else:
+                self.attributes[key] = value
+
+    def to_dict(self, trace_id):
+        return {
+            "trace_id": trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration": self.duration,
+            "status": self.status,
+            "error": self.error,
+            **self.counters,
+            "attributes": self.attributes,
+        }
+
+
+class PipelineTracer:
+    """
+    Pelacak span per tahap pipeline. Span bersarang mengikuti konteks eksekusi (contextvars);
+    gunakan bind() untuk meneruskan span aktif ke thread lain. Counter yang ditambah lewat
+    count() ikut dijumlahkan ke semua span induk, sehingga tahap luar mencakup tahap di dalamnya.
+    """
+
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.spans = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Span yang sedang aktif pada konteks ini, atau None."""
+        return _current_span.get()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Context manager yang mencatat satu span; exception menandai span sebagai gagal."""
+        span = Span(next(self._ids), name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = str(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._start
+            _current_span.reset(token)
+            with self._lock:
+                self.spans.append(span)
+
+    def traced(self, name):
+        """Dekorator: setiap pemanggilan fungsi dicatat sebagai span `name`."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, function):
+        """Membungkus fungsi agar berjalan di bawah span aktif saat ini, juga bila dijalankan di thread lain."""
+        context = contextvars.copy_context()
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return context.copy().run(function, *args, **kwargs)
+        return wrapper
+
+    def count(self, counter, amount=1):
+        """Menambah counter pada span aktif beserta semua induknya; diabaikan jika tidak ada span aktif."""
+        span = _current_span.get()
+        with self._lock:
+            while span is not None:
+                span.counters[counter] = span.counters.get(counter, 0) + amount
+                span = span.parent
+
+    def summarize(self):
+        """Agregasi per nama tahap: jumlah span, total durasi, error, dan total counter."""
+        summary = {}
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.span_id)
+        for span in spans:
+            stage = summary.setdefault(span.name, {"count": 0, "duration": 0.0, "errors": 0,
+                                                   **dict.fromkeys(STANDARD_COUNTERS, 0)})
+            stage["count"] += 1
+            stage["duration"] += span.duration or 0.0
+            stage["errors"] += span.status != "ok"
+            for counter, value in span.counters.items():
+                stage[counter] = stage.get(counter, 0) + value
+        return summary
+
+    def export_jsonl(self, path):
+        """Menambahkan semua span (satu objek JSON per baris) ke file JSONL."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.span_id)
+        with open(path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(self.trace_id), ensure_ascii=False, default=str) + "\n")
+        return len(spans)
+
+    def export_prometheus(self, path):
+        """
+        Menulis ringkasan per tahap dalam format teks Prometheus (cocok untuk textfile collector
+        node_exporter). File ditulis secara atomik agar collector tidak membaca file setengah jadi.
+        """
+        summary = self.summarize()
+        metrics = [
+            ("duration_seconds", "Total durasi tahap pipeline dalam detik.", "duration"),
+            ("runs", "Jumlah span untuk tahap pipeline.", "count"),
+            ("errors", "Jumlah span tahap pipeline yang gagal.", "errors"),
+        ] + [(counter, f"Total {counter} yang diproses tahap pipeline.", counter) for counter in STANDARD_COUNTERS]
+
+        lines = []
+        for suffix, help_text, key in metrics:
+            name = f"{METRIC_PREFIX}_{suffix}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for stage, stats in summary.items():
+                lines.append(f'{name}{{stage="{_escape_label(stage)}"}} {stats[key]:g}')
+        # trace_id hanya di metrik info agar tidak membuat deret waktu baru setiap run
+        lines.append(f"# HELP {METRIC_PREFIX}_trace_info Trace yang menghasilkan metrik ini.")
+        lines.append(f"# TYPE {METRIC_PREFIX}_trace_info gauge")
+        lines.append(f'{METRIC_PREFIX}_trace_info{{trace_id="{_escape_label(self.trace_id)}"}} 1')
+        lines.append(f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds Waktu ekspor trace terakhir (epoch).")
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.0f}")
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from knowledge_index import normalize_text, tokenize
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_TTL_SECONDS = 24 * 3600
+DATASET_MATCH_THRESHOLD = 0.85  # Kemiripan minimum agar jawaban diambil langsung dari dataset
+
+# Hasil lookup: jawaban dan asalnya ('exact', 'near', atau 'dataset')
+CacheHit = namedtuple("CacheHit", ["answer", "kind", "saved_seconds"])
+
+
+# Kata tanya dan negasi menentukan maksud pertanyaan ("Siapa pendirinya?" vs "Kapan didirikan?"),
+# jadi tetap dihitung walaupun termasuk stopword retrieval
+QUESTION_MEANING_WORDS = frozenset("""
+what which who whom whose how why when where not no never nor cannot
+apa apakah siapa bagaimana kapan mengapa kenapa dimana mana berapa tidak bukan belum jangan tanpa
+""".split())
+_CONTRACTION_PATTERN = re.compile(r"n['’]t\b", re.IGNORECASE)
+
+
+def question_terms(text):
+    """Token pertanyaan tanpa stopword, kecuali kata tanya dan negasi; "doesn't" dibaca sebagai "does not"."""
+    return tokenize(_CONTRACTION_PATTERN.sub(" not", text), keep=QUESTION_MEANING_WORDS)
+
+
+def question_signature(question):
+    """Kunci near-exact: token unik terurut (termasuk kata tanya), kebal terhadap urutan kata dan tanda baca."""
+    return " ".join(sorted(set(question_terms(question))))
+
+
+def token_similarity(text_a, text_b):
+    """Kemiripan Jaccard antar himpunan token pertanyaan."""
+    tokens_a, tokens_b = set(question_terms(text_a)), set(question_terms(text_b))
+    if not tokens_a or not tokens_b:
+        return 1.0 if normalize_text(text_a) == normalize_text(text_b) else 0.0
+    return len(tokens_a & tokens_b) / len(tokens_a | tokens_b)
+
+
+class ResponseCache:
+    """
+    Cache jawaban di depan model dengan eviksi LRU dan TTL.
+    Urutan lookup: pertanyaan identik (ternormalisasi), near-exact (signature token),
+    lalu opsional jawaban langsung dari dataset bila kemiripannya cukup tinggi.
+    Seluruh isi cache terikat pada dataset_hash dan dibuang otomatis ketika dataset berubah.
+    """
+
+    def __init__(self, dataset_hash, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS,
+                 knowledge_index=None, dataset_threshold=DATASET_MATCH_THRESHOLD, cache_path=None):
+        self.dataset_hash = dataset_hash
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.knowledge_index = knowledge_index
+        self.dataset_threshold = dataset_threshold
+        self.cache_path = cache_path
+        self._entries = OrderedDict()  # kunci ternormalisasi -> dict entri
+        self._signatures = {}          # signature -> kunci ternormalisasi
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "near_hits": 0, "dataset_hits": 0, "misses": 0,
+                      "evictions": 0, "expired": 0, "latency_saved": 0.0, "generation_time": 0.0}
+        if cache_path:
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _average_generation_time(self):
+        misses = self.stats["misses"]
+        return self.stats["generation_time"] / misses if misses else 0.0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry and self._signatures.get(entry["signature"]) == key:
+            del self._signatures[entry["signature"]]
+
+    def _get_live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl and now - entry["stored_at"] > self.ttl:
+            self._remove(key)
+            self.stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def lookup(self, question):
+        """Mengembalikan CacheHit atau None (miss)."""
+        key = normalize_text(question)
+        now = time.time()
+        with self._lock:
+            entry = self._get_live(key, now)
+            kind = "exact"
+            if entry is None:
+                signature_key = self._signatures.get(question_signature(question))
+                entry = self._get_live(signature_key, now) if signature_key else None
+                kind = "near"
+            if entry is not None:
+                self.stats[f"{kind}_hits"] += 1
+                self.stats["latency_saved"] += entry["generation_time"]
+                return CacheHit(entry["answer"], kind, entry["generation_time"])
+
+        if self.knowledge_index is not None:
+            results = self.knowledge_index.search(question, top_k=1)
+            if results and token_similarity(question, results[0]["question"]) >= self.dataset_threshold:
+                with self._lock:
+                    saved = self._average_generation_time()
+                    self.stats["dataset_hits"] += 1
+                    self.stats["latency_saved"] += saved
+                return CacheHit(results[0]["answer"], "dataset", saved)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, question, answer, generation_time, sources=None):
+        """
+        Menyimpan jawaban hasil generasi beserta waktu yang dibutuhkan untuk membuatnya.
+        `sources` adalah sidik jari (hex) dokumen knowledge base yang disisipkan ke prompt,
+        sehingga jawaban bisa dibuang ketika salah satu dokumen itu berubah.
+        """
+        key = normalize_text(question)
+        signature = question_signature(question)
+        with self._lock:
+            self.stats["generation_time"] += generation_time
+            self._remove(key)
+            self._entries[key] = {"answer": answer, "signature": signature, "generation_time": generation_time,
+                                  "stored_at": time.time(), "sources": None if sources is None else list(sources)}
+            if signature:
+                self._signatures[signature] = key
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.stats["evictions"] += 1
+
+    def invalidate(self, dataset_hash=None, questions=None, sources=None):
+        """
+        Membuang entri cache. Tanpa `questions` dan `sources` seluruh cache dibuang. Dengan `questions`
+        entri untuk pertanyaan tersebut dibuang; dengan `sources` (sidik jari dokumen yang diubah atau
+        dihapus) entri yang dibangun dari dokumen itu dibuang, begitu pula entri tanpa catatan sumber.
+        dataset_hash baru dicatat jika diberikan. Mengembalikan jumlah entri yang dibuang.
+        """
+        with self._lock:
+            if questions is None and sources is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._signatures.clear()
+            else:
+                stale = set()
+                for question in questions or ():
+                    stale.add(normalize_text(question))
+                    stale.add(self._signatures.get(question_signature(question)))
+                if sources is not None:
+                    sources = set(sources)
+                    stale.update(key for key, entry in self._entries.items()
+                                 if entry.get("sources") is None or sources.intersection(entry["sources"]))
+                stale &= self._entries.keys()
+                for key in stale:
+                    self._remove(key)
+                removed = len(stale)
+            if dataset_hash is not None:
+                self.dataset_hash = dataset_hash
+        return removed
+
+    def metrics(self):
+        """Metrik cache: jumlah hit per jenis, hit rate, dan estimasi latensi yang dihemat."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["near_hits"] + stats["dataset_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+    def load(self):
+        """Memuat cache dari disk; diabaikan jika dataset_hash berbeda atau file rusak."""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False
+        if data.get("dataset_hash") != self.dataset_hash:
+            return False
+        now = time.time()
+        with self._lock:
+            for key, entry in data.get("entries", []):
+                if self.ttl and now - entry["stored_at"] > self.ttl:
+                    continue
+                # Signature dihitung ulang agar file cache lama mengikuti aturan signature terbaru
+                entry["signature"] = question_signature(key)
+                self._entries[key] = entry
+                if entry["signature"]:
+                    self._signatures[entry["signature"]] = key
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return True
+
+    def save(self):
+        """Menyimpan cache ke disk secara atomik (urutan LRU dipertahankan)."""
+        if not self.cache_path:
+            return
+        with self._lock:
+            data = {"dataset_hash": self.dataset_hash, "entries": list(self._entries.items())}
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
@@ -0,0 +1,48 @@
+import sys
+
+import pytest
+
+from SampriTrainWalawe import parse_arguments
+
+
+def _parse(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["SampriTrainWalawe.py", *argv])
+    return parse_arguments()
+
+
+@pytest.mark.parametrize("argv", [
+    ("--load-test", "--rate", "0"),
+    ("--load-test", "--rate", "-2"),
+    ("--load-test", "--concurrency", "0"),
+])
+def test_rejects_invalid_load_test_settings(monkeypatch, capsys, argv):
+    with pytest.raises(SystemExit) as excinfo:
+        _parse(monkeypatch, *argv)
+    assert excinfo.value.code == 2
+    assert argv[1] in capsys.readouterr().err
+
+
+def test_accepts_valid_load_test_settings(monkeypatch):
+    args = _parse(monkeypatch, "--load-test", "--rate", "0.5", "--concurrency", "1")
+    assert (args.rate, args.concurrency) == (0.5, 1)
+
+
+@pytest.mark.parametrize("argv, message", [
+    (("--matrix-quantizations", ""), "tidak boleh kosong"),
+    (("--matrix-quantizations", " , "), "tidak boleh kosong"),
+    (("--matrix-quantizations", "q4_k_m,q3_x"), "q3_x"),
+    (("--matrix-quantizations", "q4_k_m", "--matrix-ctx", ","), "minimal satu ukuran konteks"),
+    (("--matrix-quantizations", "q4_k_m", "--matrix-ctx", "2048,besar"), "bilangan bulat"),
+    (("--matrix-ctx", "2048"), "bersama --matrix-quantizations"),
+    (("--matrix-quantizations", "q4_k_m", "--matrix-jobs", "0"), "--matrix-jobs"),
+])
+def test_rejects_empty_or_invalid_matrix_axes(monkeypatch, capsys, argv, message):
+    with pytest.raises(SystemExit):
+        _parse(monkeypatch, *argv)
+    assert message in capsys.readouterr().err
+
+
+def test_parses_matrix_axes(monkeypatch):
+    args = _parse(monkeypatch, "--matrix-quantizations", "Q4_K_M, q8_0,", "--matrix-ctx", "2048, 4096")
+    assert args.matrix_quantizations == ["q4_k_m", "q8_0"]
+    assert args.matrix_ctx == [2048, 4096]
@@ -0,0 +1,96 @@
+import os
+import re
+
+from chat_session import SessionManager
+from SampriTrainWalawe import LLAMA3_CHAT_TEMPLATE
+
+SYSTEM = "Anda adalah UMM Assistant Demo."
+
+
+def render_llama3_chat(system, messages):
+    """Prompt yang dirender LLAMA3_CHAT_TEMPLATE untuk /api/chat (cabang .Messages)."""
+    rendered = f"<|start_header_id|>system<|end_header_id|>\n\n{system}<|eot_id|>" if system else ""
+    for message in messages:
+        rendered += f"<|start_header_id|>{message['role']}<|end_header_id|>\n\n{message['content']}<|eot_id|>"
+    return rendered + "<|start_header_id|>assistant<|end_header_id|>\n\n"
+
+
+class PrefixCacheClient:
+    """
+    Klien /api/chat tiruan: merender pesan seperti template Modelfile, dan seperti server Ollama,
+    token prefix yang sama dengan percakapan sebelumnya (prompt + jawaban) tidak dievaluasi ulang.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.rendered = []
+        self._cached = ""
+
+    def chat(self, model, messages, **kwargs):
+        self.calls.append(messages)
+        rendered = render_llama3_chat(SYSTEM, messages)
+        self.rendered.append(rendered)
+        shared = len(os.path.commonprefix([rendered, self._cached]))
+        answer = f"jawaban {len(self.calls)}"
+        self._cached = rendered + answer + "<|eot_id|>"  # {{ .Response }}<|eot_id|>
+        return {"message": {"role": "assistant", "content": answer}, "prompt_eval_count": len(rendered) - shared,
+                "prompt_eval_duration": (len(rendered) - shared) * 1000, "eval_count": 2}
+
+
+def test_template_renders_full_message_history():
+    # Penanda trim "{{-" membuang spasi/baris baru di depannya, seperti text/template Go
+    template = re.sub(r"\s*\{\{-\s*", "{{ ", LLAMA3_CHAT_TEMPLATE)
+    messages_branch = template[:template.index("{{ else }}")]
+    assert messages_branch == (
+        "{{ if .Messages }}{{ if .System }}<|start_header_id|>system<|end_header_id|>\n\n{{ .System }}<|eot_id|>"
+        "{{ end }}{{ range .Messages }}<|start_header_id|>{{ .Role }}<|end_header_id|>\n\n{{ .Content }}<|eot_id|>"
+        "{{ end }}<|start_header_id|>assistant<|end_header_id|>\n\n"
+    )
+    assert template.endswith("{{ .Response }}{{ if .Response }}<|eot_id|>{{ end }}")
+
+
+def _manager(client, **kwargs):
+    return SessionManager(client, "model", max_context_tokens=kwargs.pop("max_context_tokens", 4096),
+                          prompt_builder=lambda question: f"[konteks] {question}",
+                          estimate_tokens=len, response_reserve=0, **kwargs)
+
+
+def test_session_resends_history_verbatim_without_system_message():
+    client = PrefixCacheClient()
+    manager = _manager(client)
+    first = manager.ask("s", "satu")
+    second = manager.ask("s", "dua")
+    assert client.calls[1][:2] == client.calls[0] + [{"role": "assistant", "content": "jawaban 1"}]
+    assert all(message["role"] != "system" for message in client.calls[1])
+    assert first["reset"] and not second["reset"]
+    # Jawaban sebelumnya ikut dirender, dan SYSTEM hanya sekali di awal
+    assert "jawaban 1<|eot_id|>" in client.rendered[1]
+    assert client.rendered[1].count("system<|end_header_id|>") == 1
+    # Hanya pesan baru yang dievaluasi; prefix (termasuk SYSTEM dan jawaban lama) diambil dari cache
+    assert second["prompt_eval_count"] == len(
+        "<|start_header_id|>user<|end_header_id|>\n\n[konteks] dua<|eot_id|>"
+        "<|start_header_id|>assistant<|end_header_id|>\n\n"
+    )
+
+
+def test_session_evaluates_less_than_stateless():
+    questions = ["satu", "dua", "tiga", "empat"]
+    totals = {}
+    for reuse_context in (False, True):
+        client = PrefixCacheClient()
+        manager = _manager(client, reuse_context=reuse_context)
+        results = [manager.ask("s", question) for question in questions]
+        totals[reuse_context] = sum(result["prompt_eval_count"] for result in results[1:])
+    assert totals[True] < totals[False]
+
+
+def test_full_history_is_compacted():
+    client = PrefixCacheClient()
+    manager = _manager(client, max_context_tokens=140)
+    results = [manager.ask("s", f"pertanyaan {index}") for index in range(6)]
+    compacted = [index for index, result in enumerate(results) if index and result["reset"]]
+    assert compacted and manager.stats()["resets"] == len(compacted)
+    for call in (client.calls[index] for index in compacted):
+        # Riwayat yang dipadatkan memakai pertanyaan asli tanpa konteks retrieval lamanya, dan muat di anggaran
+        assert all(not m["content"].startswith("[konteks]") for m in call[:-1] if m["role"] == "user")
+        assert sum(len(m["content"]) + 8 for m in call) <= 140
@@ -0,0 +1,40 @@
+import pytest
+
+from command_output import TransferStats, parse_progress_line
+
+
+def test_parses_running_layer():
+    event = parse_progress_line("pulling 6a0746a1ec1a... 45% ▕███     ▏ 900 MB/2.0 GB  25 MB/s  44s")
+    assert (event.stage, event.digest, event.percent) == ("pulling", "6a0746a1ec1a", 45)
+    assert (event.completed, event.total, event.rate, event.eta) == (900 * 1000**2, 2 * 1000**3, 25 * 1000**2, 44)
+
+
+@pytest.mark.parametrize("line, size", [
+    ("pulling dde5aa3fc5ff... 100% ▕████████████████▏ 2.0 GB", 2 * 1000**3),
+    ("pulling 966de95ca8a6... 100% ▕██▏ 1.4 KB", 1400),
+    ("\x1b[?25lpulling 966de95ca8a6... 100% ▕██▏  120 B \x1b[K", 120),
+])
+def test_parses_finished_layer_with_single_size(line, size):
+    event = parse_progress_line(line)
+    assert event.percent == 100
+    assert event.completed == event.total == size
+    assert event.rate is None and event.eta is None
+
+
+@pytest.mark.parametrize("line", ["pulling manifest", "writing manifest", "success", "verifying sha256 digest"])
+def test_non_progress_lines(line):
+    assert parse_progress_line(line) is None
+
+
+def test_transfer_stats_counts_only_bytes_moved():
+    stats = TransferStats()
+    stats.update(None)
+    stats.update(parse_progress_line("copying file sha256:abcdef123456 100%"))
+    stats.update(parse_progress_line("pulling aaaaaaaaaaaa... 10% ▕█    ▏ 100 MB/1.0 GB  50 MB/s  18s"))
+    stats.update(parse_progress_line("pulling aaaaaaaaaaaa... 100% ▕█████▏ 1.0 GB"))
+    stats.update(parse_progress_line("pulling bbbbbbbbbbbb... 100% ▕█████▏ 1.4 KB"))  # Sudah ada di disk
+    summary = stats.summary()
+    assert summary["layers"] == 2
+    assert summary["transferred_bytes"] == 900 * 1000**2
+    assert summary["total_bytes"] == 1000**3 + 1400
+    assert summary["peak_rate"] == 50 * 1000**2
@@ -0,0 +1,214 @@
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from gateway import Gateway, GatewayBusy, create_server, stub_backend
+from response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "Siapa kepala sekolah?"}]
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def make_gateway():
+    gateways = []
+
+    def make(delay=0.01, words=4, start=True, **kwargs):
+        gateway = Gateway(stub_backend(delay=delay, words=words), "stub-model", **kwargs)
+        gateways.append(gateway)
+        return gateway.start() if start else gateway
+
+    yield make
+    for gateway in gateways:
+        gateway.stop()
+
+
+@pytest.fixture
+def http_gateway(make_gateway):
+    """Gateway di port acak; mengembalikan fungsi request(method, path, body) -> (status, headers, teks)."""
+    gateway = make_gateway(request_timeout=5)
+    server = create_server(gateway, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    port = server.server_address[1]
+
+    def request(method, path, body=None, headers=None):
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+        try:
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            connection.request(method, path, body=payload, headers={"Content-Type": "application/json", **(headers or {})})
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read().decode("utf-8")
+        finally:
+            connection.close()
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_sheds_load_with_429_when_queue_is_full(make_gateway):
+    gateway = make_gateway(start=False, max_queue=1)
+    gateway.submit("a", MESSAGES)
+    with pytest.raises(GatewayBusy):
+        gateway.submit("b", [{"role": "user", "content": "pertanyaan lain"}])
+    assert gateway.counters["requests"][429] == 1
+    assert gateway.scheduler.depth == 1
+
+
+def test_per_client_pending_limit(make_gateway):
+    gateway = make_gateway(start=False, max_pending_per_client=2, coalesce=False)
+    gateway.submit("a", MESSAGES)
+    gateway.submit("a", MESSAGES)
+    with pytest.raises(GatewayBusy):
+        gateway.submit("a", MESSAGES)
+    gateway.submit("b", MESSAGES)  # Klien lain tidak terpengaruh
+
+
+def test_in_flight_cap_applies_to_identified_clients_only(make_gateway):
+    gateway = make_gateway(delay=0.1, workers=3, max_in_flight_per_client=1, coalesce=False)
+    first, _ = gateway.submit("a", MESSAGES)
+    second, _ = gateway.submit("a", MESSAGES)
+    other, _ = gateway.submit("b", MESSAGES)
+    assert _wait_until(lambda: first.started_at and other.started_at)
+    assert second.started_at is None  # Menunggu sampai permintaan pertama klien "a" selesai
+    assert gateway.wait(second) == 200
+    assert second.started_at >= first.finished_at
+
+    # Satu alamat IP bisa mewakili banyak pengguna di balik NAT: tidak diserialkan
+    shared = [gateway.submit("ip:10.0.0.1", MESSAGES, identified=False)[0] for _ in range(2)]
+    assert _wait_until(lambda: all(job.started_at for job in shared))
+    assert abs(shared[1].started_at - shared[0].started_at) < 0.2  # Berjalan bersamaan, bukan berurutan
+
+
+def test_times_out_with_504(make_gateway):
+    gateway = make_gateway(delay=0.2, words=12, request_timeout=5)
+    job, _ = gateway.submit("a", MESSAGES, timeout=0.3)
+    assert gateway.wait(job) == 504
+    assert _wait_until(lambda: job.done.is_set())
+    assert gateway.counters["requests"][504] == 1
+    assert len(job.content.split()) < 12  # Generasi dihentikan, bukan diselesaikan
+
+
+def test_coalesces_identical_requests(make_gateway):
+    gateway = make_gateway(delay=0.05)
+    first, coalesced_first = gateway.submit("a", MESSAGES)
+    second, coalesced_second = gateway.submit("b", MESSAGES)
+    assert second is first and (coalesced_first, coalesced_second) == (False, True)
+    assert gateway.wait(first) == 200 and gateway.wait(second) == 200
+    assert gateway.counters["coalesced"] == 1
+    assert gateway.counters["requests"][200] == 2
+    streamed, coalesced = gateway.submit("c", MESSAGES, stream=True)
+    assert streamed is not first and not coalesced  # Stream tidak pernah digabung
+
+
+def test_streams_server_sent_events(http_gateway):
+    status, headers, text = http_gateway(
+        "POST", "/v1/chat/completions", {"messages": MESSAGES, "stream": True}, {"X-Client-Id": "tester"}
+    )
+    assert status == 200 and headers["Content-Type"] == "text/event-stream"
+    events = [line[len("data: "):] for line in text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    chunks = [json.loads(event) for event in events[:-1]]
+    assert chunks[0]["choices"][0]["delta"] == {"role": "assistant"}
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+    content = "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks)
+    assert content == "Jawaban contoh untuk: Siapa "
+
+
+def test_completion_response(http_gateway):
+    status, _, text = http_gateway("POST", "/v1/chat/completions", {"messages": MESSAGES, "timeout": 2})
+    assert status == 200
+    response = json.loads(text)
+    assert response["choices"][0]["message"]["content"] == "Jawaban contoh untuk: Siapa "
+    assert response["usage"]["completion_tokens"] == 4
+
+
+@pytest.mark.parametrize("timeout", ["abc", -1, 0, True, [5]])
+def test_rejects_invalid_timeout_with_400(http_gateway, timeout):
+    status, _, text = http_gateway("POST", "/v1/chat/completions", {"messages": MESSAGES, "timeout": timeout})
+    assert status == 400
+    assert json.loads(text)["error"]["type"] == "invalid_request_error"
+
+
+def test_response_cache_answers_repeated_questions_without_backend():
+    calls = []
+    backend = stub_backend(delay=0, words=4)
+
+    def counting_backend(model, messages, options):
+        calls.append(messages)
+        yield {"sources": ["ab" * 8]}
+        yield from backend(model, messages, options)
+
+    gateway = Gateway(counting_backend, "stub-model", response_cache=ResponseCache("hash-a", max_entries=1)).start()
+    try:
+        first, _ = gateway.submit("a", MESSAGES)
+        assert gateway.wait(first) == 200
+        assert _wait_until(lambda: len(gateway.response_cache) == 1)
+        reordered, _ = gateway.submit("b", [{"role": "user", "content": "Kepala sekolah siapa?"}], stream=True)
+        assert reordered.done.is_set() and reordered.content == first.content  # Near-exact, tanpa antre
+        assert reordered.chunks.get_nowait() == first.content and reordered.chunks.get_nowait() is None
+        assert len(calls) == 1
+        # Dokumen sumber yang berubah membuang jawaban yang dibangun darinya
+        assert gateway.response_cache.invalidate(sources=["ab" * 8]) == 1
+
+        # Riwayat percakapan dan opsi sampling membuat jawaban tidak bisa dipakai ulang
+        history = [{"role": "user", "content": "halo"}, {"role": "assistant", "content": "hai"}] + MESSAGES
+        assert gateway.wait(gateway.submit("a", history)[0]) == 200
+        assert gateway.wait(gateway.submit("a", MESSAGES, {"temperature": 1.5})[0]) == 200
+        assert len(calls) == 3
+
+        assert gateway.wait(gateway.submit("a", [{"role": "user", "content": "Kapan sekolah berdiri?"}])[0]) == 200
+        assert gateway.wait(gateway.submit("a", MESSAGES)[0]) == 200  # Miss: entri lama dibuang
+        assert _wait_until(lambda: gateway.response_cache.metrics()["evictions"] == 1)
+        metrics = gateway.metrics_text()
+    finally:
+        gateway.stop()
+    assert 'umm_gateway_cache_hits_total{kind="near"} 1' in metrics
+    assert "umm_gateway_cache_misses_total 3" in metrics
+    assert "umm_gateway_cache_evictions_total 1" in metrics
+    assert gateway.counters["requests"][200] == 6
+
+
+@pytest.mark.parametrize("messages", [
+    [{"role": "user", "content": ["bukan", "string"]}],
+    [{"role": "user", "content": None}],
+    [{"role": 1, "content": "halo"}],
+    ["halo"],
+])
+def test_rejects_non_string_message_content_with_400(http_gateway, messages):
+    status, _, text = http_gateway("POST", "/v1/chat/completions", {"messages": messages})
+    assert status == 400
+    assert json.loads(text)["error"]["type"] == "invalid_request_error"
+
+
+def test_stream_timeout_reports_timeout_not_length(make_gateway):
+    gateway = make_gateway(delay=0.3, words=12, request_timeout=0.5)
+    server = create_server(gateway, "127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        connection.request("POST", "/v1/chat/completions", body=json.dumps({"messages": MESSAGES, "stream": True}),
+                           headers={"Content-Type": "application/json"})
+        text = connection.getresponse().read().decode("utf-8")
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    events = [json.loads(line[len("data: "):]) for line in text.splitlines()
+              if line.startswith("data: ") and line != "data: [DONE]"]
+    assert events[-2]["choices"][0]["finish_reason"] == "timeout"
+    assert events[-1]["error"]["code"] == 504
+    assert gateway.counters["requests"][504] == 1
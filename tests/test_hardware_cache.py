@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from SampriTrainWalawe import load_hardware_cache, save_hardware_cache
+
+GPU_INFO = {"nvidia": True, "amd": False, "metal": False, "has_gpu": True, "vram_total_mb": 8192, "vram_free_mb": 5000}
+
+
+def test_round_trip_keeps_only_static_gpu_facts(tmp_path):
+    cache_path = str(tmp_path / "hardware.json")
+    save_hardware_cache(GPU_INFO, "q5_k_m", 25, cache_path=cache_path)
+    cached = load_hardware_cache(cache_path=cache_path)
+    assert (cached["quantization"], cached["gpu_layers"]) == ("q5_k_m", 25)
+    assert "vram_free_mb" not in cached["gpu_info"] and cached["gpu_info"]["vram_total_mb"] == 8192
+
+
+@pytest.mark.parametrize("content", [
+    "[1, 2, 3]",
+    '"teks"',
+    "null",
+    '{"identity": "x"}',
+    '{"identity": "x", "probed_at": "kemarin", "quantization": "q4_0", "gpu_layers": 15, "gpu_info": {"has_gpu": false}}',
+    "{rusak",
+])
+def test_invalid_cache_is_a_miss(tmp_path, content):
+    cache_path = tmp_path / "hardware.json"
+    cache_path.write_text(content, encoding="utf-8")
+    assert load_hardware_cache(cache_path=str(cache_path)) is None
+
+
+def test_cache_from_other_machine_is_a_miss(tmp_path):
+    cache_path = tmp_path / "hardware.json"
+    save_hardware_cache(GPU_INFO, "q5_k_m", 25, cache_path=str(cache_path))
+    cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    cached["identity"] = "mesin-lain"
+    cache_path.write_text(json.dumps(cached), encoding="utf-8")
+    assert load_hardware_cache(cache_path=str(cache_path)) is None
@@ -0,0 +1,26 @@
+from knowledge_index import KnowledgeIndex, document_fingerprint, write_knowledge_index
+
+ENTRIES = [
+    ("When was Drexel University founded?", "Drexel University was founded in 1891."),
+    ("Who developed this AI?", "Team Azure (5 Kage)."),
+    ("Siapa kepala sekolah?", "Kepala sekolah adalah Bu Ani."),
+]
+
+
+def test_fingerprints_follow_doc_ids(tmp_path):
+    index_path = str(tmp_path / "kb.idx")
+    write_knowledge_index(ENTRIES, index_path)
+    with KnowledgeIndex(index_path) as index:
+        expected = [document_fingerprint(question, answer) for question, answer in ENTRIES]
+        assert index.fingerprints() == expected
+        assert [index.fingerprint(doc_id) for doc_id in range(len(index))] == expected
+        assert index.find_document(expected[2]) == 2
+        assert index.find_document(document_fingerprint("x", "y")) is None
+
+
+def test_search_ranks_matching_document_first(tmp_path):
+    index_path = str(tmp_path / "kb.idx")
+    write_knowledge_index(ENTRIES, index_path)
+    with KnowledgeIndex(index_path) as index:
+        results = index.search("kepala sekolah", top_k=2)
+        assert results[0]["doc_id"] == 2 and results[0]["answer"] == ENTRIES[2][1]
@@ -0,0 +1,25 @@
+from collections import namedtuple
+
+import SampriTrainWalawe
+from knowledge_index import write_knowledge_index
+
+Record = namedtuple("Record", ["question", "answer"])
+DATASET = [Record("Siapa kepala sekolah?", "Bu Ani."), Record("Kapan sekolah berdiri?", "Tahun 1960.")]
+
+
+def test_unexpected_errors_are_recorded_and_workers_keep_running(tmp_path, monkeypatch):
+    index_path = str(tmp_path / "kb.idx")
+    write_knowledge_index(DATASET, index_path)
+    calls = []
+
+    def flaky_answer(client, model_name, question, *args, **kwargs):
+        calls.append(question)
+        if len(calls) % 2:
+            raise KeyError("eval_count")  # Bukan OllamaError, mis. respons server yang tidak lengkap
+        return {"response": "ok", "response_time": 0.001, "ttft": 0.001, "eval_count": 1}
+
+    monkeypatch.setattr(SampriTrainWalawe, "answer_question", flaky_answer)
+    report = SampriTrainWalawe.run_load_test("stub-model", DATASET, index_path, concurrency=2, duration=0.2, seed=1)
+    assert report["requests"] == len(calls) > 4  # Worker closed-loop tidak mati setelah error pertama
+    assert 0 < report["successful"] < report["requests"]
+    assert report["peak_backlog"] <= 2  # in_flight turun lagi untuk permintaan yang gagal
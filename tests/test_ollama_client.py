@@ -0,0 +1,99 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ollama_client import OllamaClient, OllamaError
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Server Ollama tiruan: HTTP/1.1 keep-alive, NDJSON untuk stream, dan error JSON untuk 4xx."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def _send(self, status, body, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send(200, json.dumps({"models": [{"name": "llama3.2:latest"}]}).encode("utf-8"))
+        else:
+            self._send(200, b"<html>bukan json</html>", "text/html")
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.payloads.append(payload)
+        if payload["model"] == "tidak-ada":
+            self._send(404, json.dumps({"error": f"model '{payload['model']}' not found"}).encode("utf-8"))
+        elif payload["model"] == "rusak":
+            self._send(200, b'{"response": "a", "done": false}\n{potongan\n', "application/x-ndjson")
+        elif payload["stream"]:
+            lines = [{"response": word, "done": False} for word in ("Halo ", "dunia")]
+            lines.append({"response": "", "done": True, "eval_count": 2})
+            self._send(200, "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8"), "application/x-ndjson")
+        else:
+            self._send(200, json.dumps({"response": "Halo dunia", "done": True}).encode("utf-8"))
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.payloads = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(stub_server):
+    client = OllamaClient(host=f"127.0.0.1:{stub_server.server_address[1]}", timeout=5, pool_size=2)
+    yield client
+    client.close()
+
+
+def test_streams_ndjson_chunks(client, stub_server):
+    chunks = list(client.generate("llama3.2", "Sapa saya", keep_alive="30m", options={"seed": 1}))
+    assert "".join(chunk["response"] for chunk in chunks) == "Halo dunia"
+    assert chunks[-1]["done"] and chunks[-1]["eval_count"] == 2
+    assert stub_server.payloads[0] == {"model": "llama3.2", "prompt": "Sapa saya", "stream": True,
+                                       "options": {"seed": 1}, "keep_alive": "30m"}
+
+
+def test_reuses_keep_alive_connection(client, stub_server):
+    assert client.list_model_names() == ["llama3.2:latest"]
+    list(client.generate("llama3.2", "satu"))
+    assert client.generate("llama3.2", "dua", stream=False)["response"] == "Halo dunia"
+    assert client.request_count == 3
+    assert stub_server.connections == 1
+
+
+def test_http_error_raises_with_status_and_keeps_connection(client, stub_server):
+    with pytest.raises(OllamaError) as excinfo:
+        client.chat("tidak-ada", [{"role": "user", "content": "halo"}], stream=False)
+    assert excinfo.value.status == 404
+    assert "model 'tidak-ada' not found" in str(excinfo.value)
+    assert client.list_model_names() == ["llama3.2:latest"]
+    assert stub_server.connections == 1  # Body error sudah dibaca, koneksi kembali ke pool
+
+
+def test_invalid_json_is_reported_as_ollama_error(client):
+    with pytest.raises(OllamaError, match="bukan JSON"):
+        client.ps()
+    with pytest.raises(OllamaError, match="bukan JSON"):
+        list(client.generate("rusak", "halo"))
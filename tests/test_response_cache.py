@@ -0,0 +1,69 @@
+import pytest
+
+from knowledge_index import KnowledgeIndex, write_knowledge_index
+from response_cache import ResponseCache, question_signature, token_similarity
+
+
+@pytest.fixture
+def knowledge_index(tmp_path):
+    index_path = str(tmp_path / "kb.idx")
+    write_knowledge_index([
+        ("When was Drexel University founded?", "Drexel University was founded in 1891."),
+        ("Who developed this AI?", "Team Azure (5 Kage)."),
+    ], index_path)
+    index = KnowledgeIndex(index_path)
+    yield index
+    index.close()
+
+
+def test_signature_keeps_question_words():
+    assert question_signature("Who developed this AI?") != question_signature("Why was this AI developed?")
+    assert question_signature("Who founded Drexel University?") != question_signature("When was Drexel University founded?")
+
+
+def test_signature_keeps_negation():
+    assert question_signature("Does the AI need internet?") != question_signature("Doesn't the AI need internet?")
+    assert question_signature("Apakah sekolah buka?") != question_signature("Apakah sekolah tidak buka?")
+
+
+def test_signature_ignores_order_and_punctuation():
+    assert question_signature("Who developed this AI?") == question_signature("this AI, who developed")
+
+
+def test_near_hit_does_not_cross_question_words():
+    cache = ResponseCache("hash")
+    cache.store("Who developed this AI?", "Team Azure (5 Kage)", 1.0)
+    assert cache.lookup("Why was this AI developed?") is None
+    assert cache.lookup("Where was this AI developed?") is None
+    hit = cache.lookup("who developed this AI")
+    assert hit is not None and hit.answer == "Team Azure (5 Kage)"
+
+
+def test_dataset_shortcut_requires_same_question_words(knowledge_index):
+    assert token_similarity("Who founded Drexel University?", "When was Drexel University founded?") < 0.85
+    cache = ResponseCache("hash", knowledge_index=knowledge_index)
+    assert cache.lookup("Who founded Drexel University?") is None
+    hit = cache.lookup("When was Drexel University founded")
+    assert hit is not None and hit.kind == "dataset" and "1891" in hit.answer
+
+
+def test_invalidate_by_source_documents(knowledge_index):
+    drexel, team = (knowledge_index.fingerprint(doc_id).hex() for doc_id in range(2))
+    cache = ResponseCache("hash")
+    cache.store("When was Drexel founded?", "1891", 1.0, sources=[drexel])
+    cache.store("Who made you?", "Team Azure", 1.0, sources=[team])
+    cache.store("Hello there", "Hi!", 1.0, sources=[])
+    cache.store("Legacy entry", "?", 1.0)  # Tanpa catatan sumber: tidak bisa dibuktikan masih valid
+    assert cache.invalidate(dataset_hash="new", sources=[drexel]) == 2
+    assert cache.lookup("When was Drexel founded?") is None
+    assert cache.lookup("Legacy entry") is None
+    assert cache.lookup("Who made you?").answer == "Team Azure"
+    assert cache.lookup("Hello there").answer == "Hi!"
+    assert cache.dataset_hash == "new"
+
+
+def test_invalidate_drops_answers_for_added_questions():
+    cache = ResponseCache("hash")
+    cache.store("Who made you?", "Team Azure", 1.0, sources=[])
+    assert cache.invalidate(questions=["who made you"], sources=[]) == 1
+    assert len(cache) == 0